@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Build, BuildLog
+from .search import filter_logs
 
 @admin.register(Build)
 class BuildAdmin(admin.ModelAdmin):
@@ -12,3 +13,10 @@ class BuildLogAdmin(admin.ModelAdmin):
     list_display = ['id', 'build', 'message', 'log_type', 'timestamp']
     list_filter = ['log_type', 'timestamp']
     search_fields = ['message']
+
+    def get_search_results(self, request, queryset, search_term):
+        # 用全文索引代替 message LIKE '%x%' 全表扫描
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return filter_logs(queryset, search_term), False
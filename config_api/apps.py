@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ConfigApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'config_api'
+
+    def ready(self):
+        # 注册配置变更信号，保存配置后通知各进程刷新配置缓存
+        from . import config_cache  # noqa: F401
@@ -0,0 +1,76 @@
+"""已完成构建的日志归档
+
+把 BuildLog 行按 id 顺序分块压缩成 BuildLogSegment，并删除原始行。
+读取接口通过 pagination.fetch_log_page 透明解压。
+"""
+import json
+import logging
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Build, BuildLog, BuildLogSegment
+from .serializers import BuildLogSerializer
+
+logger = logging.getLogger('config_api')
+
+ARCHIVABLE_STATUSES = ('success', 'failed', 'stopped')
+
+
+def archive_build_logs(build_id, chunk_size=None):
+    """归档一个构建的全部日志行，返回 {'lines', 'raw_bytes', 'compressed_bytes', 'segments'}"""
+    chunk_size = chunk_size or getattr(settings, 'BUILD_LOG_ARCHIVE_CHUNK_SIZE', 1000)
+    level = getattr(settings, 'BUILD_LOG_ARCHIVE_LEVEL', 6)
+    result = {'lines': 0, 'raw_bytes': 0, 'compressed_bytes': 0, 'segments': 0}
+    while True:
+        # 每块一个短事务，避免长时间占用 SQLite 写锁
+        with transaction.atomic():
+            logs = list(BuildLog.objects.filter(build_id=build_id).order_by('id')[:chunk_size])
+            if not logs:
+                break
+            records = BuildLogSerializer(logs, many=True).data
+            raw = json.dumps(records, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            data = zlib.compress(raw, level)
+            BuildLogSegment.objects.create(
+                build_id=build_id,
+                first_log_id=logs[0].id,
+                last_log_id=logs[-1].id,
+                line_count=len(logs),
+                raw_size=len(raw),
+                data=data
+            )
+            BuildLog.objects.filter(id__in=[log.id for log in logs]).delete()
+        result['lines'] += len(logs)
+        result['raw_bytes'] += len(raw)
+        result['compressed_bytes'] += len(data)
+        result['segments'] += 1
+    if result['lines']:
+        logger.info(f"构建 {build_id} 日志已归档: {result}")
+    return result
+
+
+def archive_completed_build(build_id):
+    """构建结束后按配置自动归档日志，失败只记录错误"""
+    if not getattr(settings, 'BUILD_LOG_ARCHIVE_ON_COMPLETE', True):
+        return None
+    try:
+        if not Build.objects.filter(id=build_id, status__in=ARCHIVABLE_STATUSES).exists():
+            return None
+        return archive_build_logs(build_id)
+    except Exception as e:
+        logger.error(f"归档构建 {build_id} 日志失败: {str(e)}")
+        return None
+
+
+def read_archived_logs(build_id, after_id, limit):
+    """按 id 顺序读取归档段中 after_id 之后最多 limit 条日志"""
+    records = []
+    segments = BuildLogSegment.objects.filter(
+        build_id=build_id, last_log_id__gt=after_id
+    ).order_by('first_log_id')
+    for segment in segments.iterator():
+        records.extend(record for record in segment.decode() if record['id'] > after_id)
+        if len(records) >= limit:
+            break
+    return records[:limit]
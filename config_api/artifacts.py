@@ -0,0 +1,371 @@
+"""版本文件暂存缓存
+
+同一个 version_path 被多个构建、多个 NE 使用时，只从共享目录读取一次：
+第一次使用时边复制边计算 SHA-256，存放到本地缓存目录的
+<sha256>/<原文件名>，之后所有构建都使用同一个本地文件（或其只读内存映射）。
+驱动拿到的文件名和后缀与原路径相同；内容相同、文件名不同的版本文件在同一
+目录下以硬链接保存，只占一份磁盘空间。源文件的路径、大小和修改时间到
+内容哈希的索引保存在缓存目录的 sources.json 中，进程重启后源文件没有变化
+时直接命中缓存，不再读取共享目录。缓存按磁盘预算做 LRU 淘汰，正在被构建
+使用的文件不会被淘汰。
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('config_api')
+
+# 缓存目录中保存 源文件 -> 内容哈希 索引的文件
+SOURCE_INDEX = 'sources.json'
+
+
+class ArtifactError(Exception):
+    """版本文件暂存或校验失败"""
+
+
+class Artifact:
+    """缓存中的一个版本文件，目录下每个文件名都是同一份内容"""
+
+    __slots__ = ('digest', 'directory', 'size', 'names', 'copies', 'source', 'refs')
+
+    def __init__(self, digest, directory, size, names=(), copies=1, source=None):
+        self.digest = digest
+        self.directory = directory
+        self.size = size
+        self.names = set(names)
+        # 实际占用磁盘的份数，无法建立硬链接而复制时大于 1
+        self.copies = copies
+        self.source = source
+        self.refs = 0
+
+    @property
+    def path(self):
+        return self.path_for(min(self.names))
+
+    @property
+    def disk_bytes(self):
+        return self.size * self.copies
+
+    def path_for(self, source):
+        """与 source 同名的缓存文件路径"""
+        return os.path.join(self.directory, _file_name(source))
+
+    def mmap(self):
+        """返回缓存文件的只读内存映射，调用方负责 close"""
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ArtifactCache:
+    """按内容哈希存放的版本文件缓存"""
+
+    def __init__(self, root, max_bytes, chunk_size=1024 * 1024):
+        self.root = str(root)
+        self.max_bytes = int(max_bytes)
+        self.chunk_size = int(chunk_size)
+        self._entries = OrderedDict()
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._staging = {}
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.staged_bytes = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """从缓存目录恢复索引，按修改时间排出 LRU 顺序"""
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.staging-'):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    _remove(path)
+            elif len(name) == 64 and os.path.isdir(path):
+                artifact = self._load_entry(name, path)
+                if artifact is None:
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    found.append((os.stat(artifact.path).st_mtime, artifact))
+            elif len(name) == 64 and os.path.isfile(path):
+                # 旧版本按哈希直接存放、没有文件名的缓存文件
+                _remove(path)
+        for _, artifact in sorted(found, key=lambda item: item[0]):
+            self._entries[artifact.digest] = artifact
+        self._sources = {
+            key: digest for key, digest in self._read_source_index().items() if digest in self._entries
+        }
+
+    def _load_entry(self, digest, directory):
+        names = [name for name in os.listdir(directory) if not name.startswith('.staging-')]
+        stats = {}
+        for name in names:
+            try:
+                stats[name] = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+        sizes = {stat.st_size for stat in stats.values()}
+        if not stats or len(sizes) != 1:
+            return None
+        copies = len({(stat.st_dev, stat.st_ino) for stat in stats.values()})
+        return Artifact(digest, directory, sizes.pop(), names=stats, copies=copies)
+
+    def _read_source_index(self):
+        try:
+            with open(os.path.join(self.root, SOURCE_INDEX), encoding='utf-8') as f:
+                rows = json.load(f)
+            return {(row['source'], row['size'], row['mtime_ns']): row['digest'] for row in rows}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"版本文件缓存索引无法读取，将重新计算哈希: {str(e)}")
+            return {}
+
+    def _write_source_index(self):
+        """持久化 源文件 -> 内容哈希 索引，调用方持有 self._lock"""
+        rows = [
+            {'source': source, 'size': size, 'mtime_ns': mtime_ns, 'digest': digest}
+            for (source, size, mtime_ns), digest in self._sources.items()
+        ]
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.staging-', dir=self.root)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(rows, f)
+            os.replace(tmp_path, os.path.join(self.root, SOURCE_INDEX))
+        except OSError as e:
+            logger.warning(f"版本文件缓存索引写入失败: {str(e)}")
+
+    @property
+    def total_bytes(self):
+        return sum(artifact.disk_bytes for artifact in self._entries.values())
+
+    @contextmanager
+    def use(self, source):
+        """暂存并占用 source 对应的缓存文件，退出后才允许被淘汰
+
+        source 不是本地可读文件（例如设备侧路径）时原样返回 None。
+        """
+        artifact = self.stage(source)
+        try:
+            yield artifact
+        finally:
+            if artifact is not None:
+                self.release(artifact)
+
+    def release(self, artifact):
+        """释放 stage 返回的缓存文件"""
+        with self._lock:
+            artifact.refs -= 1
+        self._evict()
+
+    def stage(self, source):
+        """暂存 source 并占用缓存文件，调用方用完后需调用 release"""
+        if not source or not os.path.isfile(source):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        stat = os.stat(source)
+        key = (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            staging = self._staging.setdefault(key, threading.Lock())
+        # 同一个源文件同时只暂存一次，其他构建等待后直接命中
+        with staging:
+            with self._lock:
+                artifact = self._lookup(key)
+                if artifact is not None:
+                    self.hits += 1
+                    self._add_name(artifact, source)
+                    artifact.refs += 1
+                    return artifact
+                self.misses += 1
+            try:
+                artifact = self._copy(source, key)
+            finally:
+                with self._lock:
+                    self._staging.pop(key, None)
+        self._evict()
+        return artifact
+
+    def _lookup(self, key):
+        digest = self._sources.get(key)
+        artifact = self._entries.get(digest) if digest else None
+        if artifact is None:
+            return None
+        try:
+            intact = os.path.getsize(artifact.path_for(key[0])) == artifact.size
+        except OSError:
+            intact = False
+        if not intact:
+            logger.warning(f"缓存的版本文件已损坏或被删除，重新暂存: {artifact.path_for(key[0])}")
+            self._entries.pop(digest, None)
+            self._sources = {k: d for k, d in self._sources.items() if d != digest}
+            self._write_source_index()
+            shutil.rmtree(artifact.directory, ignore_errors=True)
+            return None
+        self._entries.move_to_end(digest)
+        return artifact
+
+    def _add_name(self, artifact, source):
+        """内容相同、文件名不同的源文件在同一目录下再建一个硬链接，调用方持有 self._lock"""
+        name = _file_name(source)
+        if name in artifact.names:
+            return
+        target = artifact.path_for(source)
+        try:
+            os.link(artifact.path, target)
+        except OSError:
+            shutil.copyfile(artifact.path, target)
+            artifact.copies += 1
+        artifact.names.add(name)
+
+    def _copy(self, source, key):
+        """边复制边计算哈希，校验后放入 <哈希>/<原文件名>"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(prefix='.staging-', dir=self.root)
+        try:
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                while True:
+                    chunk = src.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+            after = os.stat(source)
+            if size != key[1] or after.st_size != key[1] or after.st_mtime_ns != key[2]:
+                raise ArtifactError(f"Version file changed while staging: {source}")
+            digest = hasher.hexdigest()
+            with self._lock:
+                existing = self._entries.get(digest)
+                if existing is not None:
+                    # 不同路径的相同内容只保留一份
+                    self.deduplicated += 1
+                    _remove(tmp_path)
+                    artifact = existing
+                    self._add_name(artifact, source)
+                else:
+                    directory = os.path.join(self.root, digest)
+                    os.makedirs(directory, exist_ok=True)
+                    artifact = Artifact(digest, directory, size, source=source)
+                    os.replace(tmp_path, artifact.path_for(source))
+                    artifact.names.add(_file_name(source))
+                    self._entries[digest] = artifact
+                    self.staged_bytes += size
+                self._entries.move_to_end(digest)
+                self._sources[key] = digest
+                self._write_source_index()
+                artifact.refs += 1
+        except Exception:
+            _remove(tmp_path)
+            raise
+        logger.info(f"版本文件已暂存: {source} -> {digest[:12]} ({size} bytes)")
+        return artifact
+
+    def _evict(self):
+        """超出磁盘预算时从最久未使用的文件开始删除"""
+        removed = []
+        with self._lock:
+            total = self.total_bytes
+            for digest, artifact in list(self._entries.items()):
+                if total <= self.max_bytes:
+                    break
+                if artifact.refs > 0:
+                    continue
+                del self._entries[digest]
+                total -= artifact.disk_bytes
+                # 先在锁内改名移出，之后再删除，避免删掉同时重新暂存的同一内容
+                trash = os.path.join(self.root, f'.staging-evicted-{digest}-{id(artifact)}')
+                try:
+                    os.replace(artifact.directory, trash)
+                except OSError:
+                    trash = artifact.directory
+                removed.append((artifact, trash))
+                self.evictions += 1
+            if removed:
+                gone = {artifact.digest for artifact, _ in removed}
+                self._sources = {key: digest for key, digest in self._sources.items() if digest not in gone}
+                self._write_source_index()
+        for artifact, trash in removed:
+            shutil.rmtree(trash, ignore_errors=True)
+            logger.info(f"版本文件缓存淘汰: {artifact.digest[:12]} ({artifact.size} bytes)")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'in_use': sum(1 for artifact in self._entries.values() if artifact.refs),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'deduplicated': self.deduplicated,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'staged_bytes': self.staged_bytes,
+            }
+
+
+def _file_name(source):
+    return os.path.basename(os.path.normpath(str(source))) or 'version'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    """获取进程内共享的版本文件缓存，未启用时返回 None"""
+    global _cache
+    if not getattr(settings, 'UPGRADE_ARTIFACT_CACHE_ENABLED', True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ArtifactCache(
+                getattr(settings, 'UPGRADE_ARTIFACT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'artifact_cache')),
+                getattr(settings, 'UPGRADE_ARTIFACT_CACHE_MAX_BYTES', 20 * 1024 ** 3),
+            )
+        return _cache
+
+
+@contextmanager
+def staged_version(version_path):
+    """构建执行期间使用的版本文件：能缓存时为与原路径同名的本地缓存文件，否则为原路径
+
+    产出 (路径, Artifact 或 None)，退出后释放对缓存文件的占用。
+    """
+    cache = get_artifact_cache()
+    artifact = None
+    if cache is not None:
+        try:
+            artifact = cache.stage(version_path)
+        except Exception as e:
+            logger.warning(f"版本文件暂存失败，直接使用原路径 {version_path}: {str(e)}")
+    try:
+        yield (artifact.path_for(version_path) if artifact else version_path), artifact
+    finally:
+        if artifact is not None:
+            cache.release(artifact)
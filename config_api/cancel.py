@@ -0,0 +1,108 @@
+"""升级任务的协作式取消
+
+停止请求设置构建的 CancelToken，升级回调和各 NE 开始前的检查点发现
+令牌已取消后抛出 UpgradeCancelled，使升级脚本尽快退出并释放工作线程。
+其他进程发起的停止通过 UpgradeJob.cancel_requested 由心跳线程同步过来。
+"""
+import threading
+import time
+
+
+class UpgradeCancelled(Exception):
+    """升级任务已被停止"""
+
+
+class CancelToken:
+    """单个构建的取消令牌"""
+
+    def __init__(self, build_id):
+        self.build_id = build_id
+        self.reason = ''
+        self.requested_at = None
+        self.latency = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self, reason=''):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self.requested_at = time.monotonic()
+            self._cancelled.set()
+
+    def check(self):
+        """检查点：已取消时抛出 UpgradeCancelled"""
+        if self._cancelled.is_set():
+            raise UpgradeCancelled(self.reason or f"Build {self.build_id} was stopped")
+
+    def sleep(self, seconds):
+        """可被取消打断的等待，返回 True 表示已取消"""
+        return self._cancelled.wait(seconds)
+
+    def finish(self):
+        """升级线程已退出，记录从请求取消到退出的耗时"""
+        if self.requested_at is not None and self.latency is None:
+            self.latency = time.monotonic() - self.requested_at
+            metrics.record(self.latency)
+        self._finished.set()
+
+    def wait_finished(self, timeout):
+        return self._finished.wait(timeout)
+
+
+class CancelMetrics:
+    """取消耗时统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency):
+        with self._lock:
+            self.count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'cancelled': self.count,
+                'avg_cancel_ms': round(self.total_latency / self.count * 1000, 3) if self.count else 0.0,
+                'max_cancel_ms': round(self.max_latency * 1000, 3),
+            }
+
+
+metrics = CancelMetrics()
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+def register(build_id):
+    with _tokens_lock:
+        token = _tokens[build_id] = CancelToken(build_id)
+        return token
+
+
+def unregister(token):
+    with _tokens_lock:
+        if _tokens.get(token.build_id) is token:
+            del _tokens[token.build_id]
+
+
+def get_token(build_id):
+    with _tokens_lock:
+        return _tokens.get(build_id)
+
+
+def cancel_build(build_id, reason=''):
+    """取消本进程中正在执行的构建，返回令牌（构建不在本进程执行时为 None）"""
+    token = get_token(build_id)
+    if token is not None:
+        token.cancel(reason)
+    return token
@@ -0,0 +1,172 @@
+"""进程内配置缓存
+
+配置读取（前端每次加载页面都会请求）使用进程内快照，不查询数据库。
+Config 每次保存时 version 加一，ETag 由配置 id 和 version 组成。
+
+多个工作进程之间通过版本文件同步：配置保存或删除的事务提交后改写
+CONFIG_CACHE_VERSION_FILE，每次读取只 stat 这个文件，inode 或修改时间
+变化时才重新加载。CONFIG_CACHE_MAX_AGE 秒后无论如何都重新加载一次，
+兜底没有经过 ORM 的修改（例如直接改数据库）。
+
+按地址反查环境用的区间索引（get_ip_index）也按同样的方式缓存和失效。
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Config, EnvironmentIP
+
+logger = logging.getLogger('config_api')
+
+
+class ConfigSnapshot:
+    """某个配置版本的只读快照"""
+
+    __slots__ = ('token', 'loaded_at', 'data', 'etag', 'config_id', 'version')
+
+    def __init__(self, token, data, config_id, version):
+        self.token = token
+        self.loaded_at = time.monotonic()
+        self.data = data
+        self.config_id = config_id
+        self.version = version
+        self.etag = config_etag(config_id, version)
+
+
+def config_etag(config_id, version):
+    return f'"config-{config_id}-{version}"' if config_id else '"config-none"'
+
+
+_snapshot = None
+_ip_index = None  # (版本文件 token, 加载时间, IntervalIndex)
+_lock = threading.Lock()
+loads = 0
+
+
+def _version_file():
+    return str(getattr(settings, 'CONFIG_CACHE_VERSION_FILE', os.path.join(settings.BASE_DIR, '.config_version')))
+
+
+def _read_token():
+    """版本文件的 (inode, 修改时间, 大小)，文件不存在或不可读时返回 None"""
+    try:
+        stat = os.stat(_version_file())
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def bump_version_file():
+    """改写版本文件，通知其他进程重新加载配置"""
+    path = _version_file()
+    try:
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.config_version-', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(time.time_ns()))
+        # 替换文件使 inode 变化，修改时间精度不够时也能识别
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"更新配置版本文件失败 {path}: {str(e)}")
+
+
+def invalidate():
+    """丢弃本进程的快照并通知其他进程"""
+    global _snapshot, _ip_index
+    with _lock:
+        _snapshot = None
+        _ip_index = None
+    bump_version_file()
+
+
+def _load(token):
+    global loads
+    from .serializers import ConfigSerializer
+    first = Config.objects.order_by('id').prefetch_related('options', 'environments__ips').first()
+    data = ConfigSerializer(first).data if first else {}
+    loads += 1
+    return ConfigSnapshot(token, data, first.id if first else None, first.version if first else None)
+
+
+def _current_token():
+    token = _read_token()
+    if token is None:
+        bump_version_file()
+        token = _read_token()
+    return token
+
+
+def get_snapshot():
+    """当前配置快照，版本文件未变化且未超过 CONFIG_CACHE_MAX_AGE 时不查询数据库"""
+    global _snapshot
+    # 首次使用时创建版本文件；无法创建时每次都从数据库读取
+    token = _current_token()
+    max_age = float(getattr(settings, 'CONFIG_CACHE_MAX_AGE', 300) or 0)
+    snapshot = _snapshot
+    if (snapshot is not None and token is not None and snapshot.token == token
+            and (not max_age or time.monotonic() - snapshot.loaded_at < max_age)):
+        return snapshot
+    with _lock:
+        # 其他线程可能已经加载
+        if (_snapshot is not None and token is not None and _snapshot.token == token
+                and _snapshot is not snapshot):
+            return _snapshot
+        snapshot = _load(token)
+        if token is not None:
+            _snapshot = snapshot
+        return snapshot
+
+
+def get_ip_index():
+    """所有环境地址段的区间索引（EnvironmentIP.build_index），与快照一样按版本文件判断是否重建"""
+    global _ip_index
+    token = _current_token()
+    max_age = float(getattr(settings, 'CONFIG_CACHE_MAX_AGE', 300) or 0)
+    cached = _ip_index
+    if (cached is not None and token is not None and cached[0] == token
+            and (not max_age or time.monotonic() - cached[1] < max_age)):
+        return cached[2]
+    with _lock:
+        if (_ip_index is not None and token is not None and _ip_index[0] == token
+                and _ip_index is not cached):
+            return _ip_index[2]
+        index = EnvironmentIP.build_index()
+        if token is not None:
+            _ip_index = (token, time.monotonic(), index)
+        return index
+
+
+def stats():
+    snapshot = _snapshot
+    return {
+        'loads': loads,
+        'config_id': snapshot.config_id if snapshot else None,
+        'version': snapshot.version if snapshot else None,
+        'age': round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else None,
+        'ip_index_size': _ip_index[2].size if _ip_index else None,
+        'version_file': _version_file(),
+    }
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match 请求头是否包含 etag（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return any(value.removeprefix('W/') == etag for value in candidates)
+
+
+@receiver(post_save, sender=Config)
+@receiver(post_delete, sender=Config)
+def _config_changed(sender, instance, **kwargs):
+    # 事务提交后再通知，避免其他进程读到未提交前的旧数据并缓存
+    transaction.on_commit(invalidate)
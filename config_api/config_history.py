@@ -0,0 +1,401 @@
+"""配置版本历史
+
+Config 每次保存都会写一条 ConfigRevision。大多数版本只保存相对上一版本
+的增量：升级类型、工作类型和每个环境的 NE 列表分别按 difflib 的编辑操作
+[起始, 结束, 新内容] 记录，未修改的部分不占空间。每隔
+CONFIG_REVISION_SNAPSHOT_EVERY 个版本保存一次完整快照，还原任意版本时
+从最近的快照开始回放增量。
+
+读取当前配置不经过这里，仍走 config_cache。
+
+批量导入只改动部分环境时用 record_environment_changes：内容哈希和历史
+版本都直接从数据库流式读取生成，不把整个配置读入内存。
+"""
+import difflib
+import hashlib
+import itertools
+import json
+import zlib
+
+from django.conf import settings
+
+from . import ipsets
+from .models import ConfigEnvironment, ConfigRevision, EnvironmentIP
+
+LIST_FIELDS = ('upgrade_type', 'work_type')
+
+
+class RevisionNotFound(Exception):
+    """配置版本不存在"""
+
+
+def config_state(config):
+    """配置的完整内容 {'upgrade_type', 'work_type', 'environments': {环境: [NE]}}"""
+    return {
+        'upgrade_type': config.get_upgrade_type(),
+        'work_type': config.get_work_type(),
+        'environments': config.get_env_ip_map(),
+    }
+
+
+def content_hash(state):
+    """配置内容的规范哈希（sha256），用于发现内容相同的配置
+
+    类型、环境和 NE 都与顺序无关；地址段先合并，10.0.0.0/24 与逐个列出的
+    256 个地址视为相同。与 stored_content_hash 的结果一致。
+    """
+    environments = []
+    for name, ips in state['environments'].items():
+        blocks = []
+        literals = set()
+        for entry in ips:
+            block = ipsets.try_parse(entry)
+            if block is None:
+                literals.add(str(entry).strip())
+            else:
+                blocks.append(block)
+        environments.append(_environment_digest(name, sorted(blocks), literals))
+    return _config_digest(state['upgrade_type'], state['work_type'], environments)
+
+
+def stored_content_hash(config):
+    """按数据库中已保存的内容流式计算 content_hash，不把整个配置读入内存"""
+    rows = EnvironmentIP.objects.filter(environment__config_id=config.id)
+    blocks = _GroupCursor(
+        rows.filter(ip_version__gt=0)
+        .order_by('environment_id', 'ip_version', 'range_start', 'range_end')
+        .values_list('environment_id', 'ip_version', 'range_start', 'range_end')
+        .iterator(chunk_size=5000)
+    )
+    literals = _GroupCursor(
+        rows.filter(ip_version=0).order_by('environment_id')
+        .values_list('environment_id', 'ne_ip').iterator(chunk_size=5000)
+    )
+    environments = (
+        _environment_digest(
+            name,
+            (ipsets.IPBlock(version, ipsets.from_key(start), ipsets.from_key(end))
+             for _, version, start, end in blocks.take(environment_id)),
+            (ne_ip for _, ne_ip in literals.take(environment_id)),
+        )
+        for environment_id, name in ConfigEnvironment.objects.filter(config_id=config.id)
+        .order_by('id').values_list('id', 'name').iterator(chunk_size=5000)
+    )
+    return _config_digest(config.get_upgrade_type(), config.get_work_type(), environments)
+
+
+def _environment_digest(name, blocks, literals):
+    """一个环境的哈希，blocks 需按 (版本, 起始) 排序，literals 的顺序无关"""
+    hasher = hashlib.sha256(json.dumps(str(name), ensure_ascii=False).encode('utf-8'))
+    for block in ipsets.iter_merged(blocks):
+        hasher.update(b'\n' + ipsets.block_text(block).encode('ascii'))
+    hasher.update(b'\n' + _unordered(hashlib.sha256(str(literal).encode('utf-8')).digest() for literal in literals))
+    return hasher.digest()
+
+
+def _unordered(digests):
+    """与顺序无关地合并多个哈希（按 256 位整数求和）"""
+    total = sum(int.from_bytes(digest, 'big') for digest in digests) % (1 << 256)
+    return total.to_bytes(32, 'big')
+
+
+def _config_digest(upgrade_type, work_type, environment_digests):
+    canonical = {'upgrade_type': sorted(set(upgrade_type)), 'work_type': sorted(set(work_type))}
+    hasher = hashlib.sha256(json.dumps(canonical, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    hasher.update(_unordered(environment_digests))
+    return hasher.hexdigest()
+
+
+class _GroupCursor:
+    """按第一列分组读取有序的行；take 须按行中分组出现的顺序调用，并在下次调用前读完"""
+
+    def __init__(self, rows):
+        self._groups = itertools.groupby(rows, key=lambda row: row[0])
+        self._current = next(self._groups, None)
+        self._taken = False
+
+    def take(self, key):
+        if self._taken:
+            self._current = next(self._groups, None)
+            self._taken = False
+        if self._current is None or self._current[0] != key:
+            return iter(())
+        self._taken = True
+        return self._current[1]
+
+
+def empty_state():
+    return {'upgrade_type': [], 'work_type': [], 'environments': {}}
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def _list_ops(old, new):
+    if old == new:
+        return []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def _apply_ops(old, ops):
+    result = list(old)
+    # 从后往前替换，前面的下标不受影响
+    for i1, i2, items in reversed(ops):
+        result[i1:i2] = items
+    return result
+
+
+def make_delta(previous, current):
+    """current 相对 previous 的增量，内容相同时为空字典"""
+    delta = {}
+    for field in LIST_FIELDS:
+        ops = _list_ops(previous[field], current[field])
+        if ops:
+            delta[field] = ops
+    old_envs, new_envs = previous['environments'], current['environments']
+    if list(old_envs) != list(new_envs):
+        delta['env_order'] = list(new_envs)
+    env_ops = {}
+    for name, ips in new_envs.items():
+        ops = _list_ops(old_envs.get(name, []), ips)
+        if ops:
+            env_ops[name] = ops
+    if env_ops:
+        delta['env_ips'] = env_ops
+    return delta
+
+
+def apply_delta(previous, delta):
+    state = {field: _apply_ops(previous[field], delta.get(field, [])) for field in LIST_FIELDS}
+    old_envs = previous['environments']
+    env_ops = delta.get('env_ips', {})
+    state['environments'] = {
+        name: _apply_ops(old_envs.get(name, []), env_ops.get(name, []))
+        for name in delta.get('env_order', list(old_envs))
+    }
+    return state
+
+
+def diff_states(old, new):
+    """两个配置内容之间增加和删除的条目"""
+    result = {}
+    for field in LIST_FIELDS:
+        old_set, new_set = set(old[field]), set(new[field])
+        result[field] = {
+            'added': [value for value in new[field] if value not in old_set],
+            'removed': [value for value in old[field] if value not in new_set],
+        }
+    old_envs, new_envs = old['environments'], new['environments']
+    changed = {}
+    for name in list(old_envs) + [name for name in new_envs if name not in old_envs]:
+        old_ips, new_ips = old_envs.get(name, []), new_envs.get(name, [])
+        old_set, new_set = set(old_ips), set(new_ips)
+        added = [ip for ip in new_ips if ip not in old_set]
+        removed = [ip for ip in old_ips if ip not in new_set]
+        if added or removed:
+            changed[name] = {'added': added, 'removed': removed}
+    result['environments'] = {
+        'added': [name for name in new_envs if name not in old_envs],
+        'removed': [name for name in old_envs if name not in new_envs],
+        'changed': changed,
+    }
+    return result
+
+
+def summarize_diff(diff):
+    """列出版本时显示的修改数量"""
+    environments = diff['environments']
+    summary = {field: {key: len(values) for key, values in diff[field].items()} for field in LIST_FIELDS}
+    summary['environments'] = {
+        'added': len(environments['added']),
+        'removed': len(environments['removed']),
+        'changed': len(environments['changed']),
+        'ips_added': sum(len(change['added']) for change in environments['changed'].values()),
+        'ips_removed': sum(len(change['removed']) for change in environments['changed'].values()),
+    }
+    return summary
+
+
+def _replay(config_id, version):
+    """还原指定版本，返回 (内容, 起始快照的版本号)"""
+    revisions = ConfigRevision.objects.filter(config_id=config_id, version__lte=version)
+    base = revisions.filter(kind='snapshot').order_by('-version').first()
+    if base is None or not revisions.filter(version=version).exists():
+        raise RevisionNotFound(f"Config {config_id} has no version {version}")
+    state = _unpack(base.data)
+    for revision in revisions.filter(version__gt=base.version, kind='delta').order_by('version'):
+        state = apply_delta(state, _unpack(revision.data))
+    return state, base.version
+
+
+def state_at(config_id, version):
+    """指定版本的配置内容，版本不存在时抛出 RevisionNotFound"""
+    return _replay(config_id, version)[0]
+
+
+def record_revision(config, message='', state=None):
+    """保存配置后记录新版本，在 Config.save 的事务中调用，state 为已读取的配置内容"""
+    current = state if state is not None else config_state(config)
+    head = (ConfigRevision.objects.filter(config_id=config.id)
+            .order_by('-version').values_list('version', flat=True).first())
+    every = max(1, int(getattr(settings, 'CONFIG_REVISION_SNAPSHOT_EVERY', 20)))
+    previous = None
+    if head is not None:
+        try:
+            previous, base_version = _replay(config.id, head)
+        except RevisionNotFound:
+            previous = None
+    if previous is None:
+        summary = summarize_diff(diff_states(empty_state(), current))
+        kind, payload = 'snapshot', current
+    else:
+        summary = summarize_diff(diff_states(previous, current))
+        if config.version - base_version >= every:
+            kind, payload = 'snapshot', current
+        else:
+            kind, payload = 'delta', make_delta(previous, current)
+    return ConfigRevision.objects.create(
+        config=config, version=config.version, kind=kind, data=_pack(payload),
+        summary=summary, message=message[:200]
+    )
+
+
+def restore_revision(config, version):
+    """把配置恢复成指定版本的内容，保存为一个新版本"""
+    state = state_at(config.id, version)
+    config.set_upgrade_type(state['upgrade_type'])
+    config.set_work_type(state['work_type'])
+    config.set_env_ip_map(state['environments'])
+    config._revision_message = f"恢复到版本 {version}"
+    config.save()
+    return config
+
+
+class _PackWriter:
+    """边生成 JSON 文本边压缩，结果与 _pack 的格式相同"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj()
+        self._chunks = []
+
+    def write(self, text):
+        self._chunks.append(self._compressor.compress(text.encode('utf-8')))
+
+    def write_json(self, value):
+        self.write(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+
+    def getvalue(self):
+        self._chunks.append(self._compressor.flush())
+        return b''.join(self._chunks)
+
+
+def _write_entries(writer, entries):
+    writer.write('[')
+    for index, entry in enumerate(entries):
+        if index:
+            writer.write(',')
+        writer.write_json(entry)
+    writer.write(']')
+
+
+def _environment_rows(config, environment_ids=None):
+    """按环境顺序、NE 顺序流式读取 (环境 id, NE)"""
+    rows = EnvironmentIP.objects.filter(environment__config_id=config.id)
+    if environment_ids is not None:
+        rows = rows.filter(environment_id__in=environment_ids)
+    return (rows.order_by('environment__position', 'environment_id', 'position', 'id')
+            .values_list('environment_id', 'ne_ip').iterator(chunk_size=5000))
+
+
+def _pack_snapshot(config):
+    writer = _PackWriter()
+    writer.write('{"upgrade_type":')
+    writer.write_json(config.get_upgrade_type())
+    writer.write(',"work_type":')
+    writer.write_json(config.get_work_type())
+    writer.write(',"environments":{')
+    rows = _GroupCursor(_environment_rows(config))
+    environments = (ConfigEnvironment.objects.filter(config_id=config.id)
+                    .order_by('position', 'id').values_list('id', 'name').iterator(chunk_size=5000))
+    for index, (environment_id, name) in enumerate(environments):
+        if index:
+            writer.write(',')
+        writer.write_json(name)
+        writer.write(':')
+        _write_entries(writer, (ne_ip for _, ne_ip in rows.take(environment_id)))
+    writer.write('}}')
+    return writer.getvalue()
+
+
+def _pack_environment_delta(config, changes):
+    writer = _PackWriter()
+    writer.write('{')
+    if any(change['created'] for change in changes):
+        writer.write('"env_order":')
+        writer.write_json(list(ConfigEnvironment.objects.filter(config_id=config.id)
+                               .order_by('position', 'id').values_list('name', flat=True)))
+        writer.write(',')
+    writer.write('"env_ips":{')
+    first = True
+    # 分批查询，避免 IN 参数过多
+    for offset in range(0, len(changes), 500):
+        by_id = {change['environment_id']: change for change in changes[offset:offset + 500]}
+        rows = _GroupCursor(_environment_rows(config, list(by_id)))
+        environments = (ConfigEnvironment.objects.filter(id__in=list(by_id))
+                        .order_by('position', 'id').values_list('id', flat=True))
+        for environment_id in environments:
+            change = by_id[environment_id]
+            if not first:
+                writer.write(',')
+            first = False
+            writer.write_json(change['name'])
+            # 追加：在原列表末尾插入新的 NE；替换：整个列表换成新内容
+            start = 0 if change['replaced'] else change['old_count']
+            writer.write(f":[[{start},{change['old_count']},")
+            _write_entries(writer, itertools.islice((ne_ip for _, ne_ip in rows.take(environment_id)), start, None))
+            writer.write(']]')
+    writer.write('}}')
+    return writer.getvalue()
+
+
+def record_environment_changes(config, changes, message=''):
+    """批量修改部分环境的 NE 列表后，更新版本号和内容哈希并记录历史版本
+
+    NE 已经写入数据库，需在同一事务中调用。changes 为每个被修改的环境的
+    {'environment_id', 'name', 'created', 'replaced', 'old_count', 'added', 'removed'}：
+    old_count 为修改前的 NE 数，追加时新的 NE 排在原有 NE 之后。
+    增量和快照都从数据库流式生成，内存占用与配置大小无关。
+    """
+    config.bump_version()
+    config.content_hash = stored_content_hash(config)
+    type(config).objects.filter(pk=config.pk).update(content_hash=config.content_hash)
+    base_version = (ConfigRevision.objects.filter(config_id=config.id, kind='snapshot')
+                    .order_by('-version').values_list('version', flat=True).first())
+    every = max(1, int(getattr(settings, 'CONFIG_REVISION_SNAPSHOT_EVERY', 20)))
+    changed = [change for change in changes if change['added'] or change['removed']]
+    no_change = {'added': 0, 'removed': 0}
+    summary = {
+        'upgrade_type': dict(no_change),
+        'work_type': dict(no_change),
+        'environments': {
+            'added': sum(1 for change in changes if change['created']),
+            'removed': 0,
+            'changed': len(changed),
+            'ips_added': sum(change['added'] for change in changes),
+            'ips_removed': sum(change['removed'] for change in changes),
+        },
+    }
+    if base_version is None or config.version - base_version >= every:
+        kind, data = 'snapshot', _pack_snapshot(config)
+    else:
+        kind, data = 'delta', _pack_environment_delta(config, changes)
+    return ConfigRevision.objects.create(
+        config=config, version=config.version, kind=kind, data=data,
+        summary=summary, message=message[:200]
+    )
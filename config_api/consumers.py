@@ -0,0 +1,90 @@
+import logging
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .events import bind_loop, build_group_name
+from .models import Build
+from .pagination import fetch_log_page
+
+logger = logging.getLogger('config_api')
+
+# 连接时回放历史日志的每批条数
+REPLAY_BATCH_SIZE = 500
+
+
+class BuildLogConsumer(AsyncJsonWebsocketConsumer):
+    """推送单个构建的日志与状态
+
+    连接时先从 last_log_id 之后回放历史日志，再切换为实时推送。
+    """
+
+    async def connect(self):
+        bind_loop()
+        self.build_id = int(self.scope['url_route']['kwargs']['build_id'])
+        self.group_name = build_group_name(self.build_id)
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            self.last_log_id = int(params.get('last_log_id', ['0'])[0] or 0)
+        except ValueError:
+            self.last_log_id = 0
+
+        if await self._get_status() is None:
+            logger.error(f"Build {self.build_id} not found")
+            await self.close(code=4404)
+            return
+
+        # 先加入分组再回放，回放期间到达的实时消息按日志 ID 去重
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self._replay()
+        await self.send_json({'type': 'status', 'status': await self._get_status()})
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def build_logs(self, event):
+        logs = [log for log in event['logs'] if log['id'] is None or log['id'] > self.last_log_id]
+        if logs:
+            self.last_log_id = max([log['id'] for log in logs if log['id']], default=self.last_log_id)
+            await self.send_json({'type': 'logs', 'logs': logs})
+
+    async def build_status(self, event):
+        await self.send_json({'type': 'status', 'status': event['status']})
+
+    async def _replay(self):
+        while True:
+            logs = await self._fetch_logs(self.last_log_id)
+            if not logs:
+                break
+            self.last_log_id = logs[-1]['id']
+            await self.send_json({'type': 'logs', 'logs': logs})
+            if len(logs) < REPLAY_BATCH_SIZE:
+                break
+
+    @database_sync_to_async
+    def _get_status(self):
+        return Build.objects.filter(id=self.build_id).values_list('status', flat=True).first()
+
+    @database_sync_to_async
+    def _fetch_logs(self, after_id):
+        logs, _ = fetch_log_page(self.build_id, after_id, REPLAY_BATCH_SIZE)
+        return logs
+
+
+class UpgradeLogConsumer(AsyncJsonWebsocketConsumer):
+    """推送 ConfigViewSet.start_upgrade 任务的日志"""
+
+    async def connect(self):
+        bind_loop()
+        self.group_name = f"upgrade_log_{self.scope['url_route']['kwargs']['task_id']}"
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def upgrade_log(self, event):
+        await self.send_json({'type': 'log', 'message': event['message']})
@@ -0,0 +1,9 @@
+"""升级驱动
+
+runner 通过 get_driver 按 upgrade_type / work_type 选择驱动，驱动模块在首次
+使用时才导入。内置 ssh_cli（现网升级库）与 simulator（本地模拟）两种驱动。
+"""
+from .base import UpgradeDriver, DriverNotFound
+from .registry import get_driver, driver_stats, reset_drivers
+
+__all__ = ['UpgradeDriver', 'DriverNotFound', 'get_driver', 'driver_stats', 'reset_drivers']
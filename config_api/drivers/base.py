@@ -0,0 +1,33 @@
+"""升级驱动接口"""
+
+
+class DriverNotFound(Exception):
+    """没有匹配的升级驱动或驱动无法加载"""
+
+
+class UpgradeDriver:
+    """升级驱动基类
+
+    子类实现 upgrade：通过 callback 逐行回传日志，成功返回 True，失败返回 False
+    或抛出异常。callback 在构建被停止时会抛出 UpgradeCancelled，驱动不应吞掉它；
+    需要等待的驱动应使用 token.sleep 以便被及时打断。
+
+    supports_sessions 为 True 的驱动由 runner 从会话池取得会话（见 sessions.py）
+    传给 upgrade；会话对象需要提供 is_alive() 和 close()。
+    """
+
+    name = ''
+    supports_sessions = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def open_session(self, ne_ip):
+        """建立到 NE 的新会话"""
+        raise NotImplementedError
+
+    def upgrade(self, upgrade_type, work_type, ne_ip, version_path, callback, token=None, session=None):
+        raise NotImplementedError
+
+    def describe(self):
+        return {'name': self.name, 'class': f"{type(self).__module__}.{type(self).__name__}"}
@@ -0,0 +1,67 @@
+"""升级驱动注册表
+
+UPGRADE_DRIVERS 把驱动名映射到类的导入路径，UPGRADE_DRIVER_ROUTES 按
+"upgrade_type/work_type" 选择驱动名，两段都可以写 *，匹配顺序为
+精确 > upgrade_type/* > */work_type > *。驱动类在第一次被选中时才导入，
+实例在进程内复用。
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import DriverNotFound
+
+logger = logging.getLogger('config_api')
+
+DEFAULT_DRIVERS = {
+    'ssh_cli': 'config_api.drivers.ssh_cli.SshCliDriver',
+    'simulator': 'config_api.drivers.simulator.SimulatorDriver',
+}
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def resolve_driver_name(upgrade_type, work_type):
+    """按路由表选出驱动名"""
+    routes = getattr(settings, 'UPGRADE_DRIVER_ROUTES', None) or {}
+    for key in (f"{upgrade_type}/{work_type}", f"{upgrade_type}/*", f"*/{work_type}", '*'):
+        if key in routes:
+            return routes[key]
+    return getattr(settings, 'UPGRADE_DRIVER', 'ssh_cli')
+
+
+def get_driver(upgrade_type, work_type):
+    """获取处理该升级类型的驱动实例，找不到或加载失败时抛出 DriverNotFound"""
+    name = resolve_driver_name(upgrade_type, work_type)
+    with _lock:
+        driver = _instances.get(name)
+        if driver is not None:
+            return driver
+        drivers = {**DEFAULT_DRIVERS, **(getattr(settings, 'UPGRADE_DRIVERS', None) or {})}
+        if name not in drivers:
+            raise DriverNotFound(f"Unknown upgrade driver '{name}' for {upgrade_type}/{work_type}")
+        try:
+            driver_class = import_string(drivers[name])
+        except ImportError as e:
+            raise DriverNotFound(f"Failed to load upgrade driver '{name}': {str(e)}")
+        options = (getattr(settings, 'UPGRADE_DRIVER_OPTIONS', None) or {}).get(name, {})
+        driver = driver_class(**options)
+        driver.name = name
+        _instances[name] = driver
+        logger.info(f"已加载升级驱动: {name} ({drivers[name]})")
+        return driver
+
+
+def driver_stats():
+    """已加载的驱动"""
+    with _lock:
+        return [driver.describe() for driver in _instances.values()]
+
+
+def reset_drivers():
+    """丢弃已加载的驱动实例，修改配置后重新加载"""
+    with _lock:
+        _instances.clear()
@@ -0,0 +1,129 @@
+"""本地模拟升级驱动
+
+不连接真实 NE，按现网升级脚本的阶段输出日志，用于在 Linux 上联调和压测
+整个构建流程。每步耗时、抖动、失败率和建立会话的握手耗时可配置。
+"""
+import random
+import threading
+import time
+
+from .base import UpgradeDriver
+
+PHASES = (
+    ("当前版本 V{old_version}", 0),
+    ("检查磁盘空间: 剩余 {free_mb} MB", 1),
+    ("传输版本文件 {version_path}", 0),
+    ("校验版本文件 MD5", 2),
+    ("激活 {work_type} 版本 ({upgrade_type})", 2),
+    ("NE 重启中", 3),
+    ("等待 NE 上线", 3),
+    ("升级完成，当前版本 V{new_version}", 1),
+)
+
+
+class SimulatedSession:
+    """模拟的 NE 会话，代替真实 SSH 连接"""
+
+    def __init__(self, ne_ip):
+        self.ne_ip = ne_ip
+        self.opened_at = time.monotonic()
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.alive = False
+
+
+class SimulatorDriver(UpgradeDriver):
+    """按阶段输出模拟日志的升级驱动"""
+
+    supports_sessions = True
+
+    def __init__(self, step_latency=0.2, jitter=0.5, failure_rate=0.0, transfer_steps=10,
+                 connect_latency=1.0, seed=None, **options):
+        super().__init__(**options)
+        self.step_latency = float(step_latency)
+        self.connect_latency = float(connect_latency)
+        self.jitter = max(0.0, float(jitter))
+        self.failure_rate = min(1.0, max(0.0, float(failure_rate)))
+        self.transfer_steps = max(1, int(transfer_steps))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.connects = 0
+
+    def _pause(self, weight, token):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        seconds = max(0.0, self.step_latency * weight * factor)
+        if token is not None:
+            token.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def open_session(self, ne_ip):
+        """模拟 SSH 连接和认证握手"""
+        with self._lock:
+            self.connects += 1
+        time.sleep(self.connect_latency)
+        return SimulatedSession(ne_ip)
+
+    def upgrade(self, upgrade_type, work_type, ne_ip, version_path, callback, token=None, session=None):
+        if session is not None:
+            if not session.is_alive():
+                raise ConnectionError(f"Session to {ne_ip} is closed")
+            callback(f"复用已有会话 {ne_ip}:22")
+            return self._run_phases(upgrade_type, work_type, ne_ip, version_path, callback, token)
+        # 没有会话池时每次升级单独建连
+        callback(f"连接 {ne_ip}:22")
+        session = self.open_session(ne_ip)
+        try:
+            callback("登录成功")
+            return self._run_phases(upgrade_type, work_type, ne_ip, version_path, callback, token)
+        finally:
+            session.close()
+
+    def _run_phases(self, upgrade_type, work_type, ne_ip, version_path, callback, token):
+        with self._lock:
+            self.runs += 1
+            fail_at = (self._random.randrange(len(PHASES))
+                       if self._random.random() < self.failure_rate else None)
+            context = {
+                'ne_ip': ne_ip,
+                'version_path': version_path,
+                'work_type': work_type,
+                'upgrade_type': upgrade_type,
+                'old_version': f"{self._random.randint(1, 9)}.{self._random.randint(0, 20)}",
+                'new_version': f"{self._random.randint(10, 19)}.{self._random.randint(0, 20)}",
+                'free_mb': self._random.randint(512, 8192),
+            }
+        for index, (template, weight) in enumerate(PHASES):
+            callback(template.format(**context))
+            if index == 2:
+                for step in range(1, self.transfer_steps + 1):
+                    self._pause(1, token)
+                    callback(f"传输进度 {step * 100 // self.transfer_steps}%")
+            else:
+                self._pause(weight, token)
+            if index == fail_at:
+                with self._lock:
+                    self.failures += 1
+                callback(f"错误: {template.format(**context)} 失败")
+                return False
+        return True
+
+    def describe(self):
+        data = super().describe()
+        with self._lock:
+            data.update({
+                'step_latency': self.step_latency,
+                'connect_latency': self.connect_latency,
+                'failure_rate': self.failure_rate,
+                'runs': self.runs,
+                'failures': self.failures,
+                'connects': self.connects,
+            })
+        return data
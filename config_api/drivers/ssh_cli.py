@@ -0,0 +1,67 @@
+"""现网升级驱动：调用本地 NPTI_CLI 升级库的 ssh_cli.upgrade"""
+import importlib
+import logging
+import sys
+import threading
+
+from django.conf import settings
+
+from .base import DriverNotFound, UpgradeDriver
+
+logger = logging.getLogger('config_api')
+
+
+class SshCliDriver(UpgradeDriver):
+    """通过 ssh_cli 升级真实 NE，升级库在第一次升级时才导入"""
+
+    def __init__(self, lib_path=None, module='ssh_cli', **options):
+        super().__init__(**options)
+        self.lib_path = lib_path or getattr(settings, 'UPGRADE_SSH_CLI_PATH', r'C:\NPTI_CLI\Lib')
+        self.module_name = module
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def module(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = self._load()
+        return self._module
+
+    def _load(self):
+        if self.lib_path and self.lib_path not in sys.path:
+            sys.path.append(self.lib_path)
+        try:
+            module = importlib.import_module(self.module_name)
+        except Exception as e:
+            logger.error(f"Failed to import {self.module_name}: {str(e)}")
+            raise DriverNotFound(f"Failed to import {self.module_name} from {self.lib_path}: {str(e)}")
+        logger.info(f"{self.module_name} module location: {getattr(module, '__file__', None)}")
+        return module
+
+    @property
+    def supports_sessions(self):
+        # 升级库提供 connect 时才能复用会话，否则每次升级由 upgrade 自行建连
+        return callable(getattr(self.module, 'connect', None))
+
+    def open_session(self, ne_ip):
+        return self.module.connect(ne_ip)
+
+    def upgrade(self, upgrade_type, work_type, ne_ip, version_path, callback, token=None, session=None):
+        # 升级库不认识取消令牌，停止请求由 callback 抛出 UpgradeCancelled 打断
+        kwargs = {'session': session} if session is not None else {}
+        return self.module.upgrade(
+            upgrade_type=upgrade_type,
+            work_type=work_type,
+            ne_ip=ne_ip,
+            version_path=version_path,
+            callback=callback,
+            **kwargs
+        )
+
+    def describe(self):
+        data = super().describe()
+        data['loaded'] = self._module is not None
+        data['lib_path'] = self.lib_path
+        return data
@@ -0,0 +1,131 @@
+"""管理命令的流式输出
+
+大表用 .iterator(chunk_size=...) 分批读取、逐行输出，内存占用与表大小无关，
+也不先执行 count()。输出格式：
+- text：给人看的格式，由各命令自己决定；
+- jsonl：每行一个 JSON 对象；
+- csv：第一行为表头，列表、字典等值编码成 JSON 放在单元格中。
+
+--where 可重复指定，多个条件之间为 AND：
+    status=success            精确匹配（也可以写 Django 查询，例如 created_at__date=2024-05-01）
+    id>=1000  id<2000         比较：>、>=、<、<=
+    status!=failed            不等于
+    status__in=success,failed 逗号分隔的多个值
+    ne_ip__contains=200.200   任意 Django lookup
+"""
+import base64
+import csv
+import datetime
+import decimal
+import json
+import re
+import uuid
+
+from django.core.exceptions import FieldError, ValidationError
+from django.core.management.base import CommandError
+from django.db.models import Q
+
+FORMATS = ('text', 'jsonl', 'csv')
+
+_WHERE_RE = re.compile(r'^\s*([A-Za-z_][\w]*)\s*(>=|<=|!=|=|>|<)\s*(.*)$')
+_OPERATORS = {'>=': '__gte', '<=': '__lte', '>': '__gt', '<': '__lt', '=': '', '!=': ''}
+
+
+def add_arguments(parser, chunk_size=500):
+    """给命令加上 --format、--where、--chunk-size、--limit 参数"""
+    parser.add_argument('--format', choices=FORMATS, default='text',
+                        help='Output format: text (default), jsonl or csv')
+    parser.add_argument('--where', action='append', default=[], metavar='EXPR',
+                        help="Filter such as status=success, id>=100, name!=x, ne_ip__contains=200 (repeatable)")
+    parser.add_argument('--chunk-size', type=int, default=chunk_size,
+                        help='Rows fetched from the database per query')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Stop after this many rows')
+
+
+def _value(lookup, value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    if lookup.endswith('__in'):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if lookup.endswith('__isnull'):
+        return value.lower() in ('1', 'true', 'yes')
+    if value.lower() == 'null':
+        return None
+    return value
+
+
+def parse_where(expressions):
+    """把 --where 表达式解析为 Q，格式错误时抛出 CommandError"""
+    condition = Q()
+    for expression in expressions or []:
+        match = _WHERE_RE.match(expression)
+        if not match:
+            raise CommandError(f"Invalid --where expression: {expression!r} (expected field=value)")
+        field, operator, value = match.groups()
+        lookup = field + _OPERATORS[operator]
+        term = Q(**{lookup: _value(lookup, value)})
+        condition &= ~term if operator == '!=' else term
+    return condition
+
+
+def filter_queryset(queryset, expressions):
+    """应用 --where 条件；字段不存在或值无法转换时抛出 CommandError"""
+    try:
+        return queryset.filter(parse_where(expressions))
+    except (FieldError, ValidationError, ValueError, TypeError) as e:
+        raise CommandError(f"Invalid --where: {str(e)}")
+
+
+def stream(queryset, chunk_size=500, limit=None):
+    """分批读取查询结果"""
+    if limit is not None:
+        queryset = queryset[:max(0, limit)]
+    return queryset.iterator(chunk_size=max(1, chunk_size or 500))
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, ensure_ascii=False, default=_default)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return _default(value)
+
+
+class RowWriter:
+    """按 jsonl 或 csv 逐行写出字典，csv 的表头为 fields"""
+
+    def __init__(self, stdout, fmt, fields):
+        self.stdout = stdout
+        self.fmt = fmt
+        self.fields = list(fields)
+        self.rows = 0
+        if fmt == 'csv':
+            self._csv = csv.writer(self, lineterminator='\n')
+            self._csv.writerow(self.fields)
+
+    def write(self, text):
+        # csv.writer 调用；BaseCommand 的 stdout 默认会补换行，这里不需要
+        self.stdout.write(text, ending='')
+
+    def write_row(self, row):
+        if self.fmt == 'csv':
+            self._csv.writerow([_cell(row.get(field)) for field in self.fields])
+        else:
+            self.stdout.write(json.dumps(row, ensure_ascii=False, default=_default))
+        self.rows += 1
@@ -0,0 +1,350 @@
+"""环境 NE 列表的批量导入导出
+
+支持两种格式：
+- csv：表头为 ne_env,ne_ip，每行一个 NE 地址、CIDR 或地址范围；
+- jsonl：每行一个 JSON 对象 {"ne_env": ..., "ne_ip": ...}，也可以是
+  {"ne_env": ..., "ne_ip_list": [...]}。
+
+导入分两遍流式读取文件，内存占用与文件大小无关：第一遍逐行解析和校验，
+有错误时不写入任何数据；第二遍在一个事务中按批 bulk_create 写入，最后版本
+加一、从数据库流式生成内容哈希和历史版本（见
+config_history.record_environment_changes）并通知各进程刷新配置缓存，
+失败时整体回滚。每条记录的校验与 ConfigSerializer 相同（models.clean_entry），
+导出的文件总能重新导入。
+mode 为 replace 时文件中出现的环境的 NE 列表被整体替换，append 时只追加
+新的 NE；文件中没有出现的环境不受影响。
+"""
+import csv
+import io
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from . import ipsets
+from .config_cache import invalidate as invalidate_config_cache
+from .config_history import record_environment_changes
+from .models import Config, ConfigEnvironment, EnvironmentIP, clean_entry
+
+logger = logging.getLogger('config_api')
+
+FORMATS = ('csv', 'jsonl')
+MODES = ('append', 'replace')
+CSV_HEADER = ('ne_env', 'ne_ip')
+
+
+class EnvImportError(Exception):
+    """导入文件校验失败，errors 为 [(行号, 错误信息)]"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def detect_format(filename, default=None):
+    """根据文件扩展名判断格式"""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
+
+
+def normalize_record(env, ip):
+    """校验并规范化一条记录，返回 (环境名, NE 地址或地址段)，非法时抛出 ValueError"""
+    env = str(env or '').strip()
+    ip = str(ip or '').strip()
+    if not env:
+        raise ValueError('ne_env is empty')
+    if len(env) > ConfigEnvironment._meta.get_field('name').max_length:
+        raise ValueError(f"ne_env is too long: {env[:20]}...")
+    return env, clean_entry(ip)
+
+
+def _text(stream):
+    # utf-8-sig 兼容 Excel 导出的带 BOM 的 CSV
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def iter_records(stream, fmt):
+    """逐行解析二进制文件流，产出 (行号, 环境名, NE 地址, 错误信息)，合法记录的错误信息为 None"""
+    text = _text(stream)
+    try:
+        if fmt == 'csv':
+            yield from _iter_csv(text)
+        elif fmt == 'jsonl':
+            yield from _iter_jsonl(text)
+        else:
+            raise EnvImportError(f"Unsupported format: {fmt}")
+    finally:
+        # 不关闭调用方的文件
+        text.detach()
+
+
+def _check(line_no, env, ip):
+    try:
+        env, ip = normalize_record(env, ip)
+    except ValueError as e:
+        return line_no, env, ip, str(e)
+    return line_no, env, ip, None
+
+
+def _iter_csv(text):
+    reader = csv.reader(text)
+    columns = None
+    for row in reader:
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if columns is None:
+            header = [cell.strip().lower() for cell in row]
+            if 'ne_env' in header and 'ne_ip' in header:
+                columns = (header.index('ne_env'), header.index('ne_ip'))
+                continue
+            # 没有表头时按 ne_env,ne_ip 的列顺序读取
+            columns = (0, 1)
+        if len(row) <= max(columns):
+            yield reader.line_num, '', '', f"Expected columns {','.join(CSV_HEADER)}"
+            continue
+        yield _check(reader.line_num, row[columns[0]], row[columns[1]])
+
+
+def _iter_jsonl(text):
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, '', '', f"Invalid JSON: {str(e)}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, '', '', 'Expected a JSON object'
+            continue
+        if 'ne_ip_list' in record:
+            ips = record['ne_ip_list']
+            if not isinstance(ips, list):
+                yield line_no, '', '', 'ne_ip_list must be a list'
+                continue
+            for ip in ips:
+                yield _check(line_no, record.get('ne_env'), ip)
+        else:
+            yield _check(line_no, record.get('ne_env'), record.get('ne_ip'))
+
+
+class ImportReport:
+    """导入统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.environments = []
+        self.errors = []
+        self.started = time.monotonic()
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'environments': self.environments,
+            'errors': [{'line': line_no, 'error': error} for line_no, error in self.errors],
+            'elapsed': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def import_env_ips(open_stream, fmt, mode='append', batch_size=None, skip_invalid=False,
+                   max_errors=100, progress=None):
+    """从 open_stream() 返回的二进制流导入环境 NE 列表，返回 ImportReport.as_dict()
+
+    open_stream 每次调用返回一个从头读取的新流（会被调用两次）。有非法记录且
+    skip_invalid 为 False 时抛出 EnvImportError，不写入任何数据。
+    progress(已写入行数, 总行数) 每写完一批调用一次。
+    """
+    if fmt not in FORMATS:
+        raise EnvImportError(f"Unsupported format: {fmt}")
+    if mode not in MODES:
+        raise EnvImportError(f"Unsupported mode: {mode}")
+    batch_size = batch_size or getattr(settings, 'ENV_IMPORT_BATCH_SIZE', 2000)
+    report = ImportReport()
+
+    # 第一遍：只校验，记录出现的环境（按首次出现的顺序）
+    environments = {}
+    with open_stream() as stream:
+        for line_no, env, ip, error in iter_records(stream, fmt):
+            if error:
+                report.invalid += 1
+                if len(report.errors) < max_errors:
+                    report.errors.append((line_no, error))
+                continue
+            report.rows += 1
+            environments.setdefault(env, None)
+    report.environments = list(environments)
+    if report.invalid and not skip_invalid:
+        raise EnvImportError(f"{report.invalid} invalid records, nothing imported", report.errors)
+
+    # 第二遍：在一个事务中分批写入
+    with transaction.atomic():
+        config = Config.objects.order_by('id').first()
+        if config is None:
+            config = Config()
+            config.save()
+        changes, positions, replaced = _prepare_environments(config, list(environments), mode)
+        env_ids = {name: change['environment_id'] for name, change in changes.items()}
+        touched = EnvironmentIP.objects.filter(environment_id__in=list(env_ids.values()))
+        before = touched.count()
+        written = 0
+        batch = []
+        with open_stream() as stream:
+            for _, env, ip, error in iter_records(stream, fmt):
+                if error:
+                    continue
+                batch.append(EnvironmentIP.for_entry(env_ids[env], ip, positions[env]))
+                positions[env] += 1
+                if len(batch) >= batch_size:
+                    written += _write_batch(batch)
+                    batch = []
+                    if progress:
+                        progress(written, report.rows)
+        if batch:
+            written += _write_batch(batch)
+            if progress:
+                progress(written, report.rows)
+        # 同一环境中已有或文件中重复的 NE 被忽略
+        report.inserted = touched.count() - before
+        report.duplicates = report.rows - report.inserted
+        _count_changes(changes, replaced)
+        record_environment_changes(
+            config, list(changes.values()), message=f"导入 NE 列表（{mode}）: {report.inserted} 个"
+        )
+        transaction.on_commit(invalidate_config_cache)
+    logger.info(f"环境 NE 列表导入完成: {report.as_dict()}")
+    return report.as_dict()
+
+
+def _prepare_environments(config, names, mode):
+    """确保环境存在并记录修改前的 NE 数
+
+    返回 ({环境名: 修改记录}, {环境名: 下一个位置}, {环境名: 暂存原 NE 列表的环境 id})。
+    replace 模式下原有的 NE 先移到一个临时环境，写入后用于统计增删的条目，
+    再随临时环境一起删除。
+    """
+    existing = {
+        environment.name: environment
+        for environment in ConfigEnvironment.objects.filter(config=config, name__in=names)
+    }
+    next_position = (ConfigEnvironment.objects.filter(config=config)
+                     .aggregate(value=Max('position'))['value'])
+    next_position = -1 if next_position is None else next_position
+    changes = {}
+    positions = {}
+    replaced = {}
+    for name in names:
+        environment = existing.get(name)
+        if environment is None:
+            next_position += 1
+            environment = ConfigEnvironment.objects.create(config=config, name=name, position=next_position)
+        ips = EnvironmentIP.objects.filter(environment=environment)
+        change = {
+            'environment_id': environment.id,
+            'name': name,
+            'created': name not in existing,
+            'replaced': mode == 'replace',
+            'old_count': ips.count(),
+            'added': 0,
+            'removed': 0,
+        }
+        changes[name] = change
+        if mode == 'replace':
+            if change['old_count']:
+                holder = ConfigEnvironment.objects.create(
+                    config=config, name=f"~import-{uuid.uuid4().hex}", position=next_position + 1
+                )
+                ips.update(environment=holder)
+                replaced[name] = holder.id
+            positions[name] = 0
+        else:
+            last = ips.aggregate(value=Max('position'))['value']
+            positions[name] = 0 if last is None else last + 1
+    return changes, positions, replaced
+
+
+def _count_changes(changes, replaced):
+    """统计每个环境新增和删除的 NE 数，并删除 replace 模式的临时环境"""
+    for name, change in changes.items():
+        current = EnvironmentIP.objects.filter(environment_id=change['environment_id'])
+        holder_id = replaced.get(name)
+        if holder_id is None:
+            change['added'] = current.count() - change['old_count']
+            continue
+        previous = EnvironmentIP.objects.filter(environment_id=holder_id)
+        change['added'] = current.exclude(ne_ip__in=previous.values('ne_ip')).count()
+        change['removed'] = previous.exclude(ne_ip__in=current.values('ne_ip')).count()
+        previous.delete()
+        ConfigEnvironment.objects.filter(id=holder_id).delete()
+
+
+def _write_batch(batch):
+    EnvironmentIP.objects.bulk_create(batch, ignore_conflicts=True)
+    return len(batch)
+
+
+def rewindable(fileobj):
+    """把已打开的文件包装成 import_env_ips 需要的 open_stream：每次从头读取，不关闭文件"""
+    @contextmanager
+    def open_stream():
+        fileobj.seek(0)
+        yield fileobj
+    return open_stream
+
+
+def export_env_ips(fmt, environments=None, chunk_size=2000, expand=False):
+    """按环境顺序、NE 顺序流式导出当前配置的 NE 列表，产出文本块
+
+    expand 为 True 时把 CIDR 和范围展开成单个地址（逐个生成，不占额外内存）；
+    超过 ENV_EXPORT_EXPAND_MAX 个地址的地址段不展开，按原样导出。
+    """
+    if fmt not in FORMATS:
+        raise EnvImportError(f"Unsupported format: {fmt}")
+    config = Config.objects.order_by('id').first()
+    if config is None:
+        rows = EnvironmentIP.objects.none()
+    else:
+        rows = EnvironmentIP.objects.filter(environment__config=config)
+        if environments:
+            rows = rows.filter(environment__name__in=environments)
+    rows = (rows.order_by('environment__position', 'environment_id', 'position', 'id')
+            .values_list('environment__name', 'ne_ip').iterator(chunk_size=chunk_size))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(CSV_HEADER)
+    if expand:
+        max_block = getattr(settings, 'ENV_EXPORT_EXPAND_MAX', 65536)
+        rows = ((env, address) for env, entry in rows
+                for address in ipsets.iter_addresses([entry], max_block=max_block))
+    count = 0
+    for env, ip in rows:
+        if fmt == 'csv':
+            writer.writerow((env, ip))
+        else:
+            buffer.write(json.dumps({'ne_env': env, 'ne_ip': ip}, ensure_ascii=False))
+            buffer.write('\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,81 @@
+"""构建实时事件推送
+
+日志写入和状态变化时向 Channels 分组广播，由 consumers.BuildLogConsumer
+推送给打开构建页面的客户端。
+
+执行器的工作线程不在 ASGI 服务的事件循环中。InMemoryChannelLayer 的队列
+属于该事件循环且不是线程安全的，因此 consumer 连接时记录事件循环，
+工作线程把 group_send 交给这个事件循环执行，而不是另起一个事件循环。
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger('config_api')
+
+# 等待事件循环完成一次推送的最长时间（秒）
+SEND_TIMEOUT = 5
+
+_server_loop = None
+
+
+def bind_loop(loop=None):
+    """记录 ASGI 服务的事件循环，consumer 在 connect 中调用"""
+    global _server_loop
+    _server_loop = loop or asyncio.get_running_loop()
+
+
+def build_group_name(build_id):
+    return f'build_{build_id}'
+
+
+def publish_build_logs(build_id, logs, task_id=None):
+    """广播新写入的 BuildLog
+
+    task_id 不为空时同时发送到 start_upgrade 任务的 upgrade_log 分组。
+    """
+    if not logs:
+        return
+    from .serializers import BuildLogSerializer
+    _group_send(build_group_name(build_id), {
+        'type': 'build.logs',
+        'logs': BuildLogSerializer(logs, many=True).data,
+    })
+    if task_id:
+        _group_send(f'upgrade_log_{task_id}', {
+            'type': 'upgrade_log',
+            'message': '\n'.join(log.message for log in logs),
+        })
+
+
+def publish_build_status(build_id, status):
+    """广播构建状态变化"""
+    _group_send(build_group_name(build_id), {
+        'type': 'build.status',
+        'status': status,
+    })
+
+
+def _group_send(group, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    loop = _server_loop
+    try:
+        if loop is not None and loop.is_running() and not _in_loop(loop):
+            # 在服务的事件循环中执行并等待完成，保证同一构建的消息按顺序到达
+            future = asyncio.run_coroutine_threadsafe(channel_layer.group_send(group, message), loop)
+            future.result(timeout=SEND_TIMEOUT)
+        else:
+            async_to_sync(channel_layer.group_send)(group, message)
+    except Exception as e:
+        logger.error(f"推送消息失败 group={group}: {str(e)}")
+
+
+def _in_loop(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
@@ -0,0 +1,230 @@
+"""升级任务执行器
+
+固定数量的工作线程从持久化队列（jobs.UpgradeJob）领取任务执行，
+替代每个构建单独启动一个线程。排队任务数有上限，执行中的任务由心跳
+线程续约；进程重启后过期租约的任务会被重新排队。
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import jobs
+from .cancel import cancel_build
+from .models import UpgradeJob
+from .retention import start_retention_scheduler
+from .runner import run_job
+
+logger = logging.getLogger('config_api')
+
+
+class ExecutorFull(Exception):
+    """等待队列已满"""
+
+
+class ExecutorShutdown(Exception):
+    """执行器已关闭，不再接收新任务"""
+
+
+class UpgradeExecutor:
+    """有界升级线程池"""
+
+    def __init__(self, runner, max_workers=4, max_queue=100, lease_seconds=60,
+                 poll_interval=2.0, max_attempts=2, cancel_poll_interval=2.0, name='upgrade'):
+        self.runner = runner
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.lease_seconds = max(3, int(lease_seconds))
+        self.poll_interval = float(poll_interval)
+        self.max_attempts = max(1, int(max_attempts))
+        self.cancel_poll_interval = float(cancel_poll_interval)
+        self.name = name
+        self.owner = jobs.worker_identity()
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._running = {}
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._accepting = False
+        self._workers = []
+        self._heartbeat = None
+
+    def start(self):
+        """恢复中断的任务并启动工作线程与心跳线程"""
+        if self._accepting:
+            return
+        try:
+            # 本机上次运行的实例已退出，它持有的任务不必等租约过期
+            jobs.recover_orphaned_jobs(self.max_attempts, self.max_queue, local_owner=self.owner)
+        except Exception as e:
+            logger.error(f"恢复中断的升级任务失败: {str(e)}")
+        finally:
+            close_old_connections()
+        self._accepting = True
+        for index in range(self.max_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name}-worker-{index}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._heartbeat = threading.Thread(
+            target=self._heartbeat_loop, name=f"{self.name}-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+        logger.info(f"升级执行器已启动: owner={self.owner}, workers={self.max_workers}, max_queue={self.max_queue}")
+
+    def submit(self, build, task_id=None, priority=None):
+        """为构建创建排队任务并唤醒空闲工作线程，队列已满时抛出 ExecutorFull"""
+        if not self._accepting:
+            raise ExecutorShutdown(f"Executor {self.name} is shutting down")
+        try:
+            job = jobs.enqueue_build(build, self.max_queue, task_id=task_id, priority=priority)
+        except jobs.QueueFull as e:
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorFull(str(e))
+        with self._lock:
+            self._submitted += 1
+        logger.info(f"任务已入队: build_id={build.id}, job_id={job.id}, "
+                    f"environment={job.environment or '-'}, priority={job.get_priority_display()}")
+        # 在事务提交后再唤醒工作线程，否则可能读不到新任务
+        transaction.on_commit(self.notify)
+        return job
+
+    def notify(self):
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _worker_loop(self):
+        while self._accepting:
+            try:
+                job = jobs.claim_next_job(self.owner, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"领取升级任务失败: {str(e)}")
+                job = None
+            if job is None:
+                close_old_connections()
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            started_at = time.monotonic()
+            with self._lock:
+                self._running[job.id] = job.build_id
+            logger.info(f"开始执行任务: job_id={job.id}, build_id={job.build_id}, 第 {job.attempts} 次")
+            try:
+                self.runner(job)
+            except Exception as e:
+                logger.error(f"执行任务异常 job_id={job.id}: {str(e)}")
+                with self._lock:
+                    self._failed += 1
+            finally:
+                try:
+                    jobs.complete_job(job.id, self.owner)
+                except Exception as e:
+                    logger.error(f"释放任务租约失败 job_id={job.id}: {str(e)}")
+                close_old_connections()
+                with self._lock:
+                    self._running.pop(job.id, None)
+                    self._completed += 1
+                logger.info(f"任务执行结束: job_id={job.id}, 耗时 {time.monotonic() - started_at:.3f}s")
+
+    def _heartbeat_loop(self):
+        """为执行中的任务续约，回收其他进程遗留的过期任务，并同步跨进程的停止请求"""
+        interval = self.lease_seconds / 3
+        tick = max(0.1, min(interval, self.cancel_poll_interval))
+        last_renew = time.monotonic()
+        while self._accepting or self._running:
+            time.sleep(tick)
+            with self._lock:
+                running = dict(self._running)
+            try:
+                if running:
+                    for job_id, build_id in UpgradeJob.objects.filter(
+                            id__in=list(running), cancel_requested=True).values_list('id', 'build_id'):
+                        cancel_build(build_id, "构建已被停止")
+                if time.monotonic() - last_renew < interval:
+                    continue
+                last_renew = time.monotonic()
+                jobs.renew_leases(self.owner, list(running), self.lease_seconds)
+                if self._accepting and jobs.recover_orphaned_jobs(self.max_attempts, self.max_queue)['requeued']:
+                    self.notify()
+            except Exception as e:
+                logger.error(f"升级任务心跳失败: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def stats(self):
+        """队列深度与线程利用率"""
+        queue_depth = UpgradeJob.objects.filter(state='queued').count()
+        with self._lock:
+            busy = len(self._running)
+            return {
+                'owner': self.owner,
+                'accepting': self._accepting,
+                'max_workers': self.max_workers,
+                'busy_workers': busy,
+                'idle_workers': self.max_workers - busy,
+                'utilization': round(busy / self.max_workers, 3),
+                'queue_depth': queue_depth,
+                'max_queue': self.max_queue,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'running': [str(build_id) for build_id in self._running.values()],
+            }
+
+    def shutdown(self, wait=True, timeout=None):
+        """停止领取新任务并等待执行中的任务完成
+
+        未领取的任务保留在数据库队列中，下次启动后继续执行。
+        """
+        if not self._accepting:
+            return
+        self._accepting = False
+        with self._wakeup:
+            self._wakeup.notify_all()
+        logger.info(f"升级执行器开始关闭, 执行中任务: {len(self._running)}")
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for worker in self._workers:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                worker.join(remaining)
+            if any(worker.is_alive() for worker in self._workers):
+                logger.warning("升级执行器关闭超时, 未完成的任务将在租约过期后重新排队")
+                return
+        logger.info("升级执行器已关闭")
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """获取进程内共享的升级执行器（首次使用时创建并启动）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = UpgradeExecutor(
+                run_job,
+                max_workers=getattr(settings, 'UPGRADE_MAX_WORKERS', 4),
+                max_queue=getattr(settings, 'UPGRADE_MAX_QUEUE', 100),
+                lease_seconds=getattr(settings, 'UPGRADE_JOB_LEASE_SECONDS', 60),
+                max_attempts=getattr(settings, 'UPGRADE_JOB_MAX_ATTEMPTS', 2),
+                cancel_poll_interval=getattr(settings, 'UPGRADE_CANCEL_POLL_SECONDS', 2),
+            )
+            _executor.start()
+            start_retention_scheduler()
+            atexit.register(
+                _executor.shutdown,
+                wait=True,
+                timeout=getattr(settings, 'UPGRADE_SHUTDOWN_TIMEOUT', 30)
+            )
+        return _executor
@@ -0,0 +1,235 @@
+"""NE 地址段
+
+环境中的一项可以是单个地址、CIDR（10.0.0.0/24）或地址范围
+（10.0.0.1-10.0.0.50），每项按区间 [起始, 结束] 保存，一个 /16 只占一行。
+IntervalIndex 把所有环境的区间切分成互不重叠的有序片段，用二分查找在
+O(log n) 内回答“某个地址属于哪些环境”和“某个地址段与哪些环境重叠”。
+需要逐个地址时用 iter_addresses 按需展开，不会一次生成整个列表。
+"""
+import bisect
+import heapq
+import ipaddress
+from collections import namedtuple
+
+# 数据库中区间端点保存为定长十六进制字符串，字符串顺序与数值顺序一致
+KEY_WIDTH = 32
+
+IPBlock = namedtuple('IPBlock', ['version', 'first', 'last'])
+
+
+def _address(text):
+    return ipaddress.ip_address(text.strip())
+
+
+def parse_entry(entry):
+    """把单个地址、CIDR 或范围解析为 IPBlock，无法解析时抛出 ValueError"""
+    text = str(entry or '').strip()
+    if '/' in text:
+        try:
+            network = ipaddress.ip_network(text, strict=False)
+        except ValueError:
+            raise ValueError(f"Invalid CIDR: {text[:64]!r}")
+        return IPBlock(network.version, int(network.network_address), int(network.broadcast_address))
+    if '-' in text:
+        start, _, end = text.partition('-')
+        try:
+            first, last = _address(start), _address(end)
+        except ValueError:
+            raise ValueError(f"Invalid address range: {text[:64]!r}")
+        if first.version != last.version:
+            raise ValueError(f"Address range mixes IPv4 and IPv6: {text[:64]!r}")
+        if first > last:
+            raise ValueError(f"Address range is reversed: {text[:64]!r}")
+        return IPBlock(first.version, int(first), int(last))
+    try:
+        address = _address(text)
+    except ValueError:
+        raise ValueError(f"Invalid ne_ip: {text[:64]!r}")
+    return IPBlock(address.version, int(address), int(address))
+
+
+def block_text(block):
+    """IPBlock 的规范写法：单个地址、能表示成 CIDR 时用 CIDR，否则为 起始-结束"""
+    first = ipaddress.ip_address(block.first) if block.version == 4 else ipaddress.IPv6Address(block.first)
+    if block.first == block.last:
+        return str(first)
+    last = ipaddress.ip_address(block.last) if block.version == 4 else ipaddress.IPv6Address(block.last)
+    networks = list(ipaddress.summarize_address_range(first, last))
+    if len(networks) == 1:
+        return str(networks[0])
+    return f"{first}-{last}"
+
+
+def normalize_entry(entry):
+    """校验并返回规范写法，非法时抛出 ValueError"""
+    return block_text(parse_entry(entry))
+
+
+def looks_like_block(entry):
+    """是否像是地址、CIDR 或范围（其余内容例如主机名按原样保存）"""
+    text = str(entry or '').strip()
+    if '/' in text:
+        return True
+    start, sep, end = text.partition('-')
+    candidates = (start, end) if sep else (text,)
+    for candidate in candidates:
+        try:
+            _address(candidate)
+        except ValueError:
+            continue
+        return True
+    return False
+
+
+def try_parse(entry):
+    """能解析时返回 IPBlock，否则返回 None"""
+    try:
+        return parse_entry(entry)
+    except ValueError:
+        return None
+
+
+def to_key(value):
+    return format(value, f'0{KEY_WIDTH}x')
+
+
+def from_key(key):
+    return int(key, 16)
+
+
+def _merge(blocks):
+    """合并重叠或相邻的区间，返回 {版本: [(起始, 结束)]}"""
+    merged = {}
+    for version, first, last in sorted(blocks):
+        intervals = merged.setdefault(version, [])
+        if intervals and first <= intervals[-1][1] + 1:
+            if last > intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], last)
+        else:
+            intervals.append((first, last))
+    return merged
+
+
+def iter_merged(blocks):
+    """合并按 (版本, 起始) 排好序的 IPBlock 中重叠或相邻的区间，逐个产出，不占额外内存"""
+    current = None
+    for block in blocks:
+        if current is not None and block.version == current.version and block.first <= current.last + 1:
+            if block.last > current.last:
+                current = IPBlock(current.version, current.first, block.last)
+            continue
+        if current is not None:
+            yield current
+        current = block
+    if current is not None:
+        yield current
+
+
+def iter_addresses(entries, max_block=None):
+    """按需逐个展开地址（字符串），重叠的部分只出现一次
+
+    无法解析的项，以及超过 max_block 个地址的地址段（例如 IPv6 /64）原样产出。
+    """
+    blocks = []
+    for entry in entries:
+        block = try_parse(entry)
+        if block is None or (max_block and block.last - block.first + 1 > max_block):
+            yield str(entry)
+        else:
+            blocks.append(block)
+    for version, intervals in sorted(_merge(blocks).items()):
+        factory = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        for first, last in intervals:
+            for value in range(first, last + 1):
+                yield str(factory(value))
+
+
+def compact(entries):
+    """把地址列表合并成尽量少的规范写法，例如 256 个连续地址变成一个 /24"""
+    literals = []
+    blocks = []
+    for entry in entries:
+        block = try_parse(entry)
+        if block is None:
+            literals.append(str(entry))
+        else:
+            blocks.append(block)
+    result = []
+    for version, intervals in sorted(_merge(blocks).items()):
+        result.extend(block_text(IPBlock(version, first, last)) for first, last in intervals)
+    return result + literals
+
+
+def address_count(entries):
+    """地址段包含的地址总数（重叠部分只计一次）"""
+    blocks = [block for block in map(try_parse, entries) if block is not None]
+    return sum(last - first + 1 for intervals in _merge(blocks).values() for first, last in intervals)
+
+
+class IntervalIndex:
+    """多个环境的地址区间索引
+
+    所有区间的端点把地址空间切成互不重叠的片段，每个片段记录覆盖它的
+    (sort_key, 所有者)。查询时对片段起点二分查找。
+    """
+
+    def __init__(self, items=()):
+        # items: (IPBlock, sort_key, owner)
+        by_version = {}
+        for block, sort_key, owner in items:
+            by_version.setdefault(block.version, []).append((block.first, block.last, sort_key, owner))
+        self._starts = {}
+        self._ends = {}
+        self._owners = {}
+        self.size = 0
+        for version, intervals in by_version.items():
+            self._build(version, intervals)
+            self.size += len(intervals)
+
+    def _build(self, version, intervals):
+        intervals.sort(key=lambda item: item[0])
+        starts, ends, owners = [], [], []
+        active = []  # (结束, 序号, sort_key, owner)
+        points = sorted({first for first, _, _, _ in intervals} | {last + 1 for _, last, _, _ in intervals})
+        index = 0
+        for position, point in enumerate(points[:-1]):
+            while index < len(intervals) and intervals[index][0] == point:
+                first, last, sort_key, owner = intervals[index]
+                heapq.heappush(active, (last, index, sort_key, owner))
+                index += 1
+            while active and active[0][0] < point:
+                heapq.heappop(active)
+            if not active:
+                continue
+            segment_owners = tuple(sorted({(sort_key, owner) for _, _, sort_key, owner in active}))
+            segment_end = points[position + 1] - 1
+            if owners and owners[-1] == segment_owners and ends[-1] + 1 == point:
+                ends[-1] = segment_end
+            else:
+                starts.append(point)
+                ends.append(segment_end)
+                owners.append(segment_owners)
+        self._starts[version] = starts
+        self._ends[version] = ends
+        self._owners[version] = owners
+
+    def owners_of(self, block):
+        """与地址段（单个地址即包含它）重叠的所有者，按 sort_key 排序去重"""
+        starts = self._starts.get(block.version)
+        if not starts:
+            return []
+        ends = self._ends[block.version]
+        owners = self._owners[block.version]
+        index = bisect.bisect_right(starts, block.first) - 1
+        if index < 0 or ends[index] < block.first:
+            index += 1
+        result = set()
+        while index < len(starts) and starts[index] <= block.last:
+            result.update(owners[index])
+            if block.first == block.last:
+                break
+            index += 1
+        return [owner for _, owner in sorted(result)]
+
+    def contains(self, address):
+        return bool(self.owners_of(parse_entry(address)))
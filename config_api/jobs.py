@@ -0,0 +1,223 @@
+"""持久化升级任务队列
+
+每个待执行的构建对应一条 UpgradeJob。工作线程通过条件 UPDATE 原子领取任务
+并持有带过期时间的租约，执行期间定期续约。进程异常退出后租约过期，
+recover_orphaned_jobs 会把任务重新排队或判定失败，不会丢任务也不会留下
+永远 in_progress 的构建。执行器启动时还会立即回收本机上已退出的旧实例
+持有的任务，不必等它们的租约过期。
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import scheduling
+from .models import Build, BuildLog, BuildTarget, UpgradeJob
+from .stats import record_build
+
+logger = logging.getLogger('config_api')
+
+
+class QueueFull(Exception):
+    """排队中的任务数已达上限"""
+
+
+def _boot_id():
+    """本机本次开机的标识，无法读取时为空"""
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return f.read().strip()[:8]
+    except OSError:
+        return ''
+
+
+def worker_identity():
+    """当前进程的租约持有者标识：主机名:进程号:开机标识"""
+    return f"{socket.gethostname()}:{os.getpid()}:{_boot_id()}"
+
+
+def _parse_owner(owner):
+    """拆分租约持有者标识，返回 (主机名, 进程号, 开机标识)；旧格式 主机名:进程号 没有开机标识"""
+    host, _, rest = (owner or '').partition(':')
+    pid, _, boot_id = rest.partition(':')
+    try:
+        return host, int(pid), boot_id
+    except ValueError:
+        return host, None, boot_id
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 没有权限发送信号，进程存在
+        return True
+    return True
+
+
+def is_dead_local_owner(owner, identity):
+    """owner 是否为本机上已经退出的执行器实例，identity 为当前实例的标识
+
+    只在执行器启动、尚未领取任务时调用：与当前标识相同的持有者只可能是
+    进程号相同的上一个实例（例如容器重启）。
+    """
+    host, pid, boot_id = _parse_owner(identity)
+    owner_host, owner_pid, owner_boot_id = _parse_owner(owner)
+    if not host or owner_host != host or owner_pid is None:
+        return False
+    if owner == identity:
+        return True
+    if boot_id and owner_boot_id and owner_boot_id != boot_id:
+        # 主机重启过，之前的进程都已退出
+        return True
+    return owner_pid != pid and not _pid_alive(owner_pid)
+
+
+def enqueue_build(build, max_queue, task_id=None, priority=None):
+    """为构建创建排队任务，队列已满时抛出 QueueFull"""
+    if UpgradeJob.objects.filter(state='queued').count() >= max_queue:
+        raise QueueFull(f"Upgrade queue is full ({max_queue} pending)")
+    return UpgradeJob.objects.create(
+        build=build,
+        task_id=task_id,
+        priority=scheduling.DEFAULT_PRIORITY if priority is None else priority,
+        environment=scheduling.resolve_environment(build.get_ne_ips())
+    )
+
+
+def claim_next_job(owner, lease_seconds):
+    """按调度顺序原子领取一个排队任务，没有可领取的任务（或所在环境都已满）时返回 None"""
+    queued = list(UpgradeJob.objects.filter(state='queued').values('id', 'priority', 'environment', 'created_at'))
+    if not queued:
+        return None
+    for job in scheduling.ordered_candidates(queued, scheduling.running_by_environment()):
+        now = timezone.now()
+        # 条件更新保证同一任务只会被一个工作线程领取，且领取时所在环境仍未满
+        candidate = UpgradeJob.objects.filter(id=job['id'], state='queued')
+        cap = scheduling.environment_cap(job['environment'])
+        if cap:
+            running = (UpgradeJob.objects.filter(state='leased', environment=job['environment'])
+                       .order_by().values('environment').annotate(count=Count('id')).values('count'))
+            candidate = candidate.alias(running=Coalesce(Subquery(running), 0)).filter(running__lt=cap)
+        claimed = candidate.update(
+            state='leased',
+            owner=owner,
+            attempts=F('attempts') + 1,
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            updated_at=now
+        )
+        if claimed:
+            scheduling.mark_served(job['environment'])
+            return UpgradeJob.objects.get(id=job['id'])
+    return None
+
+
+def renew_leases(owner, job_ids, lease_seconds):
+    """为仍在执行的任务续约"""
+    if not job_ids:
+        return 0
+    now = timezone.now()
+    return UpgradeJob.objects.filter(id__in=job_ids, state='leased', owner=owner).update(
+        heartbeat_at=now,
+        lease_expires_at=now + timedelta(seconds=lease_seconds)
+    )
+
+
+def complete_job(job_id, owner):
+    """任务执行结束，释放租约"""
+    return UpgradeJob.objects.filter(id=job_id, state='leased', owner=owner).update(
+        state='done', lease_expires_at=None, updated_at=timezone.now()
+    )
+
+
+def recover_orphaned_jobs(max_attempts, max_queue, local_owner=None):
+    """处理租约已过期的任务和没有任务记录的构建
+
+    local_owner 为刚启动的执行器的标识：本机上已退出的旧实例持有的任务
+    （见 is_dead_local_owner）即使租约未过期也一并回收。
+
+    - 租约过期且未超过最大尝试次数的任务重新排队，已成功的 NE 不会重复升级
+    - 超过最大尝试次数的任务及其构建判定为失败
+    - 没有任务记录的 in_progress 构建判定为失败，pending 构建补建任务
+    返回 {'requeued', 'failed', 'ghosts'}
+    """
+    now = timezone.now()
+    result = {'requeued': 0, 'failed': 0, 'ghosts': 0}
+    orphaned = Q(lease_expires_at__lt=now)
+    if local_owner:
+        orphaned |= Q(owner__startswith=f"{_parse_owner(local_owner)[0]}:")
+    expired = [
+        job for job in UpgradeJob.objects.filter(orphaned, state='leased')
+        if (job.lease_expires_at is not None and job.lease_expires_at < now)
+        or (local_owner and is_dead_local_owner(job.owner, local_owner))
+    ]
+    for job in expired:
+        with transaction.atomic():
+            if job.attempts < max_attempts:
+                taken = UpgradeJob.objects.filter(id=job.id, state='leased', owner=job.owner).update(
+                    state='queued', owner='', lease_expires_at=None, updated_at=now
+                )
+                if not taken:
+                    continue
+                Build.objects.filter(id=job.build_id, status='in_progress').update(
+                    status='pending', updated_at=now
+                )
+                BuildTarget.objects.filter(build_id=job.build_id, status='in_progress').update(
+                    status='pending', started_at=None
+                )
+                BuildLog.objects.create(
+                    build_id=job.build_id,
+                    message=f"升级进程 {job.owner} 已中断，任务重新排队（已尝试 {job.attempts} 次）",
+                    log_type='warning'
+                )
+                result['requeued'] += 1
+            else:
+                taken = UpgradeJob.objects.filter(id=job.id, state='leased', owner=job.owner).update(
+                    state='done', lease_expires_at=None, updated_at=now
+                )
+                if not taken:
+                    continue
+                _fail_build(job.build_id, f"升级进程 {job.owner} 已中断，超过最大尝试次数 {max_attempts}，任务失败")
+                result['failed'] += 1
+
+    # 没有任务记录的构建：基线版本遗留的或创建后未来得及入队的
+    ghosts = Build.objects.filter(status__in=('pending', 'in_progress'), job__isnull=True)
+    for build in ghosts.only('id', 'status'):
+        if build.status == 'in_progress':
+            _fail_build(build.id, "升级进程已中断，任务记录丢失，任务失败")
+        else:
+            try:
+                with transaction.atomic():
+                    enqueue_build(build, max_queue)
+            except QueueFull:
+                break
+            except IntegrityError:
+                # 并发的请求已经为它创建了任务
+                continue
+        result['ghosts'] += 1
+
+    if any(result.values()):
+        logger.warning(f"已恢复中断的升级任务: {result}")
+    return result
+
+
+def _fail_build(build_id, message):
+    now = timezone.now()
+    with transaction.atomic():
+        failed = Build.objects.filter(id=build_id, status__in=('pending', 'in_progress')).update(
+            status='failed', updated_at=now
+        )
+        if failed:
+            transaction.on_commit(lambda: record_build(build_id))
+        BuildTarget.objects.filter(build_id=build_id, status__in=('pending', 'in_progress')).update(
+            status='failed', message=message[:500], finished_at=now
+        )
+        BuildLog.objects.create(build_id=build_id, message=message, log_type='error')
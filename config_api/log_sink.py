@@ -0,0 +1,223 @@
+"""升级日志缓冲写入
+
+升级脚本的每行回调先进入按构建划分的缓冲区，达到条数或时间阈值后
+用一次 bulk_create 写入 BuildLog，避免每行一个 SQLite 事务。
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .events import publish_build_logs
+from .models import BuildLog
+
+logger = logging.getLogger('config_api')
+
+
+class LogSinkMetrics:
+    """所有日志缓冲区的累计指标"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    def record_flush(self, rows, latency):
+        with self._lock:
+            self.flushes += 1
+            self.flushed_rows += rows
+            self.total_latency += latency
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_error(self):
+        with self._lock:
+            self.flush_errors += 1
+
+    def record_dropped(self, count):
+        with self._lock:
+            self.dropped += count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'flushes': self.flushes,
+                'flushed_rows': self.flushed_rows,
+                'flush_errors': self.flush_errors,
+                'dropped': self.dropped,
+                'avg_flush_ms': round(self.total_latency / self.flushes * 1000, 3) if self.flushes else 0.0,
+                'max_flush_ms': round(self.max_latency * 1000, 3),
+                'last_flush_ms': round(self.last_latency * 1000, 3),
+            }
+
+
+metrics = LogSinkMetrics()
+
+
+class BuildLogSink:
+    """单个构建的日志缓冲区"""
+
+    def __init__(self, build_id, batch_size=200, flush_interval=1.0, max_backlog=10000, task_id=None):
+        self.build_id = build_id
+        self.task_id = task_id
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.max_backlog = max(self.batch_size, int(max_backlog))
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.closed = False
+        self.dropped = 0
+
+    @property
+    def backlog(self):
+        return len(self._buffer)
+
+    def write(self, message, log_type='info', target_id=None):
+        """缓冲一条日志，达到阈值时立即写入"""
+        if self.closed:
+            logger.warning(f"日志缓冲区已关闭，丢弃日志 [{self.build_id}]: {message}")
+            self._drop(1)
+            return
+        with self._lock:
+            self._buffer.append(BuildLog(
+                build_id=self.build_id, target_id=target_id, message=message, log_type=log_type
+            ))
+            overflow = len(self._buffer) - self.max_backlog
+            for _ in range(max(0, overflow)):
+                self._buffer.popleft()
+            due = (len(self._buffer) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if overflow > 0:
+            self._drop(overflow)
+        if due:
+            self.flush()
+
+    def is_stale(self):
+        return bool(self._buffer) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """将缓冲区写入数据库，返回写入的 BuildLog 列表"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                return []
+            started = time.perf_counter()
+            try:
+                created = BuildLog.objects.bulk_create(batch)
+            except Exception as e:
+                logger.error(f"批量保存日志失败 [{self.build_id}]: {str(e)}")
+                metrics.record_error()
+                # 写入失败的日志放回缓冲区头部，超出上限的部分计入丢弃
+                with self._lock:
+                    self._buffer.extendleft(reversed(batch))
+                    overflow = len(self._buffer) - self.max_backlog
+                    for _ in range(max(0, overflow)):
+                        self._buffer.popleft()
+                if overflow > 0:
+                    self._drop(overflow)
+                return []
+            latency = time.perf_counter() - started
+            self._last_flush = time.monotonic()
+            metrics.record_flush(len(created), latency)
+            publish_build_logs(self.build_id, created, task_id=self.task_id)
+            return created
+
+    def close(self):
+        """写入剩余日志并注销缓冲区"""
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            _unregister(self)
+        if self._buffer:
+            logger.error(f"日志缓冲区关闭时仍有 {len(self._buffer)} 条未写入 [{self.build_id}]")
+            self._drop(len(self._buffer))
+            self._buffer.clear()
+
+    def _drop(self, count):
+        self.dropped += count
+        metrics.record_dropped(count)
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+_flusher = None
+
+
+def open_sink(build_id, task_id=None):
+    """为构建创建日志缓冲区，并确保后台定时刷新线程已启动"""
+    sink = BuildLogSink(
+        build_id,
+        task_id=task_id,
+        batch_size=getattr(settings, 'BUILD_LOG_BATCH_SIZE', 200),
+        flush_interval=getattr(settings, 'BUILD_LOG_FLUSH_INTERVAL', 1.0),
+        max_backlog=getattr(settings, 'BUILD_LOG_MAX_BACKLOG', 10000),
+    )
+    with _sinks_lock:
+        _sinks[build_id] = sink
+    _ensure_flusher(sink.flush_interval)
+    return sink
+
+
+def get_sink(build_id):
+    with _sinks_lock:
+        return _sinks.get(build_id)
+
+
+def flush_sink(build_id):
+    """立即写入指定构建缓冲中的日志（如果存在）"""
+    sink = get_sink(build_id)
+    if sink is not None:
+        sink.flush()
+
+
+def _unregister(sink):
+    with _sinks_lock:
+        if _sinks.get(sink.build_id) is sink:
+            del _sinks[sink.build_id]
+
+
+def _ensure_flusher(interval):
+    global _flusher
+    with _sinks_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(
+                target=_flush_loop, args=(interval,), name='build-log-flusher', daemon=True
+            )
+            _flusher.start()
+
+
+def _flush_loop(interval):
+    """定时写入长时间没有新日志的缓冲区"""
+    # 以半个刷新间隔巡检，日志最多延迟约 1.5 个间隔落库
+    tick = max(0.05, interval / 2)
+    while True:
+        time.sleep(tick)
+        with _sinks_lock:
+            sinks = list(_sinks.values())
+        for sink in sinks:
+            if sink.is_stale():
+                sink.flush()
+        close_old_connections()
+
+
+def sink_stats():
+    """日志写入延迟、积压与丢弃统计"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    data = metrics.snapshot()
+    data['active_sinks'] = len(sinks)
+    data['backlog'] = sum(sink.backlog for sink in sinks)
+    return data
@@ -9,5 +9,9 @@ class Command(BaseCommand):
         config.set_upgrade_type(['force', 'force_sonet', 'cold-reset'])
         config.set_work_type(['multi_process', 'single_process'])
         config.set_env_ip_map({'CES': ['200.200.18.101', '200.200.18.102']})
+        duplicate = config.find_duplicate()
+        if duplicate is not None:
+            self.stdout.write(f"Test configuration already exists: ID {duplicate.id}")
+            return
         config.save()
         self.stdout.write(self.style.SUCCESS('Successfully added test configuration'))
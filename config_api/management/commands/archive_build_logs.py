@@ -0,0 +1,68 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from config_api.archive import ARCHIVABLE_STATUSES, archive_build_logs
+from config_api.models import Build
+
+class Command(BaseCommand):
+    help = 'Compress the log lines of completed builds into archived segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=0,
+                            help='Only archive builds finished at least this many days ago')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Log lines per compressed segment')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Builds fetched per query')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Run VACUUM afterwards to return freed pages to the filesystem')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        db_path = settings.DATABASES['default']['NAME']
+        size_before = os.path.getsize(db_path) if os.path.exists(db_path) else None
+
+        totals = {'builds': 0, 'lines': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+        last_id = 0
+        while True:
+            build_ids = list(
+                Build.objects.filter(
+                    id__gt=last_id, status__in=ARCHIVABLE_STATUSES, updated_at__lte=cutoff
+                ).order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not build_ids:
+                break
+            last_id = build_ids[-1]
+            for build_id in build_ids:
+                result = archive_build_logs(build_id, chunk_size=options['chunk_size'])
+                if result['lines']:
+                    totals['builds'] += 1
+                    totals['lines'] += result['lines']
+                    totals['raw_bytes'] += result['raw_bytes']
+                    totals['compressed_bytes'] += result['compressed_bytes']
+                    self.stdout.write(
+                        f"Build #{build_id}: {result['lines']} lines, "
+                        f"{result['raw_bytes']} -> {result['compressed_bytes']} bytes"
+                    )
+
+        saved = totals['raw_bytes'] - totals['compressed_bytes']
+        self.stdout.write(
+            f"Archived {totals['lines']} lines from {totals['builds']} builds, "
+            f"{totals['raw_bytes']} -> {totals['compressed_bytes']} bytes ({saved} bytes saved)"
+        )
+
+        if options['vacuum'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM;')
+            if size_before is not None:
+                size_after = os.path.getsize(db_path)
+                self.stdout.write(
+                    f"Database file: {size_before} -> {size_after} bytes "
+                    f"({size_before - size_after} bytes reclaimed)"
+                )
+        self.stdout.write(self.style.SUCCESS('Build log archiving completed'))
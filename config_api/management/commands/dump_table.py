@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.exceptions import FieldError
+from django.core.management.base import BaseCommand, CommandError
+
+from config_api import dump
+
+class Command(BaseCommand):
+    help = 'Stream the rows of a config_api table, e.g. dump_table Build --where status=failed --format csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model name, e.g. Build, BuildLog, Device')
+        parser.add_argument('--fields', default=None,
+                            help='Comma separated columns (default: all concrete fields; related fields via __)')
+        parser.add_argument('--order-by', default='pk',
+                            help='Comma separated ordering, e.g. -created_at,id')
+        dump.add_arguments(parser, chunk_size=2000)
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_app_config('config_api').get_model(options['model'])
+        except LookupError:
+            names = ', '.join(sorted(m.__name__ for m in apps.get_app_config('config_api').get_models()))
+            raise CommandError(f"Unknown model {options['model']!r}, expected one of: {names}")
+        if options['fields']:
+            fields = [field.strip() for field in options['fields'].split(',') if field.strip()]
+        else:
+            fields = [field.attname for field in model._meta.concrete_fields]
+        ordering = [field.strip() for field in options['order_by'].split(',') if field.strip()]
+
+        rows = dump.filter_queryset(model.objects.all(), options['where'])
+        try:
+            # values() 只取需要的列，不构造模型实例
+            rows = rows.order_by(*ordering).values(*fields)
+            rows = dump.stream(rows, chunk_size=options['chunk_size'], limit=options['limit'])
+            # 没有给人看的格式，text 按 jsonl 输出
+            fmt = 'jsonl' if options['format'] == 'text' else options['format']
+            writer = dump.RowWriter(self.stdout, fmt, fields)
+            for row in rows:
+                writer.write_row(row)
+        except FieldError as e:
+            raise CommandError(str(e))
+        self.stderr.write(f"{writer.rows} rows")
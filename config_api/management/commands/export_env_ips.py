@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config_api.env_io import FORMATS, detect_format, export_env_ips
+
+class Command(BaseCommand):
+    help = 'Export environment NE lists as CSV (ne_env,ne_ip) or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='Output format (default: from --output, otherwise csv)')
+        parser.add_argument('--env', action='append', default=None,
+                            help='Only export this environment (repeatable)')
+        parser.add_argument('--expand', action='store_true',
+                            help='Expand CIDR blocks and address ranges into single addresses')
+        parser.add_argument('--output', default='-',
+                            help="Output file, '-' writes to stdout")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or detect_format(output, 'csv')
+        chunks = export_env_ips(fmt, environments=options['env'], expand=options['expand'],
+                                chunk_size=getattr(settings, 'ENV_EXPORT_CHUNK_SIZE', 2000))
+        if output == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        try:
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except OSError as e:
+            raise CommandError(f"Cannot write {output}: {str(e)}")
+        self.stdout.write(self.style.SUCCESS(f"Environment NE lists exported to {output}"))
@@ -0,0 +1,63 @@
+import shutil
+import sys
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from config_api.env_io import FORMATS, MODES, EnvImportError, detect_format, import_env_ips, rewindable
+
+class Command(BaseCommand):
+    help = 'Import environment NE lists from a CSV (ne_env,ne_ip) or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' reads from stdin")
+        parser.add_argument('--format', choices=FORMATS, default=None,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--mode', choices=MODES, default='append',
+                            help='replace: replace the NE lists of the environments in the file')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows written per batch')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Skip invalid records instead of aborting')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        if fmt is None:
+            raise CommandError('Cannot detect the file format, use --format')
+
+        def progress(written, total):
+            self.stdout.write(f"Written {written}/{total} rows")
+
+        try:
+            if path == '-':
+                # 导入需要读两遍，标准输入先转存到临时文件（较小时留在内存中）
+                with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+                    shutil.copyfileobj(sys.stdin.buffer, spool)
+                    result = self._import(rewindable(spool), fmt, options, progress)
+            else:
+                result = self._import(lambda: open(path, 'rb'), fmt, options, progress)
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {str(e)}")
+        except EnvImportError as e:
+            for line_no, error in e.errors:
+                self.stderr.write(f"Line {line_no}: {error}")
+            raise CommandError(str(e))
+
+        for item in result['errors']:
+            self.stderr.write(f"Skipped line {item['line']}: {item['error']}")
+        self.stdout.write(
+            f"Imported {result['rows']} rows into {len(result['environments'])} environments in "
+            f"{result['elapsed']}s ({result['rows_per_second']} rows/s): {result['inserted']} inserted, "
+            f"{result['duplicates']} duplicates, {result['invalid']} invalid"
+        )
+        self.stdout.write(self.style.SUCCESS('Environment NE import completed'))
+
+    def _import(self, open_stream, fmt, options, progress):
+        return import_env_ips(
+            open_stream, fmt,
+            mode=options['mode'],
+            batch_size=options['batch_size'],
+            skip_invalid=options['skip_invalid'],
+            progress=progress,
+        )
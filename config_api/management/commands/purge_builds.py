@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from config_api.retention import PURGEABLE_STATUSES, apply_retention, get_rules
+
+class Command(BaseCommand):
+    help = 'Delete old builds according to the retention rules, in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=PURGEABLE_STATUSES,
+                            help='Only apply the rule for this status')
+        parser.add_argument('--max-age-days', type=int, default=None,
+                            help='Override the age limit (requires --status)')
+        parser.add_argument('--keep-latest', type=int, default=None,
+                            help='Override how many of the newest builds to keep (requires --status)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Seconds to sleep between chunks so live upgrades can take the write lock')
+        parser.add_argument('--max-builds', type=int, default=None,
+                            help='Stop after purging this many builds')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many builds would be purged')
+
+    def handle(self, *args, **options):
+        build_status = options['status']
+        overrides = {}
+        if options['max_age_days'] is not None or options['keep_latest'] is not None:
+            if not build_status:
+                raise CommandError('--max-age-days/--keep-latest require --status')
+            overrides[build_status] = {
+                'max_age_days': options['max_age_days'],
+                'keep_latest': options['keep_latest'],
+            }
+        rules = get_rules(overrides)
+        if build_status:
+            rules = {key: rule for key, rule in rules.items() if key == build_status}
+        if not rules:
+            self.stdout.write('No retention rules configured')
+            return
+        for key, rule in rules.items():
+            self.stdout.write(f"Rule {key}: max_age_days={rule.get('max_age_days')}, keep_latest={rule.get('keep_latest')}")
+
+        result = apply_retention(
+            rules,
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            max_builds=options['max_builds'],
+            dry_run=options['dry_run'],
+            log=None if options['dry_run'] else self.stdout.write,
+        )
+        if options['dry_run']:
+            self.stdout.write(f"Would purge {result['builds']} builds: {result['rows']}")
+            return
+        self.stdout.write(
+            f"Purged {result['builds']} builds, {result['total_rows']} rows in {result['elapsed']}s "
+            f"({result['rows_per_second']} rows/s): {result['rows']}"
+        )
+        self.stdout.write(self.style.SUCCESS('Build purge completed'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from config_api.stats import rebuild_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the incremental build statistics from the build history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Builds fetched per query')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild_stats(batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt statistics from {count} builds in {time.monotonic() - started:.1f}s")
+        self.stdout.write(self.style.SUCCESS('Build statistics rebuilt'))
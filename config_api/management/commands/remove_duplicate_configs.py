@@ -1,13 +1,30 @@
 from django.core.management.base import BaseCommand
 from config_api.models import Config
-from django.db.models import Count
 
 class Command(BaseCommand):
     help = 'Remove duplicate configs'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Configs deleted per query')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the duplicate configs')
+
     def handle(self, *args, **options):
-        duplicates = Config.objects.values('upgrade_type', 'work_type', 'env_ip_map').annotate(count=Count('id')).filter(count__gt=1)
-        for duplicate in duplicates:
-            configs = Config.objects.filter(**{k: v for k, v in duplicate.items() if k != 'count'})
-            configs.exclude(pk=configs.first().pk).delete()
+        # 内容哈希相同的配置只保留最早的一条；按 (content_hash, id) 顺序扫描一遍索引即可
+        duplicate_ids = []
+        previous = None
+        rows = (Config.objects.exclude(content_hash='').order_by('content_hash', 'id')
+                .values_list('id', 'content_hash').iterator())
+        for config_id, digest in rows:
+            if digest == previous:
+                duplicate_ids.append(config_id)
+            previous = digest
+        if options['dry_run']:
+            self.stdout.write(f"Would remove {len(duplicate_ids)} duplicate configs: {duplicate_ids}")
+            return
+        chunk_size = max(1, options['chunk_size'])
+        for start in range(0, len(duplicate_ids), chunk_size):
+            Config.objects.filter(id__in=duplicate_ids[start:start + chunk_size]).delete()
+        self.stdout.write(f"Removed {len(duplicate_ids)} duplicate configs")
         self.stdout.write(self.style.SUCCESS('Duplicate configs removed'))
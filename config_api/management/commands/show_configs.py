@@ -1,15 +1,40 @@
 from django.core.management.base import BaseCommand
+from config_api import dump
 from config_api.models import Config
 
+FIELDS = ['id', 'version', 'content_hash', 'upgrade_type', 'work_type', 'environments']
+
 class Command(BaseCommand):
     help = 'Display all configurations'
 
+    def add_arguments(self, parser):
+        dump.add_arguments(parser, chunk_size=100)
+
     def handle(self, *args, **options):
-        configs = Config.objects.all()
-        self.stdout.write(f"Total {configs.count()} configuration records:")
+        configs = dump.filter_queryset(Config.objects.order_by('id'), options['where'])
+        # iterator 与 prefetch_related 一起使用时每批预取一次关联数据
+        configs = dump.stream(
+            configs.prefetch_related('options', 'environments__ips'),
+            chunk_size=options['chunk_size'], limit=options['limit']
+        )
+        if options['format'] != 'text':
+            writer = dump.RowWriter(self.stdout, options['format'], FIELDS)
+            for config in configs:
+                writer.write_row({
+                    'id': config.id,
+                    'version': config.version,
+                    'content_hash': config.content_hash,
+                    'upgrade_type': config.get_upgrade_type(),
+                    'work_type': config.get_work_type(),
+                    'environments': config.get_env_ip_map(),
+                })
+            return
+        total = 0
         for config in configs:
+            total += 1
             self.stdout.write(f"ID: {config.id}")
             self.stdout.write(f"Upgrade Types: {config.get_upgrade_type()}")
             self.stdout.write(f"Work Types: {config.get_work_type()}")
             self.stdout.write(f"Environment-IP Map: {config.get_env_ip_map()}")
             self.stdout.write("---")
+        self.stdout.write(f"Total {total} configuration records")
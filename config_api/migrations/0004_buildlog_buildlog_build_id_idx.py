@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0003_remove_devicetype_model_config_devicetype_model_data_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='buildlog',
+            index=models.Index(fields=['build', 'id'], name='buildlog_build_id_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0004_buildlog_buildlog_build_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='fanout',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='BuildTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ne_ip', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('success', 'Success'), ('failed', 'Failed'), ('stopped', 'Stopped')], default='pending', max_length=20)),
+                ('message', models.CharField(blank=True, default='', max_length=500)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('build', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='config_api.build')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('build', 'ne_ip')},
+            },
+        ),
+        migrations.AddField(
+            model_name='buildlog',
+            name='target',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='config_api.buildtarget'),
+        ),
+    ]
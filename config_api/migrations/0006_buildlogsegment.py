@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0005_buildtarget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildLogSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_log_id', models.BigIntegerField()),
+                ('last_log_id', models.BigIntegerField()),
+                ('line_count', models.PositiveIntegerField()),
+                ('raw_size', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('build', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_segments', to='config_api.build')),
+            ],
+            options={
+                'ordering': ['first_log_id'],
+                'indexes': [models.Index(fields=['build', 'last_log_id'], name='buildlogseg_build_last_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0006_buildlogsegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpgradeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(blank=True, max_length=36, null=True, unique=True)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('leased', 'Leased'), ('done', 'Done')], default='queued', max_length=20)),
+                ('owner', models.CharField(blank=True, default='', max_length=100)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('build', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='config_api.build')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['state', 'id'], name='upgradejob_state_idx'), models.Index(fields=['state', 'lease_expires_at'], name='upgradejob_lease_idx')],
+            },
+        ),
+    ]
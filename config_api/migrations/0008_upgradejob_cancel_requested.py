@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0007_upgradejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upgradejob',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+    ]
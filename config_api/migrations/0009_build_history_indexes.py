@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0008_upgradejob_cancel_requested'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['created_at', 'id'], name='build_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['status', 'created_at'], name='build_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['upgrade_type', 'created_at'], name='build_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['ne_ip', 'created_at'], name='build_ne_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='buildtarget',
+            index=models.Index(fields=['ne_ip', 'build'], name='buildtarget_ne_build_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0009_build_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('upgrade_type', models.CharField(max_length=100)),
+                ('work_type', models.CharField(max_length=100)),
+                ('ne_ip', models.CharField(blank=True, default='', max_length=64)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('success', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('stopped', models.PositiveIntegerField(default=0)),
+                ('duration_count', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0)),
+                ('duration_max', models.FloatField(default=0)),
+                ('duration_buckets', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['ne_ip', 'day'], name='buildstat_ne_day_idx')],
+                'unique_together': {('day', 'upgrade_type', 'work_type', 'ne_ip')},
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+"""BuildLog 全文索引（SQLite FTS5）
+
+索引表自带内容，日志行被归档删除后仍可搜索；构建被删除时由触发器按
+build_ref 清理对应的索引行。trigram 分词支持中文和任意子串匹配。
+"""
+import json
+import zlib
+
+from django.db import migrations
+
+FTS_TABLE = 'config_api_buildlog_fts'
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        message, build_ref, build_id UNINDEXED, log_type UNINDEXED, timestamp UNINDEXED,
+        tokenize = '{{tokenizer}}'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS config_api_buildlog_fts_ai AFTER INSERT ON config_api_buildlog BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, message, build_ref, build_id, log_type, timestamp)
+        VALUES (new.id, new.message, '#' || new.build_id || '#', new.build_id, new.log_type, new.timestamp);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS config_api_build_fts_ad AFTER DELETE ON config_api_build BEGIN
+        DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ('build_ref:"#' || old.id || '#"');
+    END
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS config_api_build_fts_ad',
+    'DROP TRIGGER IF EXISTS config_api_buildlog_fts_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        # trigram 分词需要 SQLite 3.34+，更早的版本退回按词索引
+        tokenizer = 'trigram' if connection.Database.sqlite_version_info >= (3, 34) else 'unicode61'
+        for sql in CREATE_SQL:
+            cursor.execute(sql.replace('{tokenizer}', tokenizer))
+        # 已有的日志行
+        cursor.execute(f"""
+            INSERT INTO {FTS_TABLE}(rowid, message, build_ref, build_id, log_type, timestamp)
+            SELECT id, message, '#' || build_id || '#', build_id, log_type, timestamp FROM config_api_buildlog
+        """)
+        # 已归档的日志段
+        BuildLogSegment = apps.get_model('config_api', 'BuildLogSegment')
+        for segment in BuildLogSegment.objects.order_by('id').iterator():
+            records = json.loads(zlib.decompress(bytes(segment.data)).decode('utf-8'))
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE}(rowid, message, build_ref, build_id, log_type, timestamp) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                [
+                    (record['id'], record['message'], f"#{segment.build_id}#", segment.build_id,
+                     record['log_type'], record['timestamp'])
+                    for record in records
+                ]
+            )
+
+
+def drop_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0010_buildstat'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
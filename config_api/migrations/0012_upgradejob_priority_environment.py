@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0011_buildlog_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upgradejob',
+            name='environment',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='upgradejob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'high'), (1, 'normal'), (2, 'low')], default=1),
+        ),
+        migrations.AddIndex(
+            model_name='upgradejob',
+            index=models.Index(fields=['state', 'environment'], name='upgradejob_state_env_idx'),
+        ),
+    ]
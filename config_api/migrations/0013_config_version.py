@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0012_upgradejob_priority_environment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
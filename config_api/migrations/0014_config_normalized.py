@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0013_config_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigEnvironment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='environments', to='config_api.config')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+                'unique_together': {('config', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EnvironmentIP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ne_ip', models.CharField(max_length=64)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('environment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ips', to='config_api.configenvironment')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+                'indexes': [models.Index(fields=['ne_ip', 'environment'], name='environmentip_ne_ip_idx')],
+                'unique_together': {('environment', 'ne_ip')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ConfigOption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('upgrade_type', 'Upgrade Type'), ('work_type', 'Work Type')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='options', to='config_api.config')),
+            ],
+            options={
+                'ordering': ['kind', 'position', 'id'],
+                'unique_together': {('config', 'kind', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+"""把 Config 中 JSON 格式的 upgrade_type / work_type / env_ip_map 拆分到规范化的表"""
+import json
+import re
+
+from django.db import migrations
+
+# 0014 中各字段的长度
+OPTION_MAX_LENGTH = 100
+ENV_NAME_MAX_LENGTH = 100
+NE_IP_MAX_LENGTH = 64
+
+
+def _load(value, default):
+    try:
+        loaded = json.loads(value or '')
+    except (TypeError, ValueError):
+        return default
+    return loaded if isinstance(loaded, type(default)) else default
+
+
+def _split_ips(ips):
+    if isinstance(ips, str):
+        ips = re.split(r'[\s,;]+', ips)
+    if not isinstance(ips, (list, tuple)):
+        return []
+    return list(dict.fromkeys(str(ip).strip() for ip in ips if ip is not None and str(ip).strip()))
+
+
+def _check_length(config, what, value, max_length):
+    """超长的内容不截断，直接中止迁移，避免静默改变配置"""
+    if len(value) > max_length:
+        raise ValueError(
+            f"Config {config.pk}: {what} is longer than {max_length} characters: {value!r}. "
+            f"Fix the config before running this migration."
+        )
+    return value
+
+
+def copy_to_tables(apps, schema_editor):
+    Config = apps.get_model('config_api', 'Config')
+    ConfigOption = apps.get_model('config_api', 'ConfigOption')
+    ConfigEnvironment = apps.get_model('config_api', 'ConfigEnvironment')
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    for config in Config.objects.order_by('id').iterator():
+        options = []
+        for kind in ('upgrade_type', 'work_type'):
+            values = [str(value).strip() for value in _load(getattr(config, kind), []) if str(value).strip()]
+            options.extend(
+                ConfigOption(config=config, kind=kind, position=position,
+                             value=_check_length(config, kind, value, OPTION_MAX_LENGTH))
+                for position, value in enumerate(dict.fromkeys(values))
+            )
+        ConfigOption.objects.bulk_create(options)
+        for position, (name, ips) in enumerate(_load(config.env_ip_map, {}).items()):
+            name = _check_length(config, 'environment name', str(name), ENV_NAME_MAX_LENGTH)
+            environment = ConfigEnvironment.objects.create(config=config, name=name, position=position)
+            EnvironmentIP.objects.bulk_create([
+                EnvironmentIP(environment=environment, position=index,
+                              ne_ip=_check_length(config, f"NE entry of {name}", ip, NE_IP_MAX_LENGTH))
+                for index, ip in enumerate(_split_ips(ips))
+            ], batch_size=1000)
+
+
+def copy_to_json(apps, schema_editor):
+    Config = apps.get_model('config_api', 'Config')
+    ConfigOption = apps.get_model('config_api', 'ConfigOption')
+    ConfigEnvironment = apps.get_model('config_api', 'ConfigEnvironment')
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    for config in Config.objects.order_by('id').iterator():
+        for kind in ('upgrade_type', 'work_type'):
+            values = list(ConfigOption.objects.filter(config=config, kind=kind)
+                          .order_by('position', 'id').values_list('value', flat=True))
+            setattr(config, kind, json.dumps(values))
+        env_ip_map = {}
+        for environment in ConfigEnvironment.objects.filter(config=config).order_by('position', 'id'):
+            env_ip_map[environment.name] = list(
+                EnvironmentIP.objects.filter(environment=environment)
+                .order_by('position', 'id').values_list('ne_ip', flat=True)
+            )
+        config.env_ip_map = json.dumps(env_ip_map)
+        config.save(update_fields=['upgrade_type', 'work_type', 'env_ip_map'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0014_config_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_tables, copy_to_json),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0015_copy_config_json'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='config',
+            name='env_ip_map',
+        ),
+        migrations.RemoveField(
+            model_name='config',
+            name='upgrade_type',
+        ),
+        migrations.RemoveField(
+            model_name='config',
+            name='work_type',
+        ),
+    ]
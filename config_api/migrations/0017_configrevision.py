@@ -0,0 +1,59 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import json
+import zlib
+
+
+def record_baselines(apps, schema_editor):
+    """为已有配置保存当前内容的完整快照，之后的修改才能回滚"""
+    Config = apps.get_model('config_api', 'Config')
+    ConfigOption = apps.get_model('config_api', 'ConfigOption')
+    ConfigEnvironment = apps.get_model('config_api', 'ConfigEnvironment')
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    ConfigRevision = apps.get_model('config_api', 'ConfigRevision')
+    for config in Config.objects.order_by('id').iterator():
+        state = {
+            kind: list(ConfigOption.objects.filter(config=config, kind=kind)
+                       .order_by('position', 'id').values_list('value', flat=True))
+            for kind in ('upgrade_type', 'work_type')
+        }
+        state['environments'] = {
+            environment.name: list(EnvironmentIP.objects.filter(environment=environment)
+                                   .order_by('position', 'id').values_list('ne_ip', flat=True))
+            for environment in ConfigEnvironment.objects.filter(config=config).order_by('position', 'id')
+        }
+        ConfigRevision.objects.create(
+            config=config, version=config.version, kind='snapshot',
+            data=zlib.compress(json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')),
+            message='初始版本'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0016_remove_config_json_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('kind', models.CharField(choices=[('snapshot', 'Snapshot'), ('delta', 'Delta')], max_length=10)),
+                ('data', models.BinaryField()),
+                ('summary', models.JSONField(default=dict)),
+                ('message', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='config_api.config')),
+            ],
+            options={
+                'ordering': ['-version'],
+                'unique_together': {('config', 'version')},
+            },
+        ),
+        migrations.RunPython(record_baselines, migrations.RunPython.noop),
+    ]
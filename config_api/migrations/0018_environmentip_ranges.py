@@ -0,0 +1,80 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:20
+
+import ipaddress
+
+from django.db import migrations, models
+
+# 以下是写这个迁移时 ipsets 中解析函数的副本，之后修改应用代码不影响本迁移
+
+
+def _try_parse(entry):
+    """能解析为地址、CIDR 或范围时返回 (版本, 起始, 结束)，否则返回 None"""
+    text = str(entry or '').strip()
+    try:
+        if '/' in text:
+            network = ipaddress.ip_network(text, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        if '-' in text:
+            start, _, end = text.partition('-')
+            first, last = ipaddress.ip_address(start.strip()), ipaddress.ip_address(end.strip())
+            if first.version != last.version or first > last:
+                return None
+            return first.version, int(first), int(last)
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return None
+    return address.version, int(address), int(address)
+
+
+def _to_key(value):
+    return format(value, '032x')
+
+
+def fill_ranges(apps, schema_editor):
+    """已有的每个 NE 地址写入区间端点（起始与结束相同）"""
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    batch = []
+    for row in EnvironmentIP.objects.order_by('id').iterator(chunk_size=2000):
+        block = _try_parse(row.ne_ip)
+        if block is None:
+            continue
+        row.ip_version, first, last = block
+        row.range_start = _to_key(first)
+        row.range_end = _to_key(last)
+        batch.append(row)
+        if len(batch) >= 2000:
+            EnvironmentIP.objects.bulk_update(batch, ['ip_version', 'range_start', 'range_end'])
+            batch = []
+    if batch:
+        EnvironmentIP.objects.bulk_update(batch, ['ip_version', 'range_start', 'range_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0017_configrevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='environmentip',
+            name='ip_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='environmentip',
+            name='range_end',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='environmentip',
+            name='range_start',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='environmentip',
+            name='ne_ip',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.RunPython(fill_ranges, migrations.RunPython.noop),
+    ]
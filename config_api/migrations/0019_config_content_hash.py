@@ -0,0 +1,107 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:26
+
+import hashlib
+import ipaddress
+import json
+
+from django.db import migrations, models
+
+# 以下是写这个迁移时 config_history.content_hash 及其用到的 ipsets 函数的副本，
+# 之后修改应用代码不影响本迁移（哈希的定义在 0021 中更新）
+
+
+def _try_parse(entry):
+    text = str(entry or '').strip()
+    try:
+        if '/' in text:
+            network = ipaddress.ip_network(text, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        if '-' in text:
+            start, _, end = text.partition('-')
+            first, last = ipaddress.ip_address(start.strip()), ipaddress.ip_address(end.strip())
+            if first.version != last.version or first > last:
+                return None
+            return first.version, int(first), int(last)
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return None
+    return address.version, int(address), int(address)
+
+
+def _block_text(version, first, last):
+    factory = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    if first == last:
+        return str(factory(first))
+    networks = list(ipaddress.summarize_address_range(factory(first), factory(last)))
+    if len(networks) == 1:
+        return str(networks[0])
+    return f"{factory(first)}-{factory(last)}"
+
+
+def _compact(entries):
+    literals = []
+    blocks = []
+    for entry in entries:
+        block = _try_parse(entry)
+        if block is None:
+            literals.append(str(entry))
+        else:
+            blocks.append(block)
+    result = []
+    current = None
+    for version, first, last in sorted(blocks):
+        if current is not None and version == current[0] and first <= current[2] + 1:
+            current = (version, current[1], max(current[2], last))
+            continue
+        if current is not None:
+            result.append(_block_text(*current))
+        current = (version, first, last)
+    if current is not None:
+        result.append(_block_text(*current))
+    return result + literals
+
+
+def content_hash(state):
+    canonical = {
+        'upgrade_type': sorted(set(state['upgrade_type'])),
+        'work_type': sorted(set(state['work_type'])),
+        'environments': sorted(
+            [str(name), sorted(_compact(ips))] for name, ips in state['environments'].items()
+        ),
+    }
+    encoded = json.dumps(canonical, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    """为已有配置计算内容哈希"""
+    Config = apps.get_model('config_api', 'Config')
+    ConfigOption = apps.get_model('config_api', 'ConfigOption')
+    ConfigEnvironment = apps.get_model('config_api', 'ConfigEnvironment')
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    for config in Config.objects.order_by('id').iterator():
+        state = {'upgrade_type': [], 'work_type': [], 'environments': {}}
+        for kind, value in ConfigOption.objects.filter(config=config).values_list('kind', 'value'):
+            state.setdefault(kind, []).append(value)
+        for name in ConfigEnvironment.objects.filter(config=config).values_list('name', flat=True):
+            state['environments'][name] = []
+        for name, ne_ip in (EnvironmentIP.objects.filter(environment__config=config)
+                            .values_list('environment__name', 'ne_ip')):
+            state['environments'][name].append(ne_ip)
+        Config.objects.filter(pk=config.pk).update(content_hash=content_hash(state))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0018_environmentip_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
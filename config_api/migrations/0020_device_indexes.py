@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0019_config_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['rack_number', 'position', 'id'], name='device_rack_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['status'], name='device_status_idx'),
+        ),
+    ]
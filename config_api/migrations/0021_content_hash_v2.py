@@ -0,0 +1,86 @@
+# 内容哈希改为可以按数据库中的行流式计算（见 config_history.content_hash），重新计算已有配置的哈希。
+# 下面的函数是写这个迁移时 config_history / ipsets 中对应实现的副本，之后修改应用代码不影响本迁移。
+
+import hashlib
+import ipaddress
+import json
+
+from django.db import migrations
+
+
+def _block_text(version, first, last):
+    factory = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    if first == last:
+        return str(factory(first))
+    networks = list(ipaddress.summarize_address_range(factory(first), factory(last)))
+    if len(networks) == 1:
+        return str(networks[0])
+    return f"{factory(first)}-{factory(last)}"
+
+
+def _merged(blocks):
+    current = None
+    for version, first, last in blocks:
+        if current is not None and version == current[0] and first <= current[2] + 1:
+            if last > current[2]:
+                current = (current[0], current[1], last)
+            continue
+        if current is not None:
+            yield current
+        current = (version, first, last)
+    if current is not None:
+        yield current
+
+
+def _unordered(digests):
+    total = sum(int.from_bytes(digest, 'big') for digest in digests) % (1 << 256)
+    return total.to_bytes(32, 'big')
+
+
+def _environment_digest(name, blocks, literals):
+    hasher = hashlib.sha256(json.dumps(str(name), ensure_ascii=False).encode('utf-8'))
+    for block in _merged(blocks):
+        hasher.update(b'\n' + _block_text(*block).encode('ascii'))
+    hasher.update(b'\n' + _unordered(hashlib.sha256(str(literal).encode('utf-8')).digest() for literal in literals))
+    return hasher.digest()
+
+
+def refill_content_hash(apps, schema_editor):
+    Config = apps.get_model('config_api', 'Config')
+    ConfigOption = apps.get_model('config_api', 'ConfigOption')
+    ConfigEnvironment = apps.get_model('config_api', 'ConfigEnvironment')
+    EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+    for config_id in Config.objects.order_by('id').values_list('id', flat=True).iterator():
+        options = {'upgrade_type': set(), 'work_type': set()}
+        for kind, value in ConfigOption.objects.filter(config_id=config_id).values_list('kind', 'value'):
+            options.setdefault(kind, set()).add(value)
+        environments = []
+        for environment_id, name in (ConfigEnvironment.objects.filter(config_id=config_id)
+                                     .values_list('id', 'name').iterator()):
+            rows = EnvironmentIP.objects.filter(environment_id=environment_id)
+            blocks = (
+                (version, int(start, 16), int(end, 16))
+                for version, start, end in rows.filter(ip_version__gt=0)
+                .order_by('ip_version', 'range_start', 'range_end')
+                .values_list('ip_version', 'range_start', 'range_end').iterator()
+            )
+            literals = rows.filter(ip_version=0).values_list('ne_ip', flat=True).iterator()
+            environments.append(_environment_digest(name, blocks, literals))
+        canonical = {
+            'upgrade_type': sorted(options['upgrade_type']),
+            'work_type': sorted(options['work_type']),
+        }
+        hasher = hashlib.sha256(json.dumps(canonical, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        hasher.update(_unordered(environments))
+        Config.objects.filter(pk=config_id).update(content_hash=hasher.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0020_device_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(refill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+"""删除单条日志或日志段时同步清理全文索引
+
+迁移 0011 只在删除构建时清理索引，单独删除的 BuildLog 行（例如在 admin 中）
+会在索引中留下搜索得到、却已不存在的日志。
+
+- 删除 BuildLog 行时删除对应的索引行；行已被归档进日志段时保留，
+  归档器先写日志段再删除原始行，所以归档后的日志仍可搜索；
+- 删除日志段时删除它覆盖的 id 区间内该构建的索引行。
+"""
+from django.db import migrations
+
+FTS_TABLE = 'config_api_buildlog_fts'
+
+CREATE_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS config_api_buildlog_fts_ad AFTER DELETE ON config_api_buildlog
+    WHEN NOT EXISTS (
+        SELECT 1 FROM config_api_buildlogsegment
+        WHERE build_id = old.build_id AND last_log_id >= old.id AND first_log_id <= old.id
+    )
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS config_api_buildlogsegment_fts_ad AFTER DELETE ON config_api_buildlogsegment BEGIN
+        DELETE FROM {FTS_TABLE}
+        WHERE rowid BETWEEN old.first_log_id AND old.last_log_id AND build_id = old.build_id;
+    END
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS config_api_buildlogsegment_fts_ad',
+    'DROP TRIGGER IF EXISTS config_api_buildlog_fts_ad',
+]
+
+
+def _has_fts(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+    return cursor.fetchone() is not None
+
+
+def _execute(statements):
+    def run(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            if not _has_fts(cursor):
+                return
+            for sql in statements:
+                cursor.execute(sql)
+    return run
+
+
+def remove_orphans(apps, schema_editor):
+    """清理此前删除单条日志留下的索引行"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if not _has_fts(cursor):
+            return
+        cursor.execute(f"""
+            DELETE FROM {FTS_TABLE} WHERE rowid IN (
+                SELECT f.rowid FROM {FTS_TABLE} AS f
+                WHERE NOT EXISTS (SELECT 1 FROM config_api_buildlog AS l WHERE l.id = f.rowid)
+                AND NOT EXISTS (
+                    SELECT 1 FROM config_api_buildlogsegment AS s
+                    WHERE s.build_id = f.build_id AND s.last_log_id >= f.rowid AND s.first_log_id <= f.rowid
+                )
+            )
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config_api', '0021_content_hash_v2'),
+    ]
+
+    operations = [
+        migrations.RunPython(_execute(CREATE_SQL), _execute(DROP_SQL)),
+        migrations.RunPython(remove_orphans, migrations.RunPython.noop),
+    ]
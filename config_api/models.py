@@ -1,45 +1,305 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 import json
 import logging
+import re
+import zlib
+
+from . import ipsets
 
 # Create your models here.
 
 logger = logging.getLogger(__name__)
 
+def split_ips(ips):
+    """NE 地址列表：列表或以逗号、分号、空白分隔的字符串，去重并保持顺序"""
+    if isinstance(ips, str):
+        ips = re.split(r'[\s,;]+', ips)
+    return list(dict.fromkeys(str(ip).strip() for ip in ips or [] if ip is not None and str(ip).strip()))
+
+def canonical_entry(entry):
+    """地址、CIDR 或范围的规范写法，无法解析的内容（例如主机名）原样返回"""
+    block = ipsets.try_parse(entry)
+    return ipsets.block_text(block) if block else str(entry).strip()
+
+def clean_entry(entry):
+    """校验环境中的一项并返回规范写法，非法时抛出 ValueError
+
+    ConfigSerializer 和批量导入共用：像地址、CIDR 或范围的内容必须能解析，
+    其余内容（例如主机名）原样保存。
+    """
+    text = str(entry or '').strip()
+    if not text:
+        raise ValueError('ne_ip is empty')
+    block = ipsets.try_parse(text)
+    if block is not None:
+        text = ipsets.block_text(block)
+    elif ipsets.looks_like_block(text):
+        # 像地址段但无法解析，parse_entry 给出具体的错误
+        ipsets.parse_entry(text)
+    max_length = EnvironmentIP._meta.get_field('ne_ip').max_length
+    if len(text) > max_length:
+        raise ValueError(f"ne_ip is longer than {max_length} characters: {text[:20]}...")
+    return text
+
 class Config(models.Model):
-    upgrade_type = models.TextField(default='[]')
-    work_type = models.TextField(default='[]')
-    env_ip_map = models.TextField(default='{}')
+    """升级配置：升级类型、工作类型和环境分别存放在 ConfigOption、ConfigEnvironment、EnvironmentIP
+
+    set_* 修改的内容在 save() 时与配置本身在同一事务中写入。
+    """
+    version = models.PositiveIntegerField(default=0)  # 每次保存加一，用作配置缓存和 ETag 的版本
+    # 内容的规范哈希（见 config_history.content_hash），按索引查找内容相同的配置
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+
+    def save(self, *args, **kwargs):
+        from .config_history import config_state, content_hash, record_revision
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            self.bump_version(using)
+            # 保存前按待写入的修改读取一次完整内容，哈希和历史版本共用
+            state = config_state(self)
+            self.content_hash = content_hash(state)
+            super().save(*args, **kwargs)
+            self._write_pending()
+            # 每次保存记录一个历史版本
+            record_revision(self, message=self.__dict__.pop('_revision_message', ''), state=state)
+
+    def bump_version(self, using=None):
+        """在数据库中把版本号加一并读回，需在事务中调用
+
+        UPDATE 锁住该行直到事务结束，并发保存依次得到不同的版本号，
+        不会写出重复的历史版本。尚未保存的配置版本号为 1。
+        """
+        rows = Config.objects.db_manager(using).filter(pk=self.pk) if self.pk is not None else None
+        if rows is not None and rows.update(version=F('version') + 1):
+            self.version = rows.values_list('version', flat=True).get()
+        else:
+            self.version = 1
+        return self.version
+
+    def find_duplicate(self):
+        """内容相同的另一条配置（最早创建的一条），没有时返回 None"""
+        from .config_history import config_state, content_hash
+        digest = content_hash(config_state(self))
+        return Config.objects.filter(content_hash=digest).exclude(pk=self.pk).order_by('id').first()
+
+    def _pending(self):
+        return self.__dict__.setdefault('_pending_changes', {})
+
+    def _write_pending(self):
+        pending = self.__dict__.pop('_pending_changes', None)
+        if not pending:
+            return
+        for kind in ('upgrade_type', 'work_type'):
+            if kind in pending:
+                self.options.filter(kind=kind).delete()
+                ConfigOption.objects.bulk_create([
+                    ConfigOption(config=self, kind=kind, value=value, position=position)
+                    for position, value in enumerate(pending[kind])
+                ])
+        if 'env_ip_map' in pending:
+            self.environments.all().delete()
+            env_ip_map = pending['env_ip_map']
+            environments = ConfigEnvironment.objects.bulk_create([
+                ConfigEnvironment(config=self, name=name, position=position)
+                for position, name in enumerate(env_ip_map)
+            ], batch_size=1000)
+            EnvironmentIP.objects.bulk_create((
+                EnvironmentIP.for_entry(environment.id, ip, index)
+                for environment in environments
+                for index, ip in enumerate(env_ip_map[environment.name])
+            ), batch_size=1000)
+        # 预取的关联数据已过期
+        self.__dict__.pop('_prefetched_objects_cache', None)
+
+    def _set_options(self, kind, types_list):
+        values = [str(value).strip() for value in types_list or [] if str(value).strip()]
+        self._pending()[kind] = list(dict.fromkeys(values))
+
+    def _get_options(self, kind):
+        if kind in self._pending():
+            return list(self._pending()[kind])
+        if self.pk is None:
+            return []
+        return [option.value for option in self.options.all() if option.kind == kind]
 
     def set_upgrade_type(self, types_list):
-        self.upgrade_type = json.dumps(types_list or [])
+        self._set_options('upgrade_type', types_list)
 
     def get_upgrade_type(self):
-        try:
-            return json.loads(self.upgrade_type)
-        except json.JSONDecodeError:
-            logger.error(f"Error decoding upgrade_type: {self.upgrade_type}")
-            return []
+        return self._get_options('upgrade_type')
 
     def set_work_type(self, types_list):
-        self.work_type = json.dumps(types_list or [])
+        self._set_options('work_type', types_list)
 
     def get_work_type(self):
-        try:
-            return json.loads(self.work_type)
-        except json.JSONDecodeError:
-            logger.error(f"Error decoding work_type: {self.work_type}")
-            return []
+        return self._get_options('work_type')
 
     def set_env_ip_map(self, env_ip_dict):
-        self.env_ip_map = json.dumps(env_ip_dict or {})
+        # 地址、CIDR 和范围统一成规范写法（见 ipsets），重复项只保留一个
+        self._pending()['env_ip_map'] = {
+            str(name): list(dict.fromkeys(canonical_entry(ip) for ip in split_ips(ips)))
+            for name, ips in (env_ip_dict or {}).items()
+        }
 
     def get_env_ip_map(self):
-        try:
-            return json.loads(self.env_ip_map)
-        except json.JSONDecodeError:
-            logger.error(f"Error decoding env_ip_map: {self.env_ip_map}")
+        if 'env_ip_map' in self._pending():
+            return {name: list(ips) for name, ips in self._pending()['env_ip_map'].items()}
+        if self.pk is None:
             return {}
+        if 'environments' in self.__dict__.get('_prefetched_objects_cache', {}):
+            return {
+                environment.name: [ip.ne_ip for ip in environment.ips.all()]
+                for environment in self.environments.all()
+            }
+        # 未预取时用两次查询读取，避免每个环境各查一次
+        env_ip_map = {name: [] for name in self.environments.values_list('name', flat=True)}
+        rows = (EnvironmentIP.objects.filter(environment__config=self)
+                .order_by('environment__position', 'environment_id', 'position', 'id')
+                .values_list('environment__name', 'ne_ip'))
+        for name, ne_ip in rows:
+            env_ip_map[name].append(ne_ip)
+        return env_ip_map
+
+class ConfigOption(models.Model):
+    """配置中的一个升级类型或工作类型"""
+    KIND_CHOICES = (
+        ('upgrade_type', 'Upgrade Type'),
+        ('work_type', 'Work Type'),
+    )
+
+    config = models.ForeignKey(Config, related_name='options', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    value = models.CharField(max_length=100)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['kind', 'position', 'id']
+        unique_together = [('config', 'kind', 'value')]
+
+    def __str__(self):
+        return f"{self.kind}: {self.value}"
+
+class ConfigEnvironment(models.Model):
+    """配置中的一个环境（ne_env）"""
+    config = models.ForeignKey(Config, related_name='environments', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position', 'id']
+        unique_together = [('config', 'name')]
+
+    def __str__(self):
+        return self.name
+
+class EnvironmentIP(models.Model):
+    """环境中的一项 NE 地址：单个地址、CIDR 或地址范围
+
+    range_start / range_end 为区间端点（定长十六进制，见 ipsets），
+    ip_version 为 0 表示无法解析的内容（例如主机名），只能按 ne_ip 精确匹配。
+    """
+    environment = models.ForeignKey(ConfigEnvironment, related_name='ips', on_delete=models.CASCADE)
+    ne_ip = models.CharField(max_length=100)
+    position = models.PositiveIntegerField(default=0)
+    ip_version = models.PositiveSmallIntegerField(default=0)
+    range_start = models.CharField(max_length=ipsets.KEY_WIDTH, blank=True, default='')
+    range_end = models.CharField(max_length=ipsets.KEY_WIDTH, blank=True, default='')
+
+    class Meta:
+        ordering = ['position', 'id']
+        unique_together = [('environment', 'ne_ip')]
+        indexes = [
+            models.Index(fields=['ne_ip', 'environment'], name='environmentip_ne_ip_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.environment_id}: {self.ne_ip}"
+
+    @classmethod
+    def for_entry(cls, environment_id, entry, position):
+        """按规范写法创建（未保存），同时填好区间端点"""
+        block = ipsets.try_parse(entry)
+        if block is None:
+            return cls(environment_id=environment_id, ne_ip=str(entry).strip(), position=position)
+        return cls(
+            environment_id=environment_id, ne_ip=ipsets.block_text(block), position=position,
+            ip_version=block.version,
+            range_start=ipsets.to_key(block.first), range_end=ipsets.to_key(block.last)
+        )
+
+    def block(self):
+        if not self.ip_version:
+            return None
+        return ipsets.IPBlock(self.ip_version, ipsets.from_key(self.range_start), ipsets.from_key(self.range_end))
+
+    @classmethod
+    def lookup(cls, ne_ips):
+        """按 NE 地址反查所属环境，返回 {ne_ip: [(config_id, 环境名), ...]}
+
+        地址落在环境的某个地址、CIDR 或范围中即属于该环境；传入 CIDR 或范围时
+        返回与之重叠的环境。同一地址属于多个环境时按配置创建顺序、环境顺序
+        排列，第一个即默认归属。
+        """
+        from .config_cache import get_ip_index
+        index = get_ip_index()
+        owners = {}
+        literals = []
+        for ne_ip in ne_ips:
+            block = ipsets.try_parse(ne_ip)
+            if block is None:
+                literals.append(ne_ip)
+                continue
+            found = index.owners_of(block)
+            if found:
+                owners[ne_ip] = found
+        if literals:
+            rows = (cls.objects.filter(ne_ip__in=literals, ip_version=0)
+                    .values_list('ne_ip', 'environment__config_id', 'environment__position',
+                                 'environment__id', 'environment__name'))
+            for ne_ip, config_id, position, environment_id, name in sorted(rows, key=lambda row: row[1:4]):
+                owners.setdefault(ne_ip, []).append((config_id, name))
+        return owners
+
+    @classmethod
+    def build_index(cls):
+        """所有环境地址段的区间索引，所有者为 (config_id, 环境名)"""
+        rows = (cls.objects.filter(ip_version__gt=0).order_by()
+                .values_list('ip_version', 'range_start', 'range_end', 'environment__config_id',
+                             'environment__position', 'environment_id', 'environment__name')
+                .iterator(chunk_size=5000))
+        return ipsets.IntervalIndex(
+            (ipsets.IPBlock(version, ipsets.from_key(start), ipsets.from_key(end)),
+             (config_id, position, environment_id), (config_id, name))
+            for version, start, end, config_id, position, environment_id, name in rows
+        )
+
+class ConfigRevision(models.Model):
+    """配置的历史版本
+
+    data 为 zlib 压缩的 JSON：kind 为 snapshot 时是完整配置，为 delta 时是
+    相对上一版本的增量（见 config_history）。每隔若干版本存一次完整快照，
+    还原任意版本最多回放这么多个增量。
+    """
+    KIND_CHOICES = (
+        ('snapshot', 'Snapshot'),
+        ('delta', 'Delta'),
+    )
+
+    config = models.ForeignKey(Config, related_name='revisions', on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    data = models.BinaryField()
+    summary = models.JSONField(default=dict)  # 本次修改的概要，列出版本时不需要解压 data
+    message = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version']
+        unique_together = [('config', 'version')]
+
+    def __str__(self):
+        return f"Config #{self.config_id} v{self.version} ({self.kind})"
 
 class Build(models.Model):
     STATUS_CHOICES = (
@@ -56,15 +316,34 @@ class Build(models.Model):
     ne_ip_input = models.CharField(max_length=255, blank=True, null=True)
     version_path = models.CharField(max_length=500)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    fanout = models.PositiveSmallIntegerField(null=True, blank=True)  # 同时升级的 NE 数，为空时使用全局配置
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 构建历史按 (created_at, id) 倒序游标翻页，可叠加状态、类型、NE 过滤
+            models.Index(fields=['created_at', 'id'], name='build_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='build_status_created_idx'),
+            models.Index(fields=['upgrade_type', 'created_at'], name='build_type_created_idx'),
+            models.Index(fields=['ne_ip', 'created_at'], name='build_ne_created_idx'),
+        ]
 
     def __str__(self):
         return f"Build #{self.id} - {self.status}"
 
+    def get_ne_ips(self):
+        """拆分 ne_ip 中以逗号、分号或空白分隔的多个 NE 地址（去重并保持顺序）"""
+        ips = [ip for ip in re.split(r'[\s,;]+', self.ne_ip or '') if ip]
+        return list(dict.fromkeys(ips))
+
+    def create_targets(self):
+        """为每个 NE 地址创建一条 BuildTarget"""
+        return BuildTarget.objects.bulk_create([
+            BuildTarget(build=self, ne_ip=ip) for ip in self.get_ne_ips()
+        ])
+
     def save(self, *args, **kwargs):
         # 添加日志记录
         is_new = self._state.adding
@@ -73,19 +352,149 @@ class Build(models.Model):
             logger.info(f"新建构建记录: {self.id}")
         else:
             logger.info(f"更新构建记录: {self.id}")
+            from .events import publish_build_status
+            publish_build_status(self.id, self.status)
+
+class UpgradeJob(models.Model):
+    """持久化的升级任务，工作线程领取后持有租约并定期心跳续约"""
+    STATE_CHOICES = (
+        ('queued', 'Queued'),
+        ('leased', 'Leased'),
+        ('done', 'Done'),
+    )
+    # 数值越小越先执行
+    PRIORITY_CHOICES = (
+        (0, 'high'),
+        (1, 'normal'),
+        (2, 'low'),
+    )
+
+    build = models.OneToOneField(Build, related_name='job', on_delete=models.CASCADE)
+    task_id = models.CharField(max_length=36, unique=True, null=True, blank=True)  # start_upgrade 返回的任务 ID
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='queued')
+    owner = models.CharField(max_length=100, blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=1)
+    environment = models.CharField(max_length=100, blank=True, default='')  # 构建 NE 所属的环境，用于按环境限流
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['state', 'id'], name='upgradejob_state_idx'),
+            models.Index(fields=['state', 'lease_expires_at'], name='upgradejob_lease_idx'),
+            models.Index(fields=['state', 'environment'], name='upgradejob_state_env_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} for build #{self.build_id} - {self.state}"
+
+class BuildTarget(models.Model):
+    """构建中单个 NE 的升级状态"""
+    build = models.ForeignKey(Build, related_name='targets', on_delete=models.CASCADE)
+    ne_ip = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=Build.STATUS_CHOICES, default='pending')
+    message = models.CharField(max_length=500, blank=True, default='')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = [('build', 'ne_ip')]
+        indexes = [
+            # 按 NE 查构建历史：WHERE ne_ip = ? 直接在索引中取到 build_id
+            models.Index(fields=['ne_ip', 'build'], name='buildtarget_ne_build_idx'),
+        ]
+
+    def __str__(self):
+        return f"Build #{self.build_id} NE {self.ne_ip} - {self.status}"
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
 
 class BuildLog(models.Model):
     build = models.ForeignKey(Build, related_name='logs', on_delete=models.CASCADE)
+    target = models.ForeignKey(BuildTarget, related_name='logs', on_delete=models.CASCADE, null=True, blank=True)
     message = models.TextField()
     log_type = models.CharField(max_length=20, default='info')
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # 按构建分页读取日志：WHERE build_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['build', 'id'], name='buildlog_build_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.timestamp} - {self.log_type}: {self.message[:50]}"
 
+class BuildLogSegment(models.Model):
+    """已完成构建的压缩日志段
+
+    data 为 zlib 压缩的 JSON 数组，元素与 BuildLogSerializer 的输出一致。
+    """
+    build = models.ForeignKey(Build, related_name='log_segments', on_delete=models.CASCADE)
+    first_log_id = models.BigIntegerField()
+    last_log_id = models.BigIntegerField()
+    line_count = models.PositiveIntegerField()
+    raw_size = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['first_log_id']
+        indexes = [
+            models.Index(fields=['build', 'last_log_id'], name='buildlogseg_build_last_idx'),
+        ]
+
+    def __str__(self):
+        return f"Build #{self.build_id} logs {self.first_log_id}-{self.last_log_id}"
+
+    @property
+    def compressed_size(self):
+        return len(self.data)
+
+    def decode(self):
+        return json.loads(zlib.decompress(bytes(self.data)).decode('utf-8'))
+
+class BuildStat(models.Model):
+    """按天、升级类型、工作类型和 NE 汇总的构建统计，构建结束时增量更新
+
+    ne_ip 为空的行统计整个构建，非空的行统计单个 NE 的升级结果。
+    duration_buckets 是耗时直方图，下标对应 stats.DURATION_BUCKETS。
+    """
+    day = models.DateField()
+    upgrade_type = models.CharField(max_length=100)
+    work_type = models.CharField(max_length=100)
+    ne_ip = models.CharField(max_length=64, blank=True, default='')
+    total = models.PositiveIntegerField(default=0)
+    success = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    stopped = models.PositiveIntegerField(default=0)
+    duration_count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    duration_max = models.FloatField(default=0)
+    duration_buckets = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = [('day', 'upgrade_type', 'work_type', 'ne_ip')]
+        indexes = [
+            models.Index(fields=['ne_ip', 'day'], name='buildstat_ne_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.upgrade_type}/{self.work_type} {self.ne_ip or '*'}: {self.success}/{self.total}"
+
 class DeviceType(models.Model):
     """设备类型模型"""
     type_id = models.CharField(max_length=50, unique=True)
@@ -114,6 +523,11 @@ class Device(models.Model):
         verbose_name = '设备'
         verbose_name_plural = '设备列表'
         ordering = ['rack_number', 'position']
+        indexes = [
+            # 设备列表按 (rack_number, position, id) 游标分页，也用于按机架过滤
+            models.Index(fields=['rack_number', 'position', 'id'], name='device_rack_position_idx'),
+            models.Index(fields=['status'], name='device_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.device_type.name}"
@@ -130,6 +544,45 @@ class Rack(models.Model):
         verbose_name_plural = '机架列表'
         ordering = ['row', 'column']
 
+    @classmethod
+    def attach_devices(cls, racks):
+        """一次查询加载这些机架的设备（按 Device.rack_number 与 number 匹配），保存在 rack._devices"""
+        racks = list(racks)
+        by_number = {rack.number: [] for rack in racks}
+        if by_number:
+            devices = (Device.objects.select_related('device_type')
+                       .filter(rack_number__in=list(by_number)).order_by('rack_number', 'position', 'id'))
+            for device in devices:
+                by_number[device.rack_number].append(device)
+        for rack in racks:
+            rack._devices = by_number[rack.number]
+        return racks
+
+    def get_devices(self):
+        if '_devices' not in self.__dict__:
+            Rack.attach_devices([self])
+        return self._devices
+
+    def occupancy(self):
+        """占用情况：每台设备占一个单元（position 从 1 开始），超出范围和重叠的位置单独列出"""
+        devices = self.get_devices()
+        counts = {}
+        out_of_range = 0
+        for device in devices:
+            if 1 <= device.position <= self.total_units:
+                counts[device.position] = counts.get(device.position, 0) + 1
+            else:
+                out_of_range += 1
+        used = len(counts)
+        return {
+            'device_count': len(devices),
+            'used_units': used,
+            'free_units': max(self.total_units - used, 0),
+            'utilization': round(used * 100.0 / self.total_units, 1) if self.total_units else 0.0,
+            'conflicts': sorted(position for position, count in counts.items() if count > 1),
+            'out_of_range': out_of_range,
+        }
+
 class RackConfiguration(models.Model):
     """机架配置模型"""
     rack_number = models.CharField(max_length=50)
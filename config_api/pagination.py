@@ -0,0 +1,125 @@
+"""基于游标（keyset）的分页工具
+
+日志按 id 递增翻页，构建历史按 (created_at, id) 倒序翻页，设备按
+(rack_number, position, id) 顺序翻页。每页只查询一次，响应时间不随表的总量增长。
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import BuildLog
+
+
+class InvalidCursor(ValueError):
+    """无法解析的分页游标"""
+
+
+def parse_int_param(request, name, default=0):
+    """读取整数查询参数，非法值按默认值处理"""
+    try:
+        return int(request.query_params.get(name, default) or default)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_page_size(request, default, maximum, name='page_size'):
+    """读取每页条数并限制在 [1, maximum] 内"""
+    return max(1, min(parse_int_param(request, name, default), maximum))
+
+
+def log_page_size(request, name='page_size'):
+    return parse_page_size(
+        request,
+        getattr(settings, 'BUILD_LOG_PAGE_SIZE', 1000),
+        getattr(settings, 'BUILD_LOG_MAX_PAGE_SIZE', 5000),
+        name=name
+    )
+
+
+def fetch_log_page(build_id, after_id=0, limit=1000):
+    """获取 after_id 之后的一页日志（已序列化），返回 (日志列表, 是否还有下一页)
+
+    先从压缩归档段读取，再接上未归档的日志行。归档段按 (build, last_log_id)
+    索引查找，没有归档时只多一次空查询；两次读取在同一个事务中，归档器在
+    中途压缩并删除日志行时也不会读到缺页。
+    """
+    from .archive import read_archived_logs
+    from .serializers import BuildLogSerializer
+
+    # 多取一条用于判断是否有下一页，避免额外的 count 查询
+    with transaction.atomic():
+        records = read_archived_logs(build_id, after_id, limit + 1)
+        if records:
+            after_id = records[-1]['id']
+        if len(records) <= limit:
+            logs = BuildLog.objects.filter(build_id=build_id, id__gt=after_id).order_by('id')[:limit + 1 - len(records)]
+            records.extend(BuildLogSerializer(logs, many=True).data)
+    return records[:limit], len(records) > limit
+
+
+def encode_build_cursor(build):
+    """把一页最后一条构建编码为下一页的游标"""
+    raw = f"{build.created_at.isoformat()}|{build.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_build_cursor(cursor):
+    """解析构建历史游标，返回 (created_at, id)，非法时抛出 InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, build_id = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(raw)
+        return created_at, int(build_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def fetch_build_page(queryset, cursor=None, limit=6):
+    """按 (created_at, id) 倒序获取一页构建，返回 (构建列表, 下一页游标或 None)"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, build_id = decode_build_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=build_id))
+    builds = list(queryset[:limit + 1])
+    if len(builds) > limit:
+        return builds[:limit], encode_build_cursor(builds[limit - 1])
+    return builds, None
+
+
+def encode_device_cursor(device):
+    """把一页最后一台设备编码为下一页的游标"""
+    raw = f"{device.position}|{device.id}|{device.rack_number}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_device_cursor(cursor):
+    """解析设备列表游标，返回 (rack_number, position, id)，非法时抛出 InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        # 机架编号可能包含分隔符，放在最后
+        position, device_id, rack_number = raw.split('|', 2)
+        return rack_number, int(position), int(device_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def fetch_device_page(queryset, cursor=None, limit=100):
+    """按 (rack_number, position, id) 顺序获取一页设备，返回 (设备列表, 下一页游标或 None)"""
+    queryset = queryset.order_by('rack_number', 'position', 'id')
+    if cursor:
+        rack_number, position, device_id = decode_device_cursor(cursor)
+        queryset = queryset.filter(
+            Q(rack_number__gt=rack_number)
+            | Q(rack_number=rack_number, position__gt=position)
+            | Q(rack_number=rack_number, position=position, id__gt=device_id)
+        )
+    devices = list(queryset[:limit + 1])
+    if len(devices) > limit:
+        return devices[:limit], encode_device_cursor(devices[limit - 1])
+    return devices, None
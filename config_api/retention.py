@@ -0,0 +1,201 @@
+"""构建记录保留策略
+
+按状态配置保留规则：超过 max_age_days 天或不在最新 keep_latest 条之内的
+构建会被清理。pending / in_progress 的构建永远不会被清理。
+
+删除一个构建时按块删除它的日志、归档段、全文索引、NE 记录，最后删除
+构建本身。每块一个短事务，块之间可暂停，执行中的升级不会长时间等待
+SQLite 写锁。BuildStat 中的统计不受影响。
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Build, BuildLog, BuildLogSegment, BuildTarget, UpgradeJob
+from .search import FTS_TABLE, fts_available
+
+logger = logging.getLogger('config_api')
+
+PURGEABLE_STATUSES = ('success', 'failed', 'stopped')
+
+
+def get_rules(overrides=None):
+    """读取保留规则 {status: {'max_age_days', 'keep_latest'}}，只保留可清理的状态"""
+    rules = dict(getattr(settings, 'BUILD_RETENTION_RULES', None) or {})
+    rules.update(overrides or {})
+    return {
+        build_status: rule for build_status, rule in rules.items()
+        if build_status in PURGEABLE_STATUSES and rule
+        and (rule.get('max_age_days') is not None or rule.get('keep_latest') is not None)
+    }
+
+
+def expired_builds(build_status, max_age_days=None, keep_latest=None, now=None):
+    """某状态下应被清理的构建（QuerySet，按 id 升序）"""
+    queryset = Build.objects.filter(status=build_status)
+    condition = Q()
+    if max_age_days is not None:
+        cutoff = (now or timezone.now()) - timedelta(days=max_age_days)
+        condition |= Q(updated_at__lt=cutoff)
+    if keep_latest is not None:
+        # 第 keep_latest 条之后的都超出保留数量
+        boundary = list(queryset.order_by('-created_at', '-id')
+                        .values_list('created_at', 'id')[keep_latest:keep_latest + 1])
+        if boundary:
+            created_at, build_id = boundary[0]
+            condition |= Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=build_id)
+    if not condition:
+        return queryset.none()
+    return queryset.filter(condition).order_by('id')
+
+
+class PurgeReport:
+    """清理统计"""
+
+    def __init__(self):
+        self.builds = 0
+        self.rows = {}
+        self.started = time.monotonic()
+
+    def add(self, table, count):
+        self.rows[table] = self.rows.get(table, 0) + count
+
+    @property
+    def total_rows(self):
+        return sum(self.rows.values())
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            'builds': self.builds,
+            'rows': dict(self.rows),
+            'total_rows': self.total_rows,
+            'elapsed': round(elapsed, 3),
+            'rows_per_second': round(self.total_rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def _delete_chunks(queryset, table, report, chunk_size, pause):
+    """按 id 分块删除，每块一个短事务"""
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return
+            deleted, _ = queryset.model.objects.filter(id__in=ids).delete()
+        report.add(table, deleted)
+        if pause:
+            time.sleep(pause)
+
+
+def _delete_fts_chunks(build_id, report, chunk_size, pause):
+    """分块删除构建的全文索引行，避免删除构建时触发器一次删除全部"""
+    match = f'build_ref:"#{int(build_id)}#"'
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ("
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)",
+                [match, chunk_size]
+            )
+            deleted = cursor.rowcount
+        if deleted <= 0:
+            return
+        report.add(FTS_TABLE, deleted)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_build(build_id, report, chunk_size=1000, pause=0.0, use_fts=None):
+    """分块删除一个构建及其所有附属数据"""
+    if not Build.objects.filter(id=build_id, status__in=PURGEABLE_STATUSES).exists():
+        return
+    _delete_chunks(BuildLog.objects.filter(build_id=build_id), 'buildlog', report, chunk_size, pause)
+    _delete_chunks(BuildLogSegment.objects.filter(build_id=build_id), 'buildlogsegment', report,
+                   max(1, chunk_size // 100), pause)
+    if use_fts is None:
+        use_fts = fts_available()
+    if use_fts:
+        _delete_fts_chunks(build_id, report, chunk_size, pause)
+    _delete_chunks(BuildTarget.objects.filter(build_id=build_id), 'buildtarget', report, chunk_size, pause)
+    with transaction.atomic():
+        UpgradeJob.objects.filter(build_id=build_id).delete()
+        # 删除前再确认状态，避免清理期间被重新排队的构建
+        deleted, _ = Build.objects.filter(id=build_id, status__in=PURGEABLE_STATUSES).delete()
+    if deleted:
+        report.builds += 1
+        report.add('build', 1)
+
+
+def apply_retention(rules=None, chunk_size=None, pause=None, max_builds=None, dry_run=False, log=None):
+    """按保留规则清理构建，返回 PurgeReport.as_dict()；dry_run 时只统计将被清理的构建"""
+    rules = get_rules() if rules is None else rules
+    chunk_size = chunk_size or getattr(settings, 'BUILD_RETENTION_CHUNK_SIZE', 1000)
+    pause = getattr(settings, 'BUILD_RETENTION_PAUSE', 0.05) if pause is None else pause
+    report = PurgeReport()
+    use_fts = fts_available()
+    now = timezone.now()
+    for build_status, rule in rules.items():
+        queryset = expired_builds(build_status, rule.get('max_age_days'), rule.get('keep_latest'), now=now)
+        if dry_run:
+            count = queryset.count()
+            report.builds += count
+            report.add(f'build:{build_status}', count)
+            continue
+        # 按 id 游标逐批取待清理构建，清理过程中不持有长查询
+        last_id = 0
+        while max_builds is None or report.builds < max_builds:
+            build_ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:100])
+            if not build_ids:
+                break
+            for build_id in build_ids:
+                if max_builds is not None and report.builds >= max_builds:
+                    break
+                purge_build(build_id, report, chunk_size, pause, use_fts)
+                if log:
+                    log(f"Purged build #{build_id} ({build_status})")
+            last_id = build_ids[-1]
+    result = report.as_dict()
+    if report.builds and not dry_run:
+        logger.info(f"构建保留策略清理完成: {result}")
+    return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_retention_scheduler():
+    """按 BUILD_RETENTION_INTERVAL_HOURS 定期执行保留策略（为 0 时不启动）"""
+    global _scheduler
+    interval = float(getattr(settings, 'BUILD_RETENTION_INTERVAL_HOURS', 0) or 0) * 3600
+    if interval <= 0 or not get_rules():
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(
+                target=_retention_loop, args=(interval,), name='build-retention', daemon=True
+            )
+            _scheduler.start()
+    return _scheduler
+
+
+def _retention_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            apply_retention()
+        except Exception as e:
+            logger.error(f"执行构建保留策略失败: {str(e)}")
+        finally:
+            close_old_connections()
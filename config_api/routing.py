@@ -0,0 +1,8 @@
+from django.urls import re_path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'^ws/build/(?P<build_id>\d+)/logs/$', consumers.BuildLogConsumer.as_asgi()),
+    re_path(r'^ws/upgrade/(?P<task_id>[\w-]+)/$', consumers.UpgradeLogConsumer.as_asgi()),
+]
@@ -0,0 +1,182 @@
+"""升级任务执行逻辑
+
+由 executor 的工作线程调用：按 fanout 宽度并发升级构建中的各个 NE，
+日志经 log_sink 批量写入，结束后汇总状态并归档日志。
+"""
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import cancel, stats
+from .archive import archive_completed_build
+from .artifacts import staged_version
+from .drivers import get_driver
+from .events import publish_build_status
+from .log_sink import open_sink
+from .models import Build, BuildTarget
+from .sessions import get_session_pool
+
+logger = logging.getLogger('config_api')
+
+
+def run_job(job):
+    """执行持久化队列中领取到的任务"""
+    run_build(job.build_id, task_id=job.task_id, cancel_requested=job.cancel_requested)
+
+
+def finish_build(build_id, status):
+    """把执行中的构建更新为最终状态；构建已被其他请求停止时不覆盖，返回实际状态"""
+    updated = Build.objects.filter(id=build_id, status='in_progress').update(
+        status=status, updated_at=timezone.now()
+    )
+    if not updated:
+        return Build.objects.filter(id=build_id).values_list('status', flat=True).first()
+    publish_build_status(build_id, status)
+    stats.record_build(build_id)
+    return status
+
+
+def run_build(build_id, task_id=None, cancel_requested=False):
+    """执行升级任务：按 fanout 宽度并发升级构建中的各个 NE"""
+    # 排队期间可能已被停止，只有 pending 的构建才进入执行
+    started = Build.objects.filter(id=build_id, status='pending').update(
+        status='in_progress', updated_at=timezone.now()
+    )
+    if not started:
+        logger.info(f"构建 {build_id} 已不是 pending 状态，跳过执行")
+        return
+    publish_build_status(build_id, 'in_progress')
+    build = Build.objects.get(id=build_id)
+    token = cancel.register(build_id)
+    if cancel_requested:
+        token.cancel("任务在领取前已被停止")
+    sink = open_sink(build_id, task_id=task_id)
+    try:
+        logger.info(f"开始执行升级任务 {build_id}")
+
+        # 记录开始日志
+        sink.write(
+            f"开始升级任务\n"
+            f"升级类型: {build.upgrade_type}\n"
+            f"工作类型: {build.work_type}\n"
+            f"NE IP: {build.ne_ip}\n"
+            f"版本路径: {build.version_path}"
+        )
+
+        targets = list(build.targets.all()) or build.create_targets()
+        if not targets:
+            raise ValueError("未指定 NE IP")
+        # 任务被恢复重跑时，已升级成功的 NE 不再重复升级
+        pending = [target for target in targets if target.status != 'success']
+
+        driver = get_driver(build.upgrade_type, build.work_type)
+        logger.info(f"构建 {build_id} 使用升级驱动: {driver.name}")
+
+        width = max(1, min(len(pending), build.fanout or getattr(settings, 'UPGRADE_FANOUT_WIDTH', 8)))
+        sink.write(f"共 {len(targets)} 个 NE，待升级 {len(pending)} 个，并发数 {width}")
+        logger.info(f"准备调用升级脚本 {build_id}, NE 数量={len(pending)}, 并发数={width}")
+
+        # 版本文件暂存到本地缓存，所有 NE 共用一份
+        with staged_version(build.version_path) as (version_path, artifact):
+            if artifact is not None:
+                sink.write(f"版本文件已缓存: sha256={artifact.digest[:12]}, {artifact.size} bytes")
+            with ThreadPoolExecutor(max_workers=width, thread_name_prefix=f'build-{build_id}-ne') as pool:
+                statuses = list(pool.map(
+                    lambda target: _run_target(build, target, driver, sink, token, version_path,
+                                               prefix=len(targets) > 1),
+                    pending
+                ))
+        statuses += ['success'] * (len(targets) - len(pending))
+
+        # 汇总各 NE 结果：全部成功才算成功，被停止时整体为 stopped
+        succeeded = statuses.count('success')
+        if token.cancelled:
+            final_status = 'stopped'
+        else:
+            final_status = 'success' if succeeded == len(statuses) else 'failed'
+        token.finish()
+
+        # 先写完日志再更新最终状态
+        if final_status == 'stopped':
+            sink.write(
+                f"升级任务已停止 ({succeeded}/{len(statuses)} 成功)，取消耗时 {token.latency * 1000:.0f} ms",
+                log_type='warning'
+            )
+        else:
+            sink.write(
+                f"升级任务完成 ({succeeded}/{len(statuses)})" if final_status == 'success'
+                else f"升级任务失败 ({succeeded}/{len(statuses)} 成功)",
+                log_type='success' if final_status == 'success' else 'error'
+            )
+        sink.flush()
+        logger.info(f"更新构建状态为: {finish_build(build_id, final_status)}")
+
+    except Exception as e:
+        logger.error(f"升级任务异常 {build_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        token.finish()
+        sink.write(f"升级失败: {str(e)}", log_type='error')
+        sink.flush()
+        finish_build(build_id, 'stopped' if token.cancelled else 'failed')
+    finally:
+        sink.close()
+        cancel.unregister(token)
+    archive_completed_build(build_id)
+
+
+def _run_target(build, target, driver, sink, token, version_path, prefix=False):
+    """升级单个 NE，返回该 NE 的最终状态"""
+    label = f"[{target.ne_ip}] " if prefix else ""
+
+    def log_callback(message):
+        """接收升级脚本的日志，缓冲后批量写入；构建被停止时中断升级脚本"""
+        token.check()
+        logger.debug(f"升级日志 [{build.id}/{target.ne_ip}]: {message}")
+        sink.write(f"{label}{message}", target_id=target.id)
+
+    # 检查点：构建已被停止时不再开始新的 NE；停止请求已经结束（并统计）的 NE 不再重复处理
+    unstopped = BuildTarget.objects.filter(id=target.id).exclude(status='stopped')
+    if token.cancelled:
+        if unstopped.update(status='stopped', finished_at=timezone.now()):
+            stats.record_target(build, target.id)
+        close_old_connections()
+        return 'stopped'
+
+    if not unstopped.update(status='in_progress', started_at=timezone.now()):
+        close_old_connections()
+        return 'stopped'
+    try:
+        # 同一 NE 上连续的升级复用会话池中的连接
+        with get_session_pool().session(driver, target.ne_ip) as session:
+            result = driver.upgrade(
+                upgrade_type=build.upgrade_type,
+                work_type=build.work_type,
+                ne_ip=target.ne_ip,
+                version_path=version_path,
+                callback=log_callback,
+                token=token,
+                session=session
+            )
+        logger.info(f"升级脚本执行完成 {build.id}/{target.ne_ip}, result={result}")
+        token.check()
+        target_status, message = ('success', '') if result else ('failed', '升级脚本返回失败')
+    except cancel.UpgradeCancelled as e:
+        logger.info(f"升级已停止 {build.id}/{target.ne_ip}: {str(e)}")
+        sink.write(f"{label}升级已停止", log_type='warning', target_id=target.id)
+        target_status, message = 'stopped', str(e)[:500]
+    except Exception as e:
+        logger.error(f"升级脚本执行错误 {build.id}/{target.ne_ip}: {str(e)}")
+        logger.error(traceback.format_exc())
+        sink.write(f"{label}升级失败: {str(e)}", log_type='error', target_id=target.id)
+        target_status, message = 'failed', str(e)[:500]
+    BuildTarget.objects.filter(id=target.id).update(
+        status=target_status, message=message, finished_at=timezone.now()
+    )
+    stats.record_target(build, target.id)
+    # 扇出线程各自持有数据库连接，用完即关闭
+    close_old_connections()
+    return target_status
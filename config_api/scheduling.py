@@ -0,0 +1,217 @@
+"""升级任务调度
+
+排队任务按以下顺序领取：
+
+1. 优先级（high / normal / low），低优先级任务每排队 UPGRADE_PRIORITY_AGING_SECONDS
+   提升一级，不会被持续提交的高优先级任务饿死；
+2. 执行中构建较少的环境优先；
+3. 最久没有被领取过任务的环境优先（环境间轮转）；
+4. 先入队的任务优先。
+
+环境由构建 NE 在 Config.env_ip_map 中所属的 ne_env 决定，每个环境同时执行的
+构建数受 UPGRADE_ENV_CONCURRENCY 限制，已满的环境的任务留在队列中等待；
+NE 不属于任何环境的构建默认不限制。
+queue_snapshot 按同样的规则和历史平均耗时推算每个排队构建的位置和预计开始时间。
+"""
+import heapq
+import itertools
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import EnvironmentIP, UpgradeJob
+from .stats import average_durations
+
+PRIORITIES = {label: value for value, label in UpgradeJob.PRIORITY_CHOICES}
+PRIORITY_LABELS = dict(UpgradeJob.PRIORITY_CHOICES)
+DEFAULT_PRIORITY = PRIORITIES['normal']
+
+# 环境轮转状态：环境 -> 最近一次领取任务的序号（进程内）
+_served = {}
+_served_counter = itertools.count(1)
+_served_lock = threading.Lock()
+
+
+def parse_priority(value):
+    """解析 API 传入的优先级（名称或数值），为空时返回默认优先级，非法时抛出 ValueError"""
+    if value is None or value == '':
+        return DEFAULT_PRIORITY
+    if isinstance(value, str) and value.strip().lower() in PRIORITIES:
+        return PRIORITIES[value.strip().lower()]
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = None
+    if number not in PRIORITY_LABELS:
+        raise ValueError(f"Invalid priority: {value} (expected one of {', '.join(PRIORITIES)})")
+    return number
+
+
+def parse_fanout(value):
+    """解析 API 传入的 fanout（同时升级的 NE 数），为空时返回 None 使用全局配置
+
+    取值为 1 到 UPGRADE_MAX_FANOUT 的整数，非法时抛出 ValueError。
+    """
+    if value is None or value == '':
+        return None
+    max_fanout = getattr(settings, 'UPGRADE_MAX_FANOUT', 64)
+    number = None
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            number = int(value)
+        except ValueError:
+            pass
+    if number is None or not 1 <= number <= max_fanout:
+        raise ValueError(f"Invalid fanout: {value} (expected an integer between 1 and {max_fanout})")
+    return number
+
+
+def resolve_environment(ne_ips):
+    """构建所属的环境：NE 最多的环境，都不属于任何环境时返回空字符串
+
+    一个 NE 属于多个环境时以先创建的配置中的环境为准。
+    """
+    owners = EnvironmentIP.lookup(ne_ips)
+    counts = {}
+    for ip in ne_ips:
+        if ip in owners:
+            env = owners[ip][0][1]
+            counts[env] = counts.get(env, 0) + 1
+    if not counts:
+        return ''
+    # max 在数量相同时保留先出现的环境
+    return max(counts, key=counts.get)
+
+
+def environment_cap(environment):
+    """环境同时执行的构建数上限，0 表示不限制
+
+    不属于任何环境的构建（environment 为空）不使用默认上限，只有
+    UPGRADE_ENV_CONCURRENCY 中明确配置了 "" 时才受限制。
+    """
+    caps = getattr(settings, 'UPGRADE_ENV_CONCURRENCY', None) or {}
+    default = 0 if not environment else getattr(settings, 'UPGRADE_ENV_DEFAULT_CONCURRENCY', 0)
+    return int(caps.get(environment, default) or 0)
+
+
+def running_by_environment():
+    """各环境执行中的任务数"""
+    return dict(
+        UpgradeJob.objects.filter(state='leased').order_by()
+        .values_list('environment').annotate(count=Count('id'))
+    )
+
+
+def effective_priority(priority, created_at, now):
+    aging = float(getattr(settings, 'UPGRADE_PRIORITY_AGING_SECONDS', 0) or 0)
+    if aging > 0:
+        priority -= int((now - created_at).total_seconds() // aging)
+    return max(0, priority)
+
+
+def _order_key(job, running, served, now):
+    return (
+        effective_priority(job['priority'], job['created_at'], now),
+        running.get(job['environment'], 0),
+        served.get(job['environment'], 0),
+        job['id'],
+    )
+
+
+def _has_capacity(environment, running):
+    cap = environment_cap(environment)
+    return not cap or running.get(environment, 0) < cap
+
+
+def ordered_candidates(queued, running, now=None):
+    """按调度顺序排列当前可以领取的排队任务（所在环境未满）"""
+    now = now or timezone.now()
+    with _served_lock:
+        served = dict(_served)
+    candidates = [job for job in queued if _has_capacity(job['environment'], running)]
+    return sorted(candidates, key=lambda job: _order_key(job, running, served, now))
+
+
+def mark_served(environment):
+    """记录环境刚领取了一个任务，供环境间轮转"""
+    with _served_lock:
+        _served[environment] = next(_served_counter)
+
+
+def queue_snapshot(max_workers, now=None):
+    """推算排队构建的执行顺序和预计开始时间
+
+    假设只有 max_workers 个工作线程、执行中的构建按历史平均耗时结束。返回
+    {build_id: {'position', 'queue_length', 'priority', 'environment',
+    'expected_start', 'expected_wait_seconds'}}，执行中的构建 position 为 0。
+    """
+    now = now or timezone.now()
+    jobs = list(UpgradeJob.objects.filter(state__in=('queued', 'leased')).values(
+        'id', 'build_id', 'state', 'priority', 'environment', 'created_at', 'updated_at',
+        'build__upgrade_type', 'build__work_type'
+    ))
+    if not jobs:
+        return {}
+    averages = average_durations()
+    default_seconds = averages.get(None) or float(getattr(settings, 'UPGRADE_DEFAULT_BUILD_SECONDS', 600))
+
+    def duration(job):
+        return averages.get((job['build__upgrade_type'], job['build__work_type']), default_seconds)
+
+    result = {}
+    # 每个执行中的构建预计还需多久结束（秒），已超时的视为即将结束
+    finishing = {}
+    slots = []
+    for job in jobs:
+        if job['state'] != 'leased':
+            continue
+        remaining = max(1.0, duration(job) - (now - job['updated_at']).total_seconds())
+        finishing.setdefault(job['environment'], []).append(remaining)
+        slots.append(remaining)
+        result[job['build_id']] = _entry(job, 0, job['updated_at'], 0.0)
+    # 空闲线程可以立即开始，多进程时执行中的任务可能多于本进程的线程数
+    slots.extend([0.0] * max(0, int(max_workers) - len(slots)))
+    heapq.heapify(slots)
+
+    pending = [job for job in jobs if job['state'] == 'queued']
+    with _served_lock:
+        served = dict(_served)
+    serial = max(served.values(), default=0)
+    position = 0
+    clock = 0.0
+    while pending:
+        clock = max(clock, heapq.heappop(slots))
+        while True:
+            running = {env: sum(1 for end in ends if end > clock) for env, ends in finishing.items()}
+            at = now + timedelta(seconds=clock)
+            candidates = [job for job in pending if _has_capacity(job['environment'], running)]
+            if candidates:
+                break
+            # 所有排队任务的环境都已满，等待其中最早结束的构建
+            clock = min(end for job in pending for end in finishing.get(job['environment'], []) if end > clock)
+        job = min(candidates, key=lambda item: _order_key(item, running, served, at))
+        pending.remove(job)
+        position += 1
+        serial += 1
+        served[job['environment']] = serial
+        end = clock + duration(job)
+        finishing.setdefault(job['environment'], []).append(end)
+        heapq.heappush(slots, end)
+        result[job['build_id']] = _entry(job, position, now, clock)
+    for entry in result.values():
+        entry['queue_length'] = position
+    return result
+
+
+def _entry(job, position, start, wait_seconds):
+    return {
+        'position': position,
+        'queue_length': 0,
+        'priority': PRIORITY_LABELS.get(job['priority'], job['priority']),
+        'environment': job['environment'] or None,
+        'expected_start': (start + timedelta(seconds=wait_seconds)).isoformat(),
+        'expected_wait_seconds': round(wait_seconds, 1),
+    }
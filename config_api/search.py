@@ -0,0 +1,177 @@
+"""构建日志全文搜索
+
+基于迁移 0011 创建的 FTS5 表 config_api_buildlog_fts：rowid 即 BuildLog.id，
+新日志由触发器写入，归档后的日志仍保留在索引中，删除日志行（未归档）、
+日志段或构建时触发器同步删除索引行。查询按整段子串匹配，
+少于 3 个字符时 trigram 索引无法使用，退回 LIKE 扫描索引表。
+非 SQLite 数据库退回 BuildLog.message 的 icontains 查询。
+"""
+from datetime import timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Count, Max
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+
+from .models import BuildLog
+
+FTS_TABLE = 'config_api_buildlog_fts'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _phrase(query):
+    """把用户输入转成 FTS5 短语，避免引号、运算符被当作查询语法"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _like(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _match_clause(query, build_id=None):
+    """返回 (WHERE 子句, 参数, 是否可高亮)；FTS5 每次查询只能有一个 MATCH"""
+    build_ref = f'build_ref:"#{int(build_id)}#"' if build_id is not None else None
+    if len(query) >= 3:
+        expression = f"message:{_phrase(query)}"
+        if build_ref:
+            expression += f" AND {build_ref}"
+        return f"{FTS_TABLE} MATCH %s", [expression], True
+    if build_ref:
+        return f"{FTS_TABLE} MATCH %s AND message LIKE %s ESCAPE '\\'", [build_ref, _like(query)], False
+    return "message LIKE %s ESCAPE '\\'", [_like(query)], False
+
+
+def _timestamp(value):
+    if not value:
+        return None
+    parsed = parse_datetime(str(value).replace(' ', 'T', 1))
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed.isoformat() if parsed else value
+
+
+def search_logs(query, build_id=None, before_id=None, limit=50):
+    """按日志 id 倒序（最新优先）搜索，返回 (结果列表, 是否还有下一页)
+
+    before_id 为上一页最后一条的 id。结果中 highlight 为加了 <mark> 标记的
+    日志内容（已做 HTML 转义）。
+    """
+    if not fts_available():
+        return _search_fallback(query, build_id, before_id, limit)
+    where, params, highlight = _match_clause(query, build_id)
+    if before_id:
+        where += " AND rowid < %s"
+        params.append(int(before_id))
+    highlight_sql = (
+        f"highlight({FTS_TABLE}, 0, char(1), char(2))" if highlight else "message"
+    )
+    sql = (
+        f"SELECT rowid, build_id, log_type, timestamp, message, {highlight_sql} "
+        f"FROM {FTS_TABLE} WHERE {where} ORDER BY rowid DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit + 1])
+        rows = cursor.fetchall()
+    results = [
+        {
+            'id': row[0],
+            'build': int(row[1]),
+            'log_type': row[2],
+            'timestamp': _timestamp(row[3]),
+            'message': row[4],
+            'highlight': _render_highlight(row[5]) if highlight else _highlight_plain(row[4], query),
+        }
+        for row in rows[:limit]
+    ]
+    return results, len(rows) > limit
+
+
+def matching_builds(query, limit=100):
+    """命中次数最多的构建（按最近一次命中倒序），返回 [{'build', 'matches', 'last_log_id'}]"""
+    if not fts_available():
+        return _matching_builds_fallback(query, limit)
+    where, params, _ = _match_clause(query)
+    sql = (
+        f"SELECT build_id, COUNT(*), MAX(rowid) FROM {FTS_TABLE} WHERE {where} "
+        f"GROUP BY build_id ORDER BY MAX(rowid) DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return [
+            {'build': int(build), 'matches': matches, 'last_log_id': last_id}
+            for build, matches, last_id in cursor.fetchall()
+        ]
+
+
+def filter_logs(queryset, query):
+    """只保留命中 query 的日志（供后台搜索使用）
+
+    以子查询 id IN (SELECT rowid FROM FTS 表 ...) 过滤，不把命中的 id 取回 Python，
+    也不限制命中数量。
+    """
+    if not fts_available():
+        return queryset.filter(message__icontains=query)
+    where, params, _ = _match_clause(query)
+    return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {where}", params))
+
+
+def _render_highlight(marked):
+    # 先以控制字符标记命中位置，转义 HTML 后再换成 <mark>
+    return escape(marked).replace('\x01', HIGHLIGHT_START).replace('\x02', HIGHLIGHT_END)
+
+
+def _highlight_plain(message, query):
+    if not query:
+        return escape(message)
+    parts = []
+    lowered = message.lower()
+    needle = query.lower()
+    start = 0
+    while True:
+        index = lowered.find(needle, start)
+        if index < 0:
+            parts.append(escape(message[start:]))
+            break
+        parts.append(escape(message[start:index]))
+        parts.append(HIGHLIGHT_START + escape(message[index:index + len(query)]) + HIGHLIGHT_END)
+        start = index + len(query)
+    return ''.join(parts)
+
+
+def _search_fallback(query, build_id, before_id, limit):
+    logs = BuildLog.objects.filter(message__icontains=query)
+    if build_id is not None:
+        logs = logs.filter(build_id=build_id)
+    if before_id:
+        logs = logs.filter(id__lt=before_id)
+    logs = list(logs.order_by('-id')[:limit + 1])
+    results = [
+        {
+            'id': log.id,
+            'build': log.build_id,
+            'log_type': log.log_type,
+            'timestamp': log.timestamp.isoformat(),
+            'message': log.message,
+            'highlight': _highlight_plain(log.message, query),
+        }
+        for log in logs[:limit]
+    ]
+    return results, len(logs) > limit
+
+
+def _matching_builds_fallback(query, limit):
+    rows = (BuildLog.objects.filter(message__icontains=query).values('build_id')
+            .annotate(matches=Count('id'), last_log_id=Max('id')).order_by('-last_log_id')[:limit])
+    return [{'build': row['build_id'], 'matches': row['matches'], 'last_log_id': row['last_log_id']} for row in rows]
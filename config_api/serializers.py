@@ -1,5 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Config, Build, BuildLog, Device, Rack
+from .models import Config, Build, BuildLog, BuildTarget, Device, Rack, clean_entry, split_ips
+from .scheduling import parse_fanout, queue_snapshot
 import logging
 import json
 
@@ -15,12 +17,14 @@ class ConfigSerializer(serializers.ModelSerializer):
         fields = ['id', 'upgrade_type', 'work_type', 'environments']
 
     def to_representation(self, instance):
-        data = super().to_representation(instance)
-        data['upgrade_type'] = instance.get_upgrade_type() or []
-        data['work_type'] = instance.get_work_type() or []
+        # 各字段来自规范化的关联表，预取 options 和 environments__ips 时不再额外查询
         env_ip_map = instance.get_env_ip_map() or {}
-        data['environments'] = [{'ne_env': k, 'ne_ip_list': v} for k, v in env_ip_map.items()]
-        return data
+        return {
+            'id': instance.id,
+            'upgrade_type': instance.get_upgrade_type() or [],
+            'work_type': instance.get_work_type() or [],
+            'environments': [{'ne_env': k, 'ne_ip_list': v} for k, v in env_ip_map.items()],
+        }
 
     def to_internal_value(self, data):
         internal_data = {}
@@ -57,9 +61,22 @@ class ConfigSerializer(serializers.ModelSerializer):
                     if 'ne_env' in env and 'ne_ip_list' in env:
                         env_ip_map[env['ne_env']] = env['ne_ip_list']
                 internal_data['env_ip_map'] = env_ip_map
+            self._validate_env_ips(internal_data['env_ip_map'])
         
         return internal_data
 
+    def _validate_env_ips(self, env_ip_map):
+        # ne_ip_list 中每项可以是地址、CIDR（10.0.0.0/24）、范围（10.0.0.1-10.0.0.50）或主机名
+        errors = []
+        for name, ips in env_ip_map.items():
+            for entry in split_ips(ips):
+                try:
+                    clean_entry(entry)
+                except ValueError as e:
+                    errors.append(f"{name}: {str(e)}")
+        if errors:
+            raise serializers.ValidationError({'environments': errors[:20]})
+
     def create(self, validated_data):
         upgrade_type = validated_data.get('upgrade_type', [])
         work_type = validated_data.get('work_type', [])
@@ -68,6 +85,11 @@ class ConfigSerializer(serializers.ModelSerializer):
         instance.set_upgrade_type(upgrade_type)
         instance.set_work_type(work_type)
         instance.set_env_ip_map(env_ip_map)
+        # 已有内容相同的配置时直接使用它，不再新建重复的配置
+        duplicate = instance.find_duplicate()
+        if duplicate is not None:
+            logger.info(f"配置内容与已有配置 {duplicate.id} 相同，不再新建")
+            return duplicate
         instance.save()
         return instance
 
@@ -84,15 +106,53 @@ class ConfigSerializer(serializers.ModelSerializer):
 class BuildLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = BuildLog
-        fields = ['id', 'message', 'log_type', 'timestamp']
+        fields = ['id', 'message', 'log_type', 'timestamp', 'target']
+
+class BuildTargetSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = BuildTarget
+        fields = ['id', 'ne_ip', 'status', 'message', 'started_at', 'finished_at', 'duration']
 
 class BuildSerializer(serializers.ModelSerializer):
+    targets = BuildTargetSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+    queue = serializers.SerializerMethodField()
+    fanout = serializers.IntegerField(required=False, allow_null=True, min_value=1,
+                                      help_text='同时升级的 NE 数，为空时使用全局配置')
+
     class Meta:
         model = Build
         fields = ['id', 'upgrade_type', 'work_type', 'ne_ip', 'ne_ip_input', 
-                 'version_path', 'status', 'created_at', 'updated_at']
+                 'version_path', 'status', 'fanout', 'targets', 'progress', 'queue',
+                 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_progress(self, obj):
+        """各状态的 NE 数量"""
+        progress = {key: 0 for key, _ in Build.STATUS_CHOICES}
+        targets = obj.targets.all()
+        for target in targets:
+            progress[target.status] = progress.get(target.status, 0) + 1
+        progress['total'] = len(targets)
+        return progress
+
+    def get_queue(self, obj):
+        """排队中的构建的队列位置和预计开始时间，同一次序列化只推算一次"""
+        if obj.status != 'pending':
+            return None
+        if 'queue' not in self.context:
+            self.context['queue'] = queue_snapshot(getattr(settings, 'UPGRADE_MAX_WORKERS', 4))
+        return self.context['queue'].get(obj.id)
+
+    def validate_fanout(self, value):
+        # 与创建接口使用同一规则，上限可配置，在校验时读取
+        try:
+            return parse_fanout(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
     def create(self, validated_data):
         logger.info(f"正在创建构建记录: {validated_data}")
         instance = super().create(validated_data)
@@ -100,13 +160,24 @@ class BuildSerializer(serializers.ModelSerializer):
         return instance
 
 class DeviceSerializer(serializers.ModelSerializer):
+    # 列表查询 select_related('device_type')，读取类型名称不再额外查询
+    device_type_name = serializers.CharField(source='device_type.name', read_only=True)
+
     class Meta:
         model = Device
         fields = '__all__'
 
 class RackSerializer(serializers.ModelSerializer):
-    devices = DeviceSerializer(many=True, read_only=True)
+    # Rack 与 Device 之间没有外键，按 rack_number 匹配；列表先用 Rack.attach_devices 一次加载
+    devices = serializers.SerializerMethodField()
+    occupancy = serializers.SerializerMethodField()
     
     class Meta:
         model = Rack
         fields = '__all__'
+
+    def get_devices(self, obj):
+        return DeviceSerializer(obj.get_devices(), many=True).data
+
+    def get_occupancy(self, obj):
+        return obj.occupancy()
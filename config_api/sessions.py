@@ -0,0 +1,209 @@
+"""NE 会话池
+
+同一 NE 上连续执行的升级复用已建立的会话，省去每次连接和认证的握手。
+会话按 (驱动名, NE 地址) 分组，每个 NE 的会话数有上限；空闲超时的会话
+由后台线程关闭，空闲一段时间后再次取用前先做健康检查。升级异常或被
+停止时会话直接关闭，不放回池中。
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('config_api')
+
+
+class PoolExhausted(Exception):
+    """等待空闲会话超时"""
+
+
+class _PooledSession:
+    __slots__ = ('session', 'created_at', 'last_used', 'uses')
+
+    def __init__(self, session):
+        self.session = session
+        self.created_at = self.last_used = time.monotonic()
+        self.uses = 0
+
+
+class SessionPool:
+    """按 NE 地址分组的会话池"""
+
+    def __init__(self, max_per_host=2, idle_timeout=300, health_check_interval=30, acquire_timeout=60):
+        self.max_per_host = max(1, int(max_per_host))
+        self.idle_timeout = float(idle_timeout)
+        self.health_check_interval = float(health_check_interval)
+        self.acquire_timeout = float(acquire_timeout)
+        self._idle = {}
+        self._open = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.created = 0
+        self.closed = 0
+        self.evicted = 0
+        self.health_failures = 0
+        self.connect_errors = 0
+
+    @contextmanager
+    def session(self, driver, ne_ip):
+        """取出一个可用会话，驱动不支持会话时返回 None"""
+        if not getattr(driver, 'supports_sessions', False):
+            yield None
+            return
+        key = (driver.name, ne_ip)
+        pooled = self._acquire(key, driver)
+        try:
+            yield pooled.session
+        except BaseException:
+            self._close(key, pooled)
+            raise
+        self._release(key, pooled)
+
+    def _acquire(self, key, driver):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    pooled = idle.pop()
+                    break
+                if self._open.get(key, 0) < self.max_per_host:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f"No session available for {key[1]} within {self.acquire_timeout}s")
+                self.waits += 1
+                self._cond.wait(remaining)
+
+        if pooled is not None:
+            if time.monotonic() - pooled.last_used < self.health_check_interval or self._healthy(pooled):
+                with self._cond:
+                    self.hits += 1
+                pooled.uses += 1
+                return pooled
+            with self._cond:
+                self.health_failures += 1
+            self._close(key, pooled, keep_slot=True)
+
+        with self._cond:
+            self.misses += 1
+        try:
+            pooled = _PooledSession(driver.open_session(key[1]))
+        except Exception:
+            with self._cond:
+                self.connect_errors += 1
+                self._free_slot(key)
+            raise
+        with self._cond:
+            self.created += 1
+        self._ensure_reaper()
+        pooled.uses += 1
+        return pooled
+
+    def _healthy(self, pooled):
+        try:
+            return bool(pooled.session.is_alive())
+        except Exception as e:
+            logger.warning(f"会话健康检查失败: {str(e)}")
+            return False
+
+    def _release(self, key, pooled):
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.setdefault(key, []).append(pooled)
+            self._cond.notify()
+
+    def _close(self, key, pooled, keep_slot=False):
+        try:
+            pooled.session.close()
+        except Exception as e:
+            logger.warning(f"关闭会话失败 {key[1]}: {str(e)}")
+        with self._cond:
+            self.closed += 1
+            if not keep_slot:
+                self._free_slot(key)
+
+    def _free_slot(self, key):
+        self._open[key] -= 1
+        if not self._open[key]:
+            del self._open[key]
+        self._cond.notify()
+
+    def prune(self):
+        """关闭空闲超时的会话，返回关闭数量"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                keep = [pooled for pooled in idle if now - pooled.last_used < self.idle_timeout]
+                expired.extend((key, pooled) for pooled in idle if now - pooled.last_used >= self.idle_timeout)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            self.evicted += len(expired)
+        for key, pooled in expired:
+            self._close(key, pooled)
+        return len(expired)
+
+    def close_all(self):
+        with self._cond:
+            idle = [(key, pooled) for key, sessions in self._idle.items() for pooled in sessions]
+            self._idle.clear()
+        for key, pooled in idle:
+            self._close(key, pooled)
+
+    def _ensure_reaper(self):
+        with self._cond:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name='ne-session-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        tick = max(0.05, min(self.idle_timeout / 2, 30))
+        while True:
+            time.sleep(tick)
+            self.prune()
+
+    def stats(self):
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'waits': self.waits,
+                'created': self.created,
+                'closed': self.closed,
+                'evicted': self.evicted,
+                'health_failures': self.health_failures,
+                'connect_errors': self.connect_errors,
+                'open': sum(self._open.values()),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'hosts': len(self._open),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_session_pool():
+    """获取进程内共享的会话池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool(
+                max_per_host=getattr(settings, 'UPGRADE_SESSION_MAX_PER_HOST', 2),
+                idle_timeout=getattr(settings, 'UPGRADE_SESSION_IDLE_TIMEOUT', 300),
+                health_check_interval=getattr(settings, 'UPGRADE_SESSION_HEALTH_INTERVAL', 30),
+                acquire_timeout=getattr(settings, 'UPGRADE_SESSION_ACQUIRE_TIMEOUT', 60),
+            )
+        return _pool
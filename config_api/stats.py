@@ -0,0 +1,190 @@
+"""构建统计
+
+构建或 NE 结束时把结果累加到 BuildStat 的当天汇总行，不需要扫描 Build /
+BuildLog 历史。耗时按固定分桶记录直方图，p50/p95 由直方图估算。
+查询只读取时间范围内的汇总行，耗时与历史总量无关。
+"""
+import bisect
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Build, BuildStat, BuildTarget
+
+logger = logging.getLogger('config_api')
+
+# 耗时分桶上界（秒），最后一个桶收纳更长的耗时
+DURATION_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+FINAL_STATUSES = ('success', 'failed', 'stopped')
+STAT_FIELDS = ('upgrade_type', 'work_type', 'status', 'created_at', 'updated_at')
+
+
+def bucket_index(seconds):
+    return bisect.bisect_left(DURATION_BUCKETS, seconds)
+
+
+def _record(day, upgrade_type, work_type, ne_ip, status, duration):
+    if status not in FINAL_STATUSES:
+        return
+    key = {'day': day, 'upgrade_type': upgrade_type, 'work_type': work_type, 'ne_ip': ne_ip}
+    changes = {'total': F('total') + 1, status: F(status) + 1}
+    if duration is not None:
+        duration = max(0.0, duration)
+        changes.update({
+            'duration_count': F('duration_count') + 1,
+            'duration_sum': F('duration_sum') + duration,
+            'duration_max': Greatest(F('duration_max'), duration),
+        })
+    with transaction.atomic():
+        # 事务的第一条语句就是 UPDATE：汇总行被锁住直到提交（SQLite 下为整库写锁），
+        # 其他线程或进程对同一行的更新依次进行，之后读改写直方图不会丢失更新
+        if not BuildStat.objects.filter(**key).update(**changes):
+            try:
+                with transaction.atomic():
+                    BuildStat.objects.create(**key)
+            except IntegrityError:
+                # 其他进程同时创建了该行
+                pass
+            BuildStat.objects.filter(**key).update(**changes)
+        if duration is not None:
+            stat = BuildStat.objects.select_for_update().only('id', 'duration_buckets').get(**key)
+            buckets = list(stat.duration_buckets) or [0] * (len(DURATION_BUCKETS) + 1)
+            buckets[bucket_index(duration)] += 1
+            BuildStat.objects.filter(id=stat.id).update(duration_buckets=buckets)
+
+
+def record_build(build_id):
+    """构建进入最终状态后累加统计，调用方保证每个构建只调用一次
+
+    在事务中调用时应放到 transaction.on_commit 里，避免长时间持有汇总行的锁。
+    """
+    try:
+        _record_build(Build.objects.only(*STAT_FIELDS).get(id=build_id))
+    except Exception as e:
+        # 统计失败不影响构建结果
+        logger.error(f"更新构建统计失败 {build_id}: {str(e)}")
+
+
+def _record_build(build):
+    _record(
+        timezone.localdate(build.created_at), build.upgrade_type, build.work_type, '',
+        build.status, (build.updated_at - build.created_at).total_seconds()
+    )
+
+
+def record_target(build, target_id):
+    """NE 进入最终状态后累加该 NE 的统计，包括未开始就被停止的 NE（不计耗时）"""
+    try:
+        target = BuildTarget.objects.get(id=target_id)
+        _record(
+            timezone.localdate(build.created_at), build.upgrade_type, build.work_type, target.ne_ip,
+            target.status, target.duration
+        )
+    except Exception as e:
+        logger.error(f"更新 NE 统计失败 {build.id}/{target_id}: {str(e)}")
+
+
+def record_targets(build, target_ids):
+    for target_id in target_ids:
+        record_target(build, target_id)
+
+
+def percentile(buckets, fraction):
+    """由直方图估算分位数，返回所在分桶的上界（秒）"""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= rank:
+            return DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else None
+    return None
+
+
+def summarize(rows):
+    """合并多行汇总"""
+    result = {'total': 0, 'success': 0, 'failed': 0, 'stopped': 0}
+    buckets = [0] * (len(DURATION_BUCKETS) + 1)
+    duration_count = 0
+    duration_sum = 0.0
+    duration_max = 0.0
+    for row in rows:
+        for key in result:
+            result[key] += row[key]
+        for index, count in enumerate(row['duration_buckets'] or []):
+            buckets[index] += count
+        duration_count += row['duration_count']
+        duration_sum += row['duration_sum']
+        duration_max = max(duration_max, row['duration_max'])
+    result['success_rate'] = round(result['success'] / result['total'], 4) if result['total'] else None
+    result['avg_duration'] = round(duration_sum / duration_count, 3) if duration_count else None
+    result['max_duration'] = round(duration_max, 3) if duration_count else None
+    result['p50_duration'] = percentile(buckets, 0.5)
+    result['p95_duration'] = percentile(buckets, 0.95)
+    return result
+
+
+def query_stats(days=7, upgrade_type=None, work_type=None, ne_ip=''):
+    """最近 days 天的汇总、每日吞吐和按类型拆分的统计"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = BuildStat.objects.filter(ne_ip=ne_ip, day__gte=since)
+    if upgrade_type:
+        rows = rows.filter(upgrade_type=upgrade_type)
+    if work_type:
+        rows = rows.filter(work_type=work_type)
+    rows = list(rows.values(
+        'day', 'upgrade_type', 'work_type', 'total', 'success', 'failed', 'stopped',
+        'duration_count', 'duration_sum', 'duration_max', 'duration_buckets'
+    ))
+
+    by_day = {}
+    by_type = {}
+    for row in rows:
+        by_day.setdefault(row['day'], []).append(row)
+        by_type.setdefault((row['upgrade_type'], row['work_type']), []).append(row)
+    return {
+        'since': since.isoformat(),
+        'days': days,
+        'ne_ip': ne_ip or None,
+        'summary': summarize(rows),
+        'daily': [
+            {'day': day.isoformat(), **summarize(day_rows)}
+            for day, day_rows in sorted(by_day.items())
+        ],
+        'by_type': [
+            {'upgrade_type': key[0], 'work_type': key[1], **summarize(type_rows)}
+            for key, type_rows in sorted(by_type.items())
+        ],
+    }
+
+
+def average_durations(days=14):
+    """最近 days 天每种 (upgrade_type, work_type) 构建的平均耗时（秒），键 None 为全部构建的平均值"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = {}
+    for row in BuildStat.objects.filter(ne_ip='', day__gte=since, duration_count__gt=0).values_list(
+            'upgrade_type', 'work_type', 'duration_count', 'duration_sum'):
+        for key in ((row[0], row[1]), None):
+            count, total = totals.get(key, (0, 0.0))
+            totals[key] = (count + row[2], total + row[3])
+    return {key: total / count for key, (count, total) in totals.items()}
+
+
+def rebuild_stats(batch_size=1000):
+    """清空并按历史构建重新计算全部统计，返回处理的构建数"""
+    BuildStat.objects.all().delete()
+    count = 0
+    builds = Build.objects.filter(status__in=FINAL_STATUSES).only(*STAT_FIELDS)
+    for build in builds.iterator(chunk_size=batch_size):
+        _record_build(build)
+        record_targets(build, BuildTarget.objects.filter(
+            build_id=build.id, status__in=FINAL_STATUSES
+        ).values_list('id', flat=True))
+        count += 1
+    return count
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from config_api.archive import archive_build_logs, archive_completed_build, read_archived_logs
+from config_api.models import Build, BuildLog, BuildLogSegment
+
+
+class ArchiveTests(TestCase):
+
+    def _build(self, status='success', lines=25):
+        build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.1',
+                                     version_path='/x', status=status)
+        BuildLog.objects.bulk_create([
+            BuildLog(build=build, message=f'传输进度 {index}% ' + 'x' * 40, log_type='info') for index in range(lines)
+        ])
+        return build
+
+    def _messages(self, build, **params):
+        response = self.client.get(f'/api/build/{build.id}/logs/', dict({'limit': 1000}, **params)).json()
+        return [log['message'] for log in response['logs']]
+
+    def test_logs_are_compressed_into_segments(self):
+        build = self._build()
+        expected = self._messages(build)
+        result = archive_build_logs(build.id, chunk_size=10)
+
+        self.assertEqual((result['lines'], result['segments']), (25, 3))
+        self.assertLess(result['compressed_bytes'], result['raw_bytes'])
+        self.assertFalse(BuildLog.objects.filter(build=build).exists())
+        self.assertEqual(list(BuildLogSegment.objects.filter(build=build).values_list('line_count', flat=True)),
+                         [10, 10, 5])
+        self.assertEqual(self._messages(build), expected)
+
+    def test_cursor_inside_a_segment_and_newer_rows(self):
+        build = self._build()
+        ids = list(BuildLog.objects.filter(build=build).order_by('id').values_list('id', flat=True))
+        archive_build_logs(build.id, chunk_size=10)
+        BuildLog.objects.create(build=build, message='late line')
+
+        self.assertEqual([record['id'] for record in read_archived_logs(build.id, ids[12], 4)], ids[13:17])
+        messages = self._messages(build, last_log_id=ids[22])
+        self.assertEqual(messages[-1], 'late line')
+        self.assertEqual(len(messages), 3)
+
+    def test_archived_logs_are_read_whatever_the_build_status(self):
+        # 读取时的状态可能已经过时：构建刚结束、归档器已经压缩并删除了日志行
+        build = self._build(status='in_progress')
+        expected = self._messages(build)
+        archive_build_logs(build.id, chunk_size=10)
+
+        self.assertEqual(self._messages(build), expected)
+        response = self.client.get(f'/api/build/{build.id}/build_logs/', {'page_size': 20}).json()
+        self.assertEqual([log['message'] for log in response['logs']], expected[:20])
+        self.assertIsNotNone(response['next_cursor'])
+
+    def test_only_finished_builds_are_archived_on_completion(self):
+        running = self._build(status='in_progress', lines=3)
+        self.assertIsNone(archive_completed_build(running.id))
+        self.assertEqual(BuildLog.objects.filter(build=running).count(), 3)
+
+        finished = self._build(lines=3)
+        with override_settings(BUILD_LOG_ARCHIVE_ON_COMPLETE=False):
+            self.assertIsNone(archive_completed_build(finished.id))
+        self.assertEqual(archive_completed_build(finished.id)['lines'], 3)
+
+    def test_command_skips_recent_builds(self):
+        old = self._build(lines=4)
+        recent = self._build(lines=4)
+        Build.objects.filter(id=old.id).update(updated_at=timezone.now() - timedelta(days=10))
+        out = StringIO()
+        call_command('archive_build_logs', older_than_days=7, stdout=out)
+        self.assertIn('Archived 4 lines from 1 builds', out.getvalue())
+        self.assertFalse(BuildLog.objects.filter(build=old).exists())
+        self.assertEqual(BuildLog.objects.filter(build=recent).count(), 4)
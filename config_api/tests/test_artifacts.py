@@ -0,0 +1,102 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from config_api.artifacts import ArtifactCache
+
+
+class ArtifactCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.root = os.path.join(self.workdir, 'cache')
+
+    def _source(self, name, content):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_staged_file_keeps_original_name(self):
+        content = os.urandom(4096)
+        source = self._source('NE40E-V800R021.cc', content)
+        cache = ArtifactCache(self.root, max_bytes=1024 ** 2)
+        with cache.use(source) as artifact:
+            path = artifact.path_for(source)
+            self.assertEqual(os.path.basename(path), 'NE40E-V800R021.cc')
+            self.assertEqual(os.path.basename(os.path.dirname(path)), hashlib.sha256(content).hexdigest())
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_concurrent_builds_copy_once(self):
+        source = self._source('fw.bin', os.urandom(256 * 1024))
+        cache = ArtifactCache(self.root, max_bytes=1024 ** 2)
+        artifacts = []
+        threads = [threading.Thread(target=lambda: artifacts.append(cache.stage(source))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(artifact) for artifact in artifacts}), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['in_use']), (1, 7, 1))
+        for artifact in artifacts:
+            cache.release(artifact)
+
+    def test_same_content_under_another_name_is_linked(self):
+        content = os.urandom(8192)
+        first = self._source('a.bin', content)
+        second = self._source('b.pkg', content)
+        cache = ArtifactCache(self.root, max_bytes=1024 ** 2)
+        with cache.use(first) as one, cache.use(second) as two:
+            self.assertIs(one, two)
+            self.assertEqual(os.path.basename(two.path_for(second)), 'b.pkg')
+            self.assertTrue(os.path.exists(one.path_for(first)))
+        stats = cache.stats()
+        self.assertEqual(stats['deduplicated'], 1)
+        self.assertEqual(stats['bytes'], len(content))
+
+    def test_source_index_survives_restart(self):
+        source = self._source('fw.bin', os.urandom(4096))
+        with ArtifactCache(self.root, max_bytes=1024 ** 2).use(source):
+            pass
+        restarted = ArtifactCache(self.root, max_bytes=1024 ** 2)
+        with restarted.use(source) as artifact:
+            self.assertEqual(os.path.basename(artifact.path_for(source)), 'fw.bin')
+        self.assertEqual((restarted.stats()['hits'], restarted.stats()['misses']), (1, 0))
+
+    def test_changed_source_is_staged_again(self):
+        source = self._source('fw.bin', b'old')
+        cache = ArtifactCache(self.root, max_bytes=1024 ** 2)
+        with cache.use(source):
+            pass
+        self._source('fw.bin', b'new content')
+        os.utime(source, ns=(1, 1))
+        with cache.use(source) as artifact:
+            with open(artifact.path_for(source), 'rb') as f:
+                self.assertEqual(f.read(), b'new content')
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_lru_eviction_skips_files_in_use(self):
+        sources = [self._source(f'fw{index}.bin', os.urandom(1000)) for index in range(3)]
+        cache = ArtifactCache(self.root, max_bytes=2500)
+        held = cache.stage(sources[0])
+        for source in sources[1:]:
+            with cache.use(source):
+                pass
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertTrue(os.path.exists(held.path_for(sources[0])))
+        cache.release(held)
+        self.assertEqual(len([name for name in os.listdir(self.root) if len(name) == 64]), 2)
+
+    def test_non_local_path_is_bypassed(self):
+        cache = ArtifactCache(self.root, max_bytes=1024)
+        with cache.use('/flash/system.cc') as artifact:
+            self.assertIsNone(artifact)
+        self.assertEqual(cache.stats()['bypassed'], 1)
@@ -0,0 +1,97 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from config_api import scheduling
+from config_api.drivers import get_driver
+from config_api.models import Build
+
+from .utils import SimulatorMixin, wait_for_build
+
+RECORDING = {
+    'UPGRADE_DRIVER': 'recording',
+    'UPGRADE_DRIVERS': {'recording': 'config_api.tests.utils.RecordingDriver'},
+    'UPGRADE_DRIVER_OPTIONS': {'recording': {'delay': 0.1, 'fail': ['10.0.0.3'], 'error': ['10.0.0.4']}},
+}
+
+BUILD = {
+    'upgrade_type': 'force',
+    'work_type': 'main',
+    'ne_ip': '10.0.0.1, 10.0.0.2;10.0.0.3 10.0.0.4',
+    'version_path': '/data/version.bin',
+}
+
+
+class FanoutValidationTests(TestCase):
+
+    def _create(self, fanout):
+        return self.client.post('/api/build/', dict(BUILD, fanout=fanout), content_type='application/json')
+
+    def test_invalid_fanout_is_rejected(self):
+        for fanout in ('abc', 0, -3, 2.5, [4]):
+            with self.subTest(fanout=fanout):
+                response = self._create(fanout)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fanout', response.json()['error'])
+        self.assertFalse(Build.objects.exists())
+
+    def test_parse_fanout(self):
+        self.assertIsNone(scheduling.parse_fanout(None))
+        self.assertIsNone(scheduling.parse_fanout(''))
+        self.assertEqual(scheduling.parse_fanout('8'), 8)
+        self.assertEqual(scheduling.parse_fanout(64), 64)
+        for value in (True, 65, '1.5', 2.0):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                scheduling.parse_fanout(value)
+
+    @override_settings(UPGRADE_MAX_FANOUT=16)
+    def test_fanout_upper_bound_comes_from_settings(self):
+        response = self._create(17)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('between 1 and 16', response.json()['error'])
+        self.assertFalse(Build.objects.exists())
+
+
+class BuildRunTests(SimulatorMixin, TransactionTestCase):
+
+    def test_build_upgrades_each_target(self):
+        response = self.client.post('/api/build/', dict(BUILD, fanout='2'), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        build = wait_for_build(response.json()['id'])
+        self.assertEqual(build.status, 'success')
+        self.assertEqual(build.fanout, 2)
+        self.assertEqual(sorted(build.targets.values_list('ne_ip', 'status')), [
+            ('10.0.0.1', 'success'), ('10.0.0.2', 'success'), ('10.0.0.3', 'success'), ('10.0.0.4', 'success'),
+        ])
+        # 构建结束后日志已归档，通过接口读取
+        logs = self.client.get(f'/api/build/{build.id}/logs/', {'limit': 1000}).json()['logs']
+        self.assertEqual({log['target'] for log in logs if log['target']},
+                         set(build.targets.values_list('id', flat=True)))
+
+        progress = self.client.get(f'/api/build/{build.id}/').json()['progress']
+        self.assertEqual((progress['success'], progress['total']), (4, 4))
+
+    def test_empty_fanout_uses_the_global_width(self):
+        response = self.client.post('/api/build/', dict(BUILD, fanout=''), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        build = wait_for_build(response.json()['id'])
+        self.assertIsNone(build.fanout)
+        self.assertEqual(build.status, 'success')
+
+    @override_settings(**RECORDING)
+    def test_fanout_width_and_per_target_status(self):
+        response = self.client.post('/api/build/', dict(BUILD, fanout=2), content_type='application/json')
+        build = wait_for_build(response.json()['id'])
+        driver = get_driver('force', 'main')
+
+        self.assertEqual(build.status, 'failed')
+        self.assertEqual(sorted(driver.calls), ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'])
+        self.assertEqual(driver.max_active, 2)
+        targets = {target.ne_ip: target for target in build.targets.all()}
+        self.assertEqual({ip: target.status for ip, target in targets.items()}, {
+            '10.0.0.1': 'success', '10.0.0.2': 'success', '10.0.0.3': 'failed', '10.0.0.4': 'failed',
+        })
+        self.assertEqual(targets['10.0.0.4'].message, '10.0.0.4 unreachable')
+        self.assertTrue(all(target.started_at and target.finished_at for target in targets.values()))
+
+        logs = self.client.get(f'/api/build/{build.id}/logs/', {'limit': 1000}).json()['logs']
+        self.assertIn('[10.0.0.3] 完成 10.0.0.3', [log['message'] for log in logs])
+        self.assertEqual(logs[-1]['message'], '升级任务失败 (2/4 成功)')
@@ -0,0 +1,90 @@
+from django.test import TransactionTestCase
+
+from config_api import jobs, stats
+from config_api.executor import UpgradeExecutor
+from config_api.models import Build, UpgradeJob
+from config_api.runner import run_job
+
+from .utils import FAST_SIMULATOR, SimulatorMixin, stop_shared_executor, wait_for_build, wait_until
+
+# 每个 NE 约需数秒，停止请求一定落在升级过程中
+SLOW_SIMULATOR = {'simulator': dict(FAST_SIMULATOR['simulator'], step_latency=0.3)}
+
+BUILD = {
+    'upgrade_type': 'force',
+    'work_type': 'main',
+    'ne_ip': '10.0.0.1,10.0.0.2,10.0.0.3',
+    'version_path': '/data/version.bin',
+}
+
+
+class StopBuildTests(SimulatorMixin, TransactionTestCase):
+
+    driver_options = SLOW_SIMULATOR
+
+    def _started_build(self, fanout=1):
+        response = self.client.post('/api/build/', dict(BUILD, fanout=fanout), content_type='application/json')
+        build_id = response.json()['id']
+        self.assertTrue(wait_until(
+            lambda: Build.objects.get(id=build_id).targets.filter(status='in_progress').exists()
+        ))
+        return build_id
+
+    def test_stop_interrupts_the_running_upgrade(self):
+        build_id = self._started_build()
+        response = self.client.post(f'/api/build/{build_id}/stop/').json()
+
+        self.assertEqual(response['status'], 'stopped')
+        self.assertIsNotNone(response['cancel_latency_ms'])
+        self.assertLess(response['cancel_latency_ms'], 1000)
+        build = wait_for_build(build_id)
+        self.assertEqual(build.status, 'stopped')
+        self.assertEqual(sorted(build.targets.values_list('status', flat=True)), ['stopped'] * 3)
+        self.assertEqual(self.client.post(f'/api/build/{build_id}/stop/').status_code, 400)
+
+        messages = [log['message'] for log in self.client.get(f'/api/build/{build_id}/logs/').json()['logs']]
+        self.assertIn('升级任务已手动停止', messages)
+        self.assertTrue(messages[-1].startswith('升级任务已停止 (0/3 成功)'))
+
+    def test_stopped_targets_are_counted_like_a_rebuild(self):
+        build_id = self._started_build()
+        self.client.post(f'/api/build/{build_id}/stop/')
+        build = wait_for_build(build_id)
+        self.assertEqual(set(build.targets.values_list('status', flat=True)), {'stopped'})
+
+        ne_ips = BUILD['ne_ip'].split(',')
+        incremental = [stats.query_stats(days=1, ne_ip=ne_ip)['summary'] for ne_ip in [''] + ne_ips]
+        self.assertEqual([summary['stopped'] for summary in incremental], [1, 1, 1, 1])
+        stats.rebuild_stats()
+        self.assertEqual([stats.query_stats(days=1, ne_ip=ne_ip)['summary'] for ne_ip in [''] + ne_ips], incremental)
+
+    def test_stop_a_queued_build(self):
+        stop_shared_executor()
+        build = Build.objects.create(status='pending', **BUILD)
+        build.create_targets()
+        job = jobs.enqueue_build(build, 10)
+
+        response = self.client.post(f'/api/build/{build.id}/stop/').json()
+
+        self.assertIsNone(response['cancel_latency_ms'])
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.cancel_requested), ('done', True))
+        self.assertEqual(set(build.targets.values_list('status', flat=True)), {'stopped'})
+        self.assertIsNone(jobs.claim_next_job('test:1:x', 30))
+
+    def test_stop_requested_by_another_process(self):
+        stop_shared_executor()
+        executor = UpgradeExecutor(run_job, max_workers=1, poll_interval=0.05, cancel_poll_interval=0.1, name='test')
+        executor.start()
+        self.addCleanup(executor.shutdown, wait=True, timeout=10)
+        build = Build.objects.create(status='pending', **BUILD)
+        build.create_targets()
+        job = executor.submit(build)
+        self.assertTrue(wait_until(lambda: build.targets.filter(status='in_progress').exists()))
+
+        # 其他进程只能修改数据库，由本进程的心跳线程发现并取消
+        UpgradeJob.objects.filter(id=job.id).update(cancel_requested=True)
+
+        build = wait_for_build(build.id)
+        self.assertEqual(build.status, 'stopped')
+        self.assertTrue(wait_until(lambda: UpgradeJob.objects.get(id=job.id).state == 'done'))
@@ -0,0 +1,77 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase
+
+from config_api.dump import parse_where
+from config_api.models import Build
+
+from .utils import make_config
+
+
+class WhereTests(SimpleTestCase):
+
+    def test_expressions(self):
+        self.assertEqual(parse_where(['status=success', 'id>=10']), Q(status='success') & Q(id__gte='10'))
+        self.assertEqual(parse_where(['status!=failed']), ~Q(status='failed'))
+        self.assertEqual(parse_where(['status__in=success, failed']), Q(status__in=['success', 'failed']))
+        self.assertEqual(parse_where(['ne_ip="a,b"']), Q(ne_ip='a,b'))
+        self.assertEqual(parse_where(['fanout__isnull=true']), Q(fanout__isnull=True))
+        self.assertEqual(parse_where(['fanout=null']), Q(fanout=None))
+        with self.assertRaises(CommandError):
+            parse_where(['just-text'])
+
+
+class DumpCommandTests(TestCase):
+
+    def _call(self, *args, **options):
+        out = StringIO()
+        call_command(*args, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_show_configs_formats(self):
+        first = make_config(CES=['10.0.0.1', '10.0.0.0/30'])
+        make_config(LAB=['ne-01.lab'])
+
+        rows = [json.loads(line) for line in self._call('show_configs', format='jsonl').splitlines()]
+        self.assertEqual(rows[0]['environments'], {'CES': ['10.0.0.1', '10.0.0.0/30']})
+        self.assertEqual(rows[1]['upgrade_type'], ['force'])
+
+        table = list(csv.DictReader(StringIO(self._call('show_configs', format='csv', where=[f'id={first.id}']))))
+        self.assertEqual(len(table), 1)
+        self.assertEqual(json.loads(table[0]['environments']), {'CES': ['10.0.0.1', '10.0.0.0/30']})
+
+        text = self._call('show_configs', limit=1)
+        self.assertIn(f'ID: {first.id}', text)
+        self.assertIn('Total 1 configuration records', text)
+
+    def test_show_configs_prefetches_per_chunk(self):
+        for index in range(6):
+            make_config(**{f'ENV{index}': [f'10.0.{index}.1']})
+        # 主查询一次，每批预取 options、environments、ips 各一次
+        with self.assertNumQueries(1 + 3 * 3):
+            self._call('show_configs', format='jsonl', chunk_size=2)
+
+    def test_dump_table(self):
+        builds = [
+            Build.objects.create(upgrade_type='force', work_type='main', ne_ip=f'10.0.0.{index}',
+                                 version_path='/x', status=status)
+            for index, status in enumerate(('success', 'failed', 'failed'))
+        ]
+        output = self._call('dump_table', 'Build', fields='id,ne_ip,status', where=['status=failed'],
+                            order_by='-id', format='csv')
+        self.assertEqual(output.splitlines(), [
+            'id,ne_ip,status', f'{builds[2].id},10.0.0.2,failed', f'{builds[1].id},10.0.0.1,failed',
+        ])
+
+        lines = self._call('dump_table', 'Build', limit=1).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['status'], 'success')
+
+        for args, options in ((('Nope',), {}), (('Build',), {'fields': 'missing'}),
+                              (('Build',), {'where': ['missing=1']}), (('Build',), {'where': ['id>=x']})):
+            with self.subTest(args=args, options=options), self.assertRaises(CommandError):
+                self._call('dump_table', *args, **options)
@@ -0,0 +1,80 @@
+import json
+
+from django.test import TestCase
+
+from config_api.models import Config, ConfigEnvironment, ConfigOption, EnvironmentIP
+
+from .utils import make_config
+
+
+class ConfigStorageTests(TestCase):
+
+    def _post(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/config/', data, content_type='application/json')
+
+    def test_config_is_stored_in_normalized_tables(self):
+        response = self._post(upgrade_type='force\ncold\nforce', work_type='main', environments=json.dumps([
+            {'ne_env': 'LAB', 'ne_ip_list': '10.1.0.1, 10.1.0.2;ne-01.lab'},
+            {'ne_env': 'CES', 'ne_ip_list': ['10.0.0.1', '10.0.0.1', '10.0.0.0/30']},
+        ]))
+        self.assertEqual(response.status_code, 200, response.content)
+        config = Config.objects.get()
+        self.assertEqual(list(ConfigOption.objects.filter(config=config, kind='upgrade_type')
+                              .values_list('value', flat=True)), ['force', 'cold'])
+        self.assertEqual(list(ConfigEnvironment.objects.filter(config=config).values_list('name', flat=True)),
+                         ['LAB', 'CES'])
+        self.assertEqual(config.get_env_ip_map(), {
+            'LAB': ['10.1.0.1', '10.1.0.2', 'ne-01.lab'],
+            'CES': ['10.0.0.1', '10.0.0.0/30'],
+        })
+        self.assertEqual(EnvironmentIP.objects.get(ne_ip='ne-01.lab').ip_version, 0)
+
+        self._post(environments=[{'ne_env': 'CES', 'ne_ip_list': ['10.0.0.9']}])
+        config = Config.objects.get()
+        self.assertEqual(config.get_env_ip_map(), {'CES': ['10.0.0.9']})
+        self.assertEqual(config.get_upgrade_type(), ['force', 'cold'])
+        self.assertEqual(EnvironmentIP.objects.count(), 1)
+
+    def test_invalid_entries_are_rejected(self):
+        response = self._post(environments=[{'ne_env': 'CES', 'ne_ip_list': ['10.0.0.1/33', '10.0.0.5-10.0.0.1']}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['environments']), 2)
+        self.assertFalse(Config.objects.exists())
+
+    def test_prefetched_list_reads_in_constant_queries(self):
+        for index in range(3):
+            make_config(**{f'ENV{index}-{n}': [f'10.{index}.{n}.1', f'10.{index}.{n}.2'] for n in range(4)})
+        with self.assertNumQueries(4):
+            data = [config.get_env_ip_map() for config in
+                    Config.objects.prefetch_related('options', 'environments__ips')]
+        self.assertEqual(len(data[2]['ENV2-3']), 2)
+
+
+class EnvironmentLookupTests(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = make_config(CES=['10.0.0.0/24', 'ne-01.lab'], LAB=['10.0.0.5'])
+            self.second = make_config(PROD=['10.0.0.1-10.0.0.9'])
+
+    def test_lookup_returns_the_default_and_all_owners(self):
+        response = self.client.get('/api/config/lookup/', {'ip': ['10.0.0.5,ne-01.lab', '192.168.1.1']})
+        results = {item['ne_ip']: item for item in response.json()['results']}
+        self.assertEqual(results['10.0.0.5']['ne_env'], 'CES')
+        self.assertEqual(results['10.0.0.5']['environments'], [
+            {'config_id': self.first.id, 'ne_env': 'CES'},
+            {'config_id': self.first.id, 'ne_env': 'LAB'},
+            {'config_id': self.second.id, 'ne_env': 'PROD'},
+        ])
+        self.assertEqual(results['ne-01.lab']['ne_env'], 'CES')
+        self.assertEqual(results['192.168.1.1'], {'ne_ip': '192.168.1.1', 'ne_env': None, 'environments': []})
+
+    def test_ranges_return_overlapping_environments(self):
+        response = self.client.get('/api/config/lookup/', {'ip': '10.0.0.200/29'})
+        self.assertEqual([env['ne_env'] for env in response.json()['results'][0]['environments']], ['CES'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/config/lookup/').status_code, 400)
+        too_many = ','.join(f'10.9.{i // 250}.{i % 250}' for i in range(5000))
+        self.assertEqual(self.client.get('/api/config/lookup/', {'ip': too_many}).status_code, 400)
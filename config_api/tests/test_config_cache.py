@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from config_api import config_cache
+from config_api.config_cache import etag_matches, get_snapshot
+from config_api.models import Config, ConfigOption
+
+from .utils import make_config
+
+
+class ConfigCacheTests(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(CONFIG_CACHE_VERSION_FILE=os.path.join(directory.name, '.config_version'),
+                                     CONFIG_CACHE_MAX_AGE=300)
+        override.enable()
+        self.addCleanup(override.disable)
+        config_cache.invalidate()
+        self.addCleanup(config_cache.invalidate)
+        self.config = make_config(CES=['10.0.0.1', '10.0.0.2'])
+
+    def test_unchanged_config_is_served_from_memory_with_304(self):
+        first = self.client.get('/api/config/', HTTP_ACCEPT='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['ETag'], f'"config-{self.config.id}-1"')
+        self.assertEqual(first.json()['environments'], [{'ne_env': 'CES', 'ne_ip_list': ['10.0.0.1', '10.0.0.2']}])
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/config/', HTTP_ACCEPT='application/json',
+                                     HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_saving_changes_the_etag(self):
+        old = self.client.get('/api/config/', HTTP_ACCEPT='application/json')['ETag']
+        response = self.client.post('/api/config/', {'work_type': 'main\nbackup'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"config-{self.config.id}-2"')
+
+        fresh = self.client.get('/api/config/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=old)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh['ETag'], response['ETag'])
+        self.assertEqual(fresh.json()['work_type'], ['main', 'backup'])
+
+    def test_other_processes_signal_through_the_version_file(self):
+        loaded = get_snapshot()
+        # 绕过 ORM 信号的修改：本进程看不到，直到版本文件变化
+        ConfigOption.objects.filter(config=self.config, kind='work_type').update(value='patched')
+        self.assertIs(get_snapshot(), loaded)
+        config_cache.bump_version_file()
+        self.assertEqual(get_snapshot().data['work_type'], ['patched'])
+
+    def test_max_age_bounds_staleness(self):
+        loaded = get_snapshot()
+        with self.settings(CONFIG_CACHE_MAX_AGE=0.01):
+            loaded.loaded_at -= 1
+            self.assertIsNot(get_snapshot(), loaded)
+
+    def test_delete_invalidates(self):
+        self.assertEqual(get_snapshot().config_id, self.config.id)
+        Config.objects.all().delete()
+        snapshot = get_snapshot()
+        self.assertEqual((snapshot.data, snapshot.etag), ({}, '"config-none"'))
+
+
+class EtagMatchTests(SimpleTestCase):
+
+    def test_if_none_match_forms(self):
+        etag = '"config-1-3"'
+        self.assertTrue(etag_matches('"config-1-3"', etag))
+        self.assertTrue(etag_matches('W/"config-1-3"', etag))
+        self.assertTrue(etag_matches('"config-1-2", "config-1-3"', etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches('"config-1-2"', etag))
+        self.assertFalse(etag_matches('', etag))
@@ -0,0 +1,108 @@
+import json
+import threading
+
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from config_api.config_history import RevisionNotFound, restore_revision, state_at
+from config_api.models import Config, ConfigRevision
+
+from .utils import make_config
+
+
+@override_settings(CONFIG_REVISION_SNAPSHOT_EVERY=3)
+class ConfigRevisionTests(TestCase):
+
+    def test_each_save_records_a_revision(self):
+        config = make_config(CES=['10.0.0.1', '10.0.0.2'])
+        config.set_work_type(['main', 'backup'])
+        config.save()
+        config.set_env_ip_map({'CES': ['10.0.0.1', '10.0.0.3'], 'LAB': ['10.1.0.1']})
+        config.save()
+        self.assertEqual(config.version, 3)
+        kinds = list(ConfigRevision.objects.filter(config=config).order_by('version').values_list('version', 'kind'))
+        self.assertEqual(kinds, [(1, 'snapshot'), (2, 'delta'), (3, 'delta')])
+
+        self.assertEqual(state_at(config.id, 1)['environments'], {'CES': ['10.0.0.1', '10.0.0.2']})
+        self.assertEqual(state_at(config.id, 2)['work_type'], ['main', 'backup'])
+        self.assertEqual(state_at(config.id, 3)['environments'],
+                         {'CES': ['10.0.0.1', '10.0.0.3'], 'LAB': ['10.1.0.1']})
+
+    def test_snapshot_every_n_versions(self):
+        config = make_config(CES=['10.0.0.1'])
+        for index in range(2, 8):
+            config.set_env_ip_map({'CES': [f'10.0.0.{index}']})
+            config.save()
+        snapshots = ConfigRevision.objects.filter(config=config, kind='snapshot').values_list('version', flat=True)
+        self.assertEqual(sorted(snapshots), [1, 4, 7])
+        self.assertEqual(state_at(config.id, 6)['environments'], {'CES': ['10.0.0.6']})
+
+    def test_restore_saves_a_new_version(self):
+        config = make_config(CES=['10.0.0.1'])
+        config.set_env_ip_map({'LAB': ['10.1.0.1']})
+        config.save()
+        restore_revision(config, 1)
+        config.refresh_from_db()
+        self.assertEqual(config.version, 3)
+        self.assertEqual(config.get_env_ip_map(), {'CES': ['10.0.0.1']})
+        with self.assertRaises(RevisionNotFound):
+            state_at(config.id, 99)
+
+    def test_versions_diff_and_restore_api(self):
+        config = make_config(CES=['10.0.0.1'])
+        config.set_env_ip_map({'CES': ['10.0.0.1', '10.0.0.2'], 'LAB': ['10.1.0.1']})
+        config.save()
+
+        page = self.client.get('/api/config/versions/?page_size=1').json()
+        self.assertEqual(page['current_version'], 2)
+        self.assertEqual([row['version'] for row in page['results']], [2])
+        self.assertEqual(page['next_before'], 2)
+        self.assertEqual(page['results'][0]['summary']['environments']['added'], 1)
+
+        diff = self.client.get('/api/config/diff/?from=1').json()
+        self.assertEqual(diff['to'], 2)
+        self.assertEqual(diff['changes']['environments']['added'], ['LAB'])
+        self.assertEqual(diff['changes']['environments']['changed']['CES'], {'added': ['10.0.0.2'], 'removed': []})
+        self.assertEqual(self.client.get('/api/config/diff/?from=9').status_code, 404)
+        self.assertEqual(self.client.get('/api/config/diff/').status_code, 400)
+
+        response = self.client.post('/api/config/restore/', {'version': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([env['ne_env'] for env in response.json()['environments']], ['CES'])
+        self.assertEqual(self.client.post('/api/config/restore/', {'version': 'x'},
+                                          content_type='application/json').status_code, 400)
+
+
+class ConcurrentConfigSaveTests(TransactionTestCase):
+
+    def test_concurrent_saves_get_distinct_versions(self):
+        config = make_config(CES=['10.0.0.1'])
+        errors = []
+        start = threading.Barrier(4)
+
+        def save(index):
+            try:
+                instance = Config.objects.get(id=config.id)
+                instance.set_env_ip_map({'CES': [f'10.0.1.{index}']})
+                start.wait()
+                instance.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=save, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        config.refresh_from_db()
+        self.assertEqual(config.version, 5)
+        versions = list(ConfigRevision.objects.filter(config=config).order_by('version')
+                        .values_list('version', flat=True))
+        self.assertEqual(versions, [1, 2, 3, 4, 5])
+        self.assertEqual(json.dumps(state_at(config.id, 5)), json.dumps({
+            'upgrade_type': ['force'], 'work_type': ['main'], 'environments': config.get_env_ip_map(),
+        }))
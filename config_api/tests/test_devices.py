@@ -0,0 +1,56 @@
+from django.test import TestCase, override_settings
+
+from config_api.models import Device, DeviceType
+
+
+class DeviceListTests(TestCase):
+
+    def setUp(self):
+        self.router = DeviceType.objects.create(type_id='R1', name='Router', model_data={'width': 2})
+        self.switch = DeviceType.objects.create(type_id='S1', name='Switch')
+        self.devices = []
+        for rack in ('A|1', 'A|2', 'B'):
+            for position in (3, 1, 2):
+                self.devices.append(Device.objects.create(
+                    name=f'{rack}-{position}', ip_address=f'10.0.{len(self.devices)}.1',
+                    device_type=self.router if position == 1 else self.switch,
+                    rack_number=rack, position=position, status='online' if position != 2 else 'offline'
+                ))
+
+    def _names(self, response):
+        return [device['name'] for device in response.json()['data']]
+
+    def test_cursor_pages_in_rack_order(self):
+        names, cursor = [], None
+        while True:
+            params = {'page_size': 4}
+            if cursor:
+                params['cursor'] = cursor
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/devices/', params)
+            names.extend(self._names(response))
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                break
+            self.assertEqual(response['X-Next-Cursor'], cursor)
+        self.assertEqual(names, [f'{rack}-{position}' for rack in ('A|1', 'A|2', 'B') for position in (1, 2, 3)])
+        self.assertEqual(self.client.get('/api/devices/').json()['data'][0]['device_type_name'], 'Router')
+
+    def test_filters_and_search(self):
+        self.assertEqual(self._names(self.client.get('/api/devices/', {'rack': ['B', 'A|2'], 'status': 'offline'})),
+                         ['A|2-2', 'B-2'])
+        self.assertEqual(len(self._names(self.client.get('/api/devices/', {'type': 'Router'}))), 3)
+        self.assertEqual(self._names(self.client.get('/api/devices/', {'search': '10.0.4.1'})), ['A|2-1'])
+        self.assertEqual(len(self._names(self.client.get('/api/devices/', {'search': 'switch'}))), 6)
+
+    @override_settings(DEVICE_MAX_PAGE_SIZE=2)
+    def test_page_size_is_clamped_and_bad_cursor_rejected(self):
+        self.assertEqual(len(self._names(self.client.get('/api/devices/', {'page_size': 500}))), 2)
+        self.assertEqual(self.client.get('/api/devices/', {'cursor': '!!!'}).status_code, 400)
+
+    def test_model_data(self):
+        router = Device.objects.get(name='B-1')
+        switch = Device.objects.get(name='B-3')
+        self.assertEqual(self.client.get(f'/api/devices/{router.id}/model/').json()['model_data'], {'width': 2})
+        self.assertEqual(self.client.get(f'/api/devices/{switch.id}/model/').json()['model_data']['height'], 2)
+        self.assertEqual(self.client.get('/api/devices/999999/model/').status_code, 404)
@@ -0,0 +1,128 @@
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from config_api.cancel import CancelToken, UpgradeCancelled
+from config_api.drivers import DriverNotFound, driver_stats, get_driver, reset_drivers
+from config_api.drivers.registry import resolve_driver_name
+from config_api.drivers.simulator import PHASES, SimulatorDriver
+from config_api.drivers.ssh_cli import SshCliDriver
+
+FAKE_CLI = '''
+def connect(ne_ip):
+    return {'ne_ip': ne_ip}
+
+
+def upgrade(upgrade_type, work_type, ne_ip, version_path, callback, session=None):
+    callback(f"{upgrade_type}/{work_type} {ne_ip} {version_path} session={session is not None}")
+    return True
+'''
+
+
+class RegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_drivers()
+        self.addCleanup(reset_drivers)
+
+    @override_settings(UPGRADE_DRIVER='ssh_cli', UPGRADE_DRIVER_ROUTES={
+        'force/main': 'exact', 'force/*': 'by-upgrade', '*/backup': 'by-work', '*': 'fallback',
+    })
+    def test_route_precedence(self):
+        self.assertEqual(resolve_driver_name('force', 'main'), 'exact')
+        self.assertEqual(resolve_driver_name('force', 'backup'), 'by-upgrade')
+        self.assertEqual(resolve_driver_name('cold', 'backup'), 'by-work')
+        self.assertEqual(resolve_driver_name('cold', 'main'), 'fallback')
+        with self.settings(UPGRADE_DRIVER_ROUTES={}):
+            self.assertEqual(resolve_driver_name('cold', 'main'), 'ssh_cli')
+
+    @override_settings(UPGRADE_DRIVER='simulator', UPGRADE_DRIVER_ROUTES={},
+                       UPGRADE_DRIVER_OPTIONS={'simulator': {'step_latency': 0, 'seed': 1}})
+    def test_instances_are_configured_and_reused(self):
+        driver = get_driver('force', 'main')
+        self.assertIsInstance(driver, SimulatorDriver)
+        self.assertEqual((driver.name, driver.step_latency), ('simulator', 0))
+        self.assertIs(get_driver('cold', 'backup'), driver)
+        self.assertEqual([item['name'] for item in driver_stats()], ['simulator'])
+        reset_drivers()
+        self.assertIsNot(get_driver('force', 'main'), driver)
+
+    def test_unknown_or_broken_drivers(self):
+        with self.settings(UPGRADE_DRIVER='missing', UPGRADE_DRIVER_ROUTES={}):
+            with self.assertRaisesMessage(DriverNotFound, "Unknown upgrade driver 'missing'"):
+                get_driver('force', 'main')
+        with self.settings(UPGRADE_DRIVER='broken', UPGRADE_DRIVER_ROUTES={},
+                           UPGRADE_DRIVERS={'broken': 'config_api.drivers.no_such_module.Driver'}):
+            with self.assertRaisesMessage(DriverNotFound, "Failed to load upgrade driver 'broken'"):
+                get_driver('force', 'main')
+
+
+class SshCliDriverTests(SimpleTestCase):
+
+    def _driver(self, module):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, f'{module}.py').write_text(FAKE_CLI)
+        self.addCleanup(sys.modules.pop, module, None)
+        self.addCleanup(lambda: directory.name in sys.path and sys.path.remove(directory.name))
+        return SshCliDriver(lib_path=directory.name, module=module)
+
+    def test_library_is_imported_on_first_use(self):
+        driver = self._driver('fake_ssh_cli_lazy')
+        self.assertNotIn('fake_ssh_cli_lazy', sys.modules)
+        self.assertTrue(driver.supports_sessions)
+        lines = []
+        session = driver.open_session('10.0.0.1')
+        self.assertTrue(driver.upgrade('force', 'main', '10.0.0.1', '/x', lines.append, session=session))
+        self.assertEqual(lines, ['force/main 10.0.0.1 /x session=True'])
+
+    def test_missing_library(self):
+        driver = SshCliDriver(lib_path='', module='no_such_ssh_cli')
+        with self.assertRaisesMessage(DriverNotFound, 'Failed to import no_such_ssh_cli'):
+            driver.upgrade('force', 'main', '10.0.0.1', '/x', print)
+
+
+class SimulatorDriverTests(SimpleTestCase):
+
+    def _driver(self, **options):
+        return SimulatorDriver(**dict({'step_latency': 0, 'connect_latency': 0, 'jitter': 0,
+                                       'transfer_steps': 2, 'seed': 7}, **options))
+
+    def test_phases_and_transfer_progress(self):
+        lines = []
+        driver = self._driver()
+        self.assertTrue(driver.upgrade('force', 'main', '10.0.0.1', '/x', lines.append))
+        self.assertEqual(lines[:2], ['连接 10.0.0.1:22', '登录成功'])
+        self.assertIn('传输进度 50%', lines)
+        self.assertTrue(lines[-1].startswith('升级完成'))
+        self.assertEqual(len(lines), 2 + len(PHASES) + 2)
+        self.assertEqual(driver.describe()['connects'], 1)
+
+    def test_failure_and_closed_session(self):
+        driver = self._driver(failure_rate=1)
+        lines = []
+        self.assertFalse(driver.upgrade('force', 'main', '10.0.0.1', '/x', lines.append))
+        self.assertTrue(lines[-1].startswith('错误: '))
+        session = driver.open_session('10.0.0.1')
+        session.close()
+        with self.assertRaises(ConnectionError):
+            driver.upgrade('force', 'main', '10.0.0.1', '/x', lines.append, session=session)
+
+    def test_cancel_interrupts_the_wait(self):
+        driver = self._driver(step_latency=10)
+        token = CancelToken(1)
+        timer = threading.Timer(0.1, token.cancel, args=('stop',))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        def callback(message):
+            token.check()
+
+        started = time.monotonic()
+        with self.assertRaisesMessage(UpgradeCancelled, 'stop'):
+            driver.upgrade('force', 'main', '10.0.0.1', '/x', callback, token=token)
+        self.assertLess(time.monotonic() - started, 2)
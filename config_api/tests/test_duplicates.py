@@ -0,0 +1,47 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from config_api.models import Config
+
+from .utils import make_config
+
+
+class DuplicateConfigTests(TestCase):
+
+    def setUp(self):
+        self.original = make_config(CES=['10.0.0.0/30', 'ne-01.lab'], LAB=['10.1.0.1'])
+        # 内容相同，只是顺序和写法不同
+        self.copy = make_config(LAB=['10.1.0.1'], CES=['ne-01.lab', '10.0.0.0-10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.other = make_config(CES=['10.0.0.0/30'])
+
+    def test_equal_content_has_equal_hash(self):
+        self.assertEqual(self.original.content_hash, self.copy.content_hash)
+        self.assertNotEqual(self.original.content_hash, self.other.content_hash)
+        self.assertEqual(self.copy.find_duplicate(), self.original)
+        self.assertIsNone(self.other.find_duplicate())
+
+        candidate = Config()
+        candidate.set_upgrade_type(['force'])
+        candidate.set_work_type(['main'])
+        candidate.set_env_ip_map({'CES': ['10.0.0.0/31', '10.0.0.2/31', 'ne-01.lab'], 'LAB': ['10.1.0.1']})
+        self.assertEqual(candidate.find_duplicate(), self.original)
+
+    def test_lookup_uses_the_hash_index(self):
+        sql, params = Config.objects.filter(content_hash=self.original.content_hash).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+
+    def test_command_keeps_the_oldest_config(self):
+        third = make_config(CES=['10.0.0.1', '10.0.0.0/30', 'ne-01.lab'], LAB=['10.1.0.1'])
+        out = StringIO()
+        call_command('remove_duplicate_configs', dry_run=True, stdout=out)
+        self.assertIn(f'Would remove 2 duplicate configs: [{self.copy.id}, {third.id}]', out.getvalue())
+        self.assertEqual(Config.objects.count(), 4)
+
+        call_command('remove_duplicate_configs', chunk_size=1, stdout=StringIO())
+        self.assertEqual(sorted(Config.objects.values_list('id', flat=True)), [self.original.id, self.other.id])
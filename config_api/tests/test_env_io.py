@@ -0,0 +1,145 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from config_api.config_history import config_state, content_hash, state_at, stored_content_hash
+from config_api.env_io import EnvImportError, export_env_ips, import_env_ips, rewindable
+from config_api.models import Config, ConfigEnvironment, ConfigRevision
+
+
+def upload(name, text):
+    return SimpleUploadedFile(name, text.encode('utf-8'))
+
+
+def current_config():
+    return Config.objects.order_by('id').first()
+
+
+@override_settings(ENV_IMPORT_BATCH_SIZE=2, CONFIG_REVISION_SNAPSHOT_EVERY=20)
+class ImportTests(TestCase):
+
+    def setUp(self):
+        config = Config()
+        config.set_upgrade_type(['force'])
+        config.set_env_ip_map({'CES': ['10.0.0.1', 'ne-01.lab'], 'LAB': ['10.1.0.0/30']})
+        config.save()
+
+    def _import(self, text, fmt='csv', **kwargs):
+        return import_env_ips(rewindable(io.BytesIO(text.encode('utf-8'))), fmt, **kwargs)
+
+    def test_append_csv_with_bom_and_duplicates(self):
+        result = self._import('﻿ne_env,ne_ip\nCES,10.0.0.2\nCES,10.0.0.1\n\nNEW,10.2.0.1-10.2.0.3\n')
+        self.assertEqual((result['rows'], result['inserted'], result['duplicates']), (3, 2, 1))
+        self.assertEqual(result['environments'], ['CES', 'NEW'])
+        self.assertEqual(current_config().get_env_ip_map(), {
+            'CES': ['10.0.0.1', 'ne-01.lab', '10.0.0.2'],
+            'LAB': ['10.1.0.0/30'],
+            'NEW': ['10.2.0.1-10.2.0.3'],
+        })
+
+    def test_replace_jsonl(self):
+        self._import('{"ne_env": "CES", "ne_ip_list": ["10.0.0.1", "10.0.0.9"]}\n', fmt='jsonl', mode='replace')
+        self.assertEqual(current_config().get_env_ip_map()['CES'], ['10.0.0.1', '10.0.0.9'])
+        self.assertFalse(ConfigEnvironment.objects.filter(name__startswith='~import-').exists())
+        summary = ConfigRevision.objects.get(version=2).summary['environments']
+        self.assertEqual((summary['changed'], summary['ips_added'], summary['ips_removed']), (1, 1, 1))
+
+    def test_invalid_records_abort_the_import(self):
+        with self.assertRaises(EnvImportError) as raised:
+            self._import('CES,10.0.0.2\nCES,10.0.0.0/33\n,10.0.0.3\n')
+        self.assertEqual([line for line, _ in raised.exception.errors], [2, 3])
+        self.assertEqual(current_config().version, 1)
+        result = self._import('CES,10.0.0.2\nCES,10.0.0.0/33\n', skip_invalid=True)
+        self.assertEqual((result['inserted'], result['invalid']), (1, 1))
+
+    def test_hostnames_are_accepted_like_the_serializer(self):
+        result = self._import('CES,ne-02.lab\n')
+        self.assertEqual(result['inserted'], 1)
+        response = self.client.post('/api/config/', {'environments': '[{"ne_env": "CES", "ne_ip_list": ["ne-03.lab"]}]'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_can_be_imported_back(self):
+        exported = ''.join(export_env_ips('csv'))
+        config = current_config()
+        config.set_env_ip_map({})
+        config.save()
+        self._import(exported, mode='replace')
+        self.assertEqual(current_config().get_env_ip_map(),
+                         {'CES': ['10.0.0.1', 'ne-01.lab'], 'LAB': ['10.1.0.0/30']})
+
+    def test_import_records_revision_without_loading_the_whole_config(self):
+        with mock.patch.object(Config, 'get_env_ip_map', side_effect=AssertionError('full map loaded')):
+            self._import('CES,10.0.0.5\nNEW,10.3.0.1\n')
+            self._import('LAB,10.1.0.9\n', mode='replace')
+        config = current_config()
+        self.assertEqual(config.version, 3)
+        self.assertEqual(list(ConfigRevision.objects.filter(config=config).order_by('version')
+                              .values_list('kind', flat=True)), ['snapshot', 'delta', 'delta'])
+        state = config_state(config)
+        self.assertEqual(state_at(config.id, 3), state)
+        self.assertEqual(state_at(config.id, 2)['environments']['LAB'], ['10.1.0.0/30'])
+        self.assertEqual(config.content_hash, content_hash(state))
+
+    @override_settings(CONFIG_REVISION_SNAPSHOT_EVERY=1)
+    def test_import_writes_snapshot_when_due(self):
+        self._import('CES,10.0.0.5\n')
+        config = current_config()
+        revision = ConfigRevision.objects.get(config=config, version=2)
+        self.assertEqual(revision.kind, 'snapshot')
+        self.assertEqual(state_at(config.id, 2), config_state(config))
+
+    def test_import_api(self):
+        response = self.client.post('/api/config/import/', {'file': upload('ne.csv', 'ne_env,ne_ip\nCES,10.0.0.7\n')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inserted'], 1)
+        self.assertEqual(response['ETag'], f'"config-{current_config().id}-2"')
+        response = self.client.post('/api/config/import/', {'file': upload('ne.jsonl', 'not json\n')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['line'], 1)
+        response = self.client.post('/api/config/import/', {'file': upload('ne.txt', 'x')})
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentHashTests(TestCase):
+
+    def test_stored_hash_matches_in_memory_hash(self):
+        config = Config()
+        config.set_upgrade_type(['force', 'normal'])
+        config.set_work_type(['main'])
+        config.set_env_ip_map({
+            'CES': ['10.0.0.1', '10.0.0.2-10.0.0.3', 'ne-01.lab', '2001:db8::/126'],
+            'LAB': [],
+        })
+        config.save()
+        self.assertEqual(stored_content_hash(config), content_hash(config_state(config)))
+
+    def test_hash_ignores_order_and_merges_blocks(self):
+        base = {'upgrade_type': ['a', 'b'], 'work_type': [], 'environments': {
+            'CES': [f'10.0.0.{index}' for index in range(256)] + ['host'], 'LAB': ['1.1.1.1']}}
+        same = {'upgrade_type': ['b', 'a'], 'work_type': [], 'environments': {
+            'LAB': ['1.1.1.1'], 'CES': ['host', '10.0.0.0/24']}}
+        other = {'upgrade_type': ['a', 'b'], 'work_type': [], 'environments': {
+            'CES': ['10.0.0.0/24', 'host'], 'LAB': ['1.1.1.2']}}
+        self.assertEqual(content_hash(base), content_hash(same))
+        self.assertNotEqual(content_hash(base), content_hash(other))
+
+
+class CommandTests(TestCase):
+
+    def test_import_and_export_commands(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"ne_env": "A", "ne_ip_list": ["10.0.0.1", "10.0.0.2"]}\n{"ne_env": "B", "ne_ip": "::1"}\n')
+        self.addCleanup(os.remove, f.name)
+        call_command('import_env_ips', f.name, '--batch-size', '1', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('export_env_ips', '--format', 'csv', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['ne_env,ne_ip', 'A,10.0.0.1', 'A,10.0.0.2', 'B,::1'])
+        out = io.StringIO()
+        call_command('export_env_ips', '--format', 'csv', '--env', 'A', '--expand', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -0,0 +1,78 @@
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase
+
+from config_api.executor import get_executor
+from config_api.models import Build, BuildLog
+from config_api.routing import websocket_urlpatterns
+
+from .utils import SimulatorMixin, wait_for_build
+
+application = URLRouter(websocket_urlpatterns)
+
+
+class BuildLogConsumerTests(SimulatorMixin, TransactionTestCase):
+
+    def _create_build(self, ne_ip='10.0.0.1,10.0.0.2'):
+        build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip=ne_ip,
+                                     version_path='/data/version.bin', status='pending')
+        build.create_targets()
+        return build
+
+    def test_live_logs_and_final_status_from_worker_threads(self):
+        build = self._create_build()
+
+        @async_to_sync
+        async def watch():
+            communicator = WebsocketCommunicator(application, f'/ws/build/{build.id}/logs/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'status', 'status': 'pending'})
+            await database_sync_to_async(get_executor().submit)(build)
+            # 每条消息都应立即送达，而不是等事件循环因其他原因醒来
+            messages = []
+            try:
+                while True:
+                    message = await communicator.receive_json_from(timeout=2)
+                    messages.append(message)
+                    if message['type'] == 'status' and message['status'] not in ('pending', 'in_progress'):
+                        return messages
+            finally:
+                await communicator.disconnect()
+
+        messages = watch()
+        self.assertEqual(messages[-1], {'type': 'status', 'status': 'success'})
+        self.assertIn({'type': 'status', 'status': 'in_progress'}, messages)
+        pushed = [log['message'] for message in messages if message['type'] == 'logs' for log in message['logs']]
+        self.assertTrue(any('升级完成' in text for text in pushed))
+        self.assertEqual(wait_for_build(build.id).status, 'success')
+
+    def test_replays_history_after_last_log_id(self):
+        build = self._create_build()
+        logs = [BuildLog.objects.create(build=build, message=f'line {index}') for index in range(3)]
+
+        @async_to_sync
+        async def replay():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/build/{build.id}/logs/?last_log_id={logs[0].id}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            received = [await communicator.receive_json_from(), await communicator.receive_json_from()]
+            await communicator.disconnect()
+            return received
+
+        history, status = replay()
+        self.assertEqual([log['message'] for log in history['logs']], ['line 1', 'line 2'])
+        self.assertEqual(status, {'type': 'status', 'status': 'pending'})
+
+    def test_unknown_build_is_rejected(self):
+        @async_to_sync
+        async def connect():
+            communicator = WebsocketCommunicator(application, '/ws/build/999999/logs/')
+            return await communicator.connect()
+
+        connected, code = connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4404)
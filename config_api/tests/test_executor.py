@@ -0,0 +1,81 @@
+import threading
+
+from django.test import TransactionTestCase
+
+from config_api.executor import ExecutorFull, ExecutorShutdown, UpgradeExecutor
+from config_api.models import Build, UpgradeJob
+
+from .utils import stop_shared_executor, wait_until
+
+
+class UpgradeExecutorTests(TransactionTestCase):
+
+    def setUp(self):
+        stop_shared_executor()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = []
+        self.lock = threading.Lock()
+
+    def _runner(self, job):
+        with self.lock:
+            self.started.append(job.build_id)
+        self.release.wait(10)
+        if Build.objects.get(id=job.build_id).ne_ip == 'boom':
+            raise RuntimeError('boom')
+
+    def _executor(self, **kwargs):
+        options = dict(max_workers=2, max_queue=2, poll_interval=0.05, cancel_poll_interval=0.1, name='test')
+        options.update(kwargs)
+        executor = UpgradeExecutor(self._runner, **options)
+        executor.start()
+        self.addCleanup(executor.shutdown, wait=True, timeout=5)
+        return executor
+
+    def _build(self, ne_ip='10.0.0.1'):
+        return Build.objects.create(upgrade_type='force', work_type='main', ne_ip=ne_ip,
+                                    version_path='/x', status='pending')
+
+    def test_pool_is_bounded_and_queue_rejects_when_full(self):
+        executor = self._executor()
+        for _ in range(2):
+            executor.submit(self._build())
+        self.assertTrue(wait_until(lambda: executor.stats()['busy_workers'] == 2))
+        for _ in range(2):
+            executor.submit(self._build())
+        with self.assertRaises(ExecutorFull):
+            executor.submit(self._build())
+
+        stats = executor.stats()
+        self.assertEqual((stats['busy_workers'], stats['queue_depth'], stats['rejected']), (2, 2, 1))
+        self.assertEqual(len(self.started), 2)
+
+        self.release.set()
+        self.assertTrue(wait_until(lambda: executor.stats()['completed'] == 4))
+        self.assertEqual(len(self.started), 4)
+        self.assertEqual(UpgradeJob.objects.filter(state='done').count(), 4)
+
+    def test_runner_errors_are_counted_and_release_the_lease(self):
+        self.release.set()
+        executor = self._executor()
+        job = executor.submit(self._build('boom'))
+        self.assertTrue(wait_until(lambda: executor.stats()['completed'] == 1))
+        self.assertEqual(executor.stats()['failed'], 1)
+        self.assertEqual(UpgradeJob.objects.get(id=job.id).state, 'done')
+
+    def test_shutdown_keeps_queued_jobs_for_the_next_start(self):
+        executor = self._executor(max_workers=1)
+        executor.submit(self._build())
+        self.assertTrue(wait_until(lambda: executor.stats()['busy_workers'] == 1))
+        queued = executor.submit(self._build())
+
+        executor.shutdown(wait=False)
+        with self.assertRaises(ExecutorShutdown):
+            executor.submit(self._build())
+        self.release.set()
+        self.assertTrue(wait_until(lambda: executor.stats()['completed'] == 1))
+        self.assertEqual(UpgradeJob.objects.get(id=queued.id).state, 'queued')
+
+        restarted = self._executor(max_workers=1)
+        self.assertTrue(wait_until(lambda: UpgradeJob.objects.get(id=queued.id).state == 'done'))
+        self.assertEqual(restarted.stats()['queue_depth'], 0)
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from config_api.models import Build
+
+
+class BuildHistoryTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.builds = []
+        for index in range(9):
+            build = Build.objects.create(upgrade_type='force' if index % 2 else 'cold', work_type='main',
+                                         ne_ip=f'10.0.0.{index},10.0.1.1', version_path='/x',
+                                         status='failed' if index % 3 == 0 else 'success')
+            build.create_targets()
+            # 部分构建的创建时间相同，翻页依靠 id 区分先后
+            Build.objects.filter(id=build.id).update(created_at=now - timedelta(days=index // 2))
+            self.builds.append(build)
+
+    def _ids(self, response):
+        return [item['id'] for item in response.json()]
+
+    def test_cursor_pages_are_newest_first_without_gaps(self):
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': 4}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/build/', params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(self._ids(response))
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                self.assertNotIn('Link', response)
+                break
+            self.assertIn('rel="next"', response['Link'])
+        self.assertEqual(ids, [build.id for build in sorted(
+            self.builds, key=lambda build: (Build.objects.get(id=build.id).created_at, build.id), reverse=True)])
+
+    def test_default_page_and_constant_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/build/')
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(len(response.json()[0]['targets']), 2)
+
+    def test_filters(self):
+        failed = self._ids(self.client.get('/api/build/', {'status': 'failed', 'page_size': 50}))
+        self.assertEqual(sorted(failed), [build.id for build in self.builds if build.status == 'failed'])
+        both = self.client.get('/api/build/', {'status': 'failed,success', 'page_size': 50})
+        self.assertEqual(len(both.json()), 9)
+        cold = self._ids(self.client.get('/api/build/', {'upgrade_type': 'cold', 'page_size': 50}))
+        self.assertEqual(len(cold), 5)
+        by_target = self._ids(self.client.get('/api/build/', {'ne_ip': '10.0.0.4'}))
+        self.assertEqual(by_target, [self.builds[4].id])
+        self.assertEqual(len(self.client.get('/api/build/', {'ne_ip': '10.0.1.1', 'page_size': 50}).json()), 9)
+
+        today = timezone.localdate().isoformat()
+        recent = self._ids(self.client.get('/api/build/', {'created_after': today, 'page_size': 50}))
+        self.assertEqual(sorted(recent), [self.builds[0].id, self.builds[1].id])
+
+    def test_invalid_parameters(self):
+        for params in ({'status': 'done'}, {'cursor': 'not-a-cursor'}, {'created_before': 'yesterday'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/build/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
@@ -0,0 +1,97 @@
+import random
+
+from django.test import SimpleTestCase
+
+from config_api import ipsets
+from config_api.ipsets import IPBlock, IntervalIndex
+
+
+def block(text):
+    return ipsets.parse_entry(text)
+
+
+class ParseTests(SimpleTestCase):
+
+    def test_entries(self):
+        self.assertEqual(block('10.0.0.1'), IPBlock(4, 0x0a000001, 0x0a000001))
+        self.assertEqual(block('10.0.0.7/30'), IPBlock(4, 0x0a000004, 0x0a000007))
+        self.assertEqual(block(' 10.0.0.1-10.0.0.50 '), IPBlock(4, 0x0a000001, 0x0a000032))
+        self.assertEqual(block('2001:db8::/127').version, 6)
+        for bad in ('10.0.0.1/33', '10.0.0.9-10.0.0.1', '10.0.0.1-2001:db8::1', 'ne-01', ''):
+            with self.subTest(entry=bad), self.assertRaises(ValueError):
+                block(bad)
+
+    def test_canonical_text(self):
+        self.assertEqual(ipsets.normalize_entry('10.0.0.0-10.0.0.255'), '10.0.0.0/24')
+        self.assertEqual(ipsets.normalize_entry('10.0.0.9/24'), '10.0.0.0/24')
+        self.assertEqual(ipsets.normalize_entry('10.0.0.1-10.0.0.2'), '10.0.0.1-10.0.0.2')
+        self.assertEqual(ipsets.normalize_entry('2001:db8::1-2001:db8::1'), '2001:db8::1')
+
+    def test_looks_like_block(self):
+        self.assertTrue(ipsets.looks_like_block('10.0.0.1-x'))
+        self.assertTrue(ipsets.looks_like_block('x/24'))
+        self.assertFalse(ipsets.looks_like_block('ne-01.lab'))
+
+    def test_keys_sort_like_numbers(self):
+        values = [0, 9, 10, 255, 2 ** 32, 2 ** 127]
+        keys = [ipsets.to_key(value) for value in values]
+        self.assertEqual(sorted(keys), keys)
+        self.assertEqual([ipsets.from_key(key) for key in keys], values)
+
+
+class CompactTests(SimpleTestCase):
+
+    def test_compact_merges_adjacent_and_overlapping_blocks(self):
+        entries = [f'10.0.0.{i}' for i in range(256)] + ['10.0.1.0/25', '10.0.1.100-10.0.1.200', 'ne-01.lab']
+        self.assertEqual(ipsets.compact(entries), ['10.0.0.0-10.0.1.200', 'ne-01.lab'])
+        self.assertEqual(ipsets.address_count(entries), 256 + 201)
+
+    def test_iter_addresses_is_lazy_and_deduplicated(self):
+        addresses = ipsets.iter_addresses(['10.0.0.2-10.0.0.3', '10.0.0.0/31', '10.0.0.3', 'host'])
+        self.assertEqual(list(addresses), ['host', '10.0.0.0', '10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        huge = ipsets.iter_addresses(['2001:db8::/64', '10.0.0.1'], max_block=1024)
+        self.assertEqual(list(huge), ['2001:db8::/64', '10.0.0.1'])
+
+    def test_iter_merged(self):
+        blocks = sorted([block('10.0.0.0/31'), block('10.0.0.2'), block('10.0.0.9'), block('::1')])
+        self.assertEqual(list(ipsets.iter_merged(blocks)), [
+            IPBlock(4, 0x0a000000, 0x0a000002), IPBlock(4, 0x0a000009, 0x0a000009), IPBlock(6, 1, 1),
+        ])
+
+
+class IntervalIndexTests(SimpleTestCase):
+
+    def test_owners_of_addresses_and_ranges(self):
+        index = IntervalIndex([
+            (block('10.0.0.0/24'), (1, 0), 'CES'),
+            (block('10.0.0.100-10.0.1.10'), (1, 1), 'LAB'),
+            (block('10.0.0.5'), (0, 0), 'FIRST'),
+            (block('2001:db8::/64'), (2, 0), 'V6'),
+        ])
+        self.assertEqual(index.owners_of(block('10.0.0.5')), ['FIRST', 'CES'])
+        self.assertEqual(index.owners_of(block('10.0.0.150')), ['CES', 'LAB'])
+        self.assertEqual(index.owners_of(block('10.0.1.10')), ['LAB'])
+        self.assertEqual(index.owners_of(block('10.0.1.11')), [])
+        self.assertEqual(index.owners_of(block('10.0.0.0/25')), ['FIRST', 'CES', 'LAB'])
+        self.assertEqual(index.owners_of(block('10.0.1.11/32')), [])
+        self.assertEqual(index.owners_of(block('2001:db8::abcd')), ['V6'])
+        self.assertTrue(index.contains('10.0.0.255'))
+        self.assertFalse(index.contains('9.255.255.255'))
+        self.assertEqual(index.size, 4)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(5)
+        items = []
+        for owner in range(40):
+            first = rng.randrange(0, 2000)
+            items.append((IPBlock(4, first, first + rng.randrange(0, 200)), (owner, 0), owner))
+        index = IntervalIndex(items)
+        for _ in range(500):
+            first = rng.randrange(0, 2300)
+            query = IPBlock(4, first, first + rng.choice([0, 0, 5, 50]))
+            expected = sorted(owner for item, _, owner in items
+                              if item.first <= query.last and query.first <= item.last)
+            self.assertEqual(index.owners_of(query), expected, query)
+
+    def test_empty_index(self):
+        self.assertEqual(IntervalIndex().owners_of(block('10.0.0.1')), [])
@@ -0,0 +1,114 @@
+import subprocess
+import sys
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from config_api import jobs
+from config_api.models import Build, BuildTarget, UpgradeJob
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class JobQueueTests(TestCase):
+
+    def _build(self, ne_ip='10.0.0.1,10.0.0.2', status='pending'):
+        build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip=ne_ip,
+                                     version_path='/x', status=status)
+        build.create_targets()
+        return build
+
+    def _leased(self, owner, attempts=1, expires_in=60):
+        build = self._build(status='in_progress')
+        return UpgradeJob.objects.create(
+            build=build, state='leased', owner=owner, attempts=attempts,
+            lease_expires_at=timezone.now() + timedelta(seconds=expires_in)
+        )
+
+    def test_claim_is_exclusive_and_ordered_by_priority(self):
+        low = jobs.enqueue_build(self._build(), 10, priority=2)
+        high = jobs.enqueue_build(self._build(), 10, priority=0)
+        first = jobs.claim_next_job('a:1:x', 30)
+        second = jobs.claim_next_job('b:2:x', 30)
+        self.assertEqual((first.id, second.id), (high.id, low.id))
+        self.assertEqual((first.state, first.owner, first.attempts), ('leased', 'a:1:x', 1))
+        self.assertIsNone(jobs.claim_next_job('c:3:x', 30))
+
+    def test_queue_limit(self):
+        jobs.enqueue_build(self._build(), 1)
+        with self.assertRaises(jobs.QueueFull):
+            jobs.enqueue_build(self._build(), 1)
+
+    def test_renew_and_complete_require_the_owner(self):
+        job = jobs.enqueue_build(self._build(), 10)
+        jobs.claim_next_job('a:1:x', 30)
+        self.assertEqual(jobs.renew_leases('b:2:x', [job.id], 30), 0)
+        self.assertEqual(jobs.renew_leases('a:1:x', [job.id], 30), 1)
+        self.assertEqual(jobs.complete_job(job.id, 'b:2:x'), 0)
+        self.assertEqual(jobs.complete_job(job.id, 'a:1:x'), 1)
+        self.assertEqual(UpgradeJob.objects.get(id=job.id).state, 'done')
+
+    def test_expired_lease_is_requeued_without_repeating_finished_targets(self):
+        job = self._leased('other-host:1:x', expires_in=-5)
+        BuildTarget.objects.filter(build=job.build, ne_ip='10.0.0.1').update(status='success')
+        BuildTarget.objects.filter(build=job.build, ne_ip='10.0.0.2').update(status='in_progress')
+
+        result = jobs.recover_orphaned_jobs(max_attempts=2, max_queue=10)
+
+        self.assertEqual(result['requeued'], 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.owner), ('queued', ''))
+        self.assertEqual(Build.objects.get(id=job.build_id).status, 'pending')
+        self.assertEqual(dict(job.build.targets.values_list('ne_ip', 'status')),
+                         {'10.0.0.1': 'success', '10.0.0.2': 'pending'})
+
+    def test_expired_lease_after_max_attempts_fails_the_build(self):
+        job = self._leased('other-host:1:x', attempts=2, expires_in=-5)
+        result = jobs.recover_orphaned_jobs(max_attempts=2, max_queue=10)
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(Build.objects.get(id=job.build_id).status, 'failed')
+        self.assertEqual(set(job.build.targets.values_list('status', flat=True)), {'failed'})
+
+    def test_live_lease_of_another_host_is_kept(self):
+        job = self._leased('other-host:1:x')
+        jobs.recover_orphaned_jobs(2, 10, local_owner=jobs.worker_identity())
+        self.assertEqual(UpgradeJob.objects.get(id=job.id).state, 'leased')
+
+    def test_start_reclaims_jobs_of_a_dead_local_instance(self):
+        identity = jobs.worker_identity()
+        host, _, boot_id = jobs._parse_owner(identity)
+        dead = self._leased(f"{host}:{dead_pid()}:{boot_id}")
+        previous = self._leased(identity)
+        rebooted = self._leased(f"{host}:{dead_pid()}:00000000")
+        legacy = self._leased(f"{host}:{dead_pid()}")
+
+        # 心跳线程的定期恢复只处理过期租约
+        self.assertEqual(jobs.recover_orphaned_jobs(2, 10)['requeued'], 0)
+        result = jobs.recover_orphaned_jobs(2, 10, local_owner=identity)
+
+        self.assertEqual(result['requeued'], 4)
+        for job in (dead, previous, rebooted, legacy):
+            self.assertEqual(UpgradeJob.objects.get(id=job.id).state, 'queued')
+
+    def test_live_sibling_process_on_this_host_is_kept(self):
+        identity = jobs.worker_identity()
+        host, _, boot_id = jobs._parse_owner(identity)
+        sibling = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        self.addCleanup(sibling.wait)
+        self.addCleanup(sibling.kill)
+        job = self._leased(f"{host}:{sibling.pid}:{boot_id}")
+        jobs.recover_orphaned_jobs(2, 10, local_owner=identity)
+        self.assertEqual(UpgradeJob.objects.get(id=job.id).state, 'leased')
+
+    def test_builds_without_jobs(self):
+        pending = self._build()
+        running = self._build(status='in_progress')
+        result = jobs.recover_orphaned_jobs(2, 10)
+        self.assertEqual(result['ghosts'], 2)
+        self.assertEqual(UpgradeJob.objects.get(build=pending).state, 'queued')
+        self.assertEqual(Build.objects.get(id=running.id).status, 'failed')
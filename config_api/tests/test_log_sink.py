@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from config_api import log_sink
+from config_api.log_sink import BuildLogSink
+from config_api.models import Build, BuildLog
+
+
+class BuildLogSinkTests(TestCase):
+
+    def setUp(self):
+        self.build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.1',
+                                          version_path='/x', status='in_progress')
+
+    def _messages(self):
+        return list(BuildLog.objects.filter(build=self.build).order_by('id').values_list('message', flat=True))
+
+    def test_lines_are_written_in_batches(self):
+        sink = BuildLogSink(self.build.id, batch_size=3, flush_interval=3600)
+        sink.write('line 1')
+        sink.write('line 2')
+        self.assertEqual(self._messages(), [])
+        self.assertEqual(sink.backlog, 2)
+        with self.assertNumQueries(1):
+            sink.write('line 3', log_type='error')
+        self.assertEqual(self._messages(), ['line 1', 'line 2', 'line 3'])
+        self.assertEqual(BuildLog.objects.get(message='line 3').log_type, 'error')
+        self.assertEqual(sink.backlog, 0)
+
+    def test_failed_flush_keeps_lines_and_drops_the_overflow(self):
+        sink = BuildLogSink(self.build.id, batch_size=2, flush_interval=3600, max_backlog=3)
+        with mock.patch.object(BuildLog.objects, 'bulk_create', side_effect=DatabaseError('locked')):
+            for index in range(4):
+                sink.write(f'line {index}')
+        self.assertEqual(sink.backlog, 3)
+        self.assertEqual(sink.dropped, 1)
+        self.assertEqual(len(sink.flush()), 3)
+        self.assertEqual(self._messages(), ['line 1', 'line 2', 'line 3'])
+
+    def test_close_flushes_and_rejects_later_lines(self):
+        sink = BuildLogSink(self.build.id, batch_size=100, flush_interval=3600)
+        sink.write('last line')
+        sink.close()
+        sink.write('too late')
+        self.assertEqual(self._messages(), ['last line'])
+        self.assertEqual(sink.dropped, 1)
+
+    @override_settings(BUILD_LOG_BATCH_SIZE=100)
+    def test_registered_sinks_and_stats(self):
+        sink = log_sink.open_sink(self.build.id)
+        self.addCleanup(sink.close)
+        sink.write('buffered')
+        self.assertIs(log_sink.get_sink(self.build.id), sink)
+        self.assertEqual(log_sink.sink_stats()['backlog'], 1)
+        log_sink.flush_sink(self.build.id)
+        self.assertEqual(self._messages(), ['buffered'])
+        sink.close()
+        self.assertIsNone(log_sink.get_sink(self.build.id))
@@ -0,0 +1,63 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from config_api.models import Build, BuildLog
+
+
+class BuildLogPageTests(TestCase):
+
+    def setUp(self):
+        self.build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.1',
+                                          version_path='/x', status='in_progress')
+        other = Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.2',
+                                     version_path='/x', status='in_progress')
+        for index in range(25):
+            BuildLog.objects.create(build=self.build, message=f'line {index}')
+            BuildLog.objects.create(build=other, message=f'other {index}')
+
+    def test_polling_returns_only_new_lines(self):
+        url = f'/api/build/{self.build.id}/logs/'
+        first = self.client.get(url, {'limit': 10}).json()
+        self.assertEqual([log['message'] for log in first['logs']], [f'line {i}' for i in range(10)])
+        self.assertTrue(first['has_more'])
+
+        rest = self.client.get(url, {'limit': 100, 'last_log_id': first['last_log_id']}).json()
+        self.assertEqual([log['message'] for log in rest['logs']], [f'line {i}' for i in range(10, 25)])
+        self.assertFalse(rest['has_more'])
+
+        empty = self.client.get(url, {'last_log_id': rest['last_log_id']}).json()
+        self.assertEqual((empty['logs'], empty['last_log_id']), ([], rest['last_log_id']))
+
+    def test_cursor_pages_cover_every_line_once(self):
+        url = f'/api/build/{self.build.id}/build_logs/'
+        messages, cursor = [], None
+        while True:
+            params = {'page_size': 7}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.client.get(url, params).json()
+            messages.extend(log['message'] for log in page['logs'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(messages, [f'line {i}' for i in range(25)])
+
+    @override_settings(BUILD_LOG_MAX_PAGE_SIZE=5)
+    def test_page_size_is_clamped(self):
+        page = self.client.get(f'/api/build/{self.build.id}/build_logs/', {'page_size': 1000}).json()
+        self.assertEqual(len(page['logs']), 5)
+        page = self.client.get(f'/api/build/{self.build.id}/build_logs/', {'page_size': 'x'}).json()
+        self.assertEqual(len(page['logs']), 5)
+
+    def test_unknown_build(self):
+        self.assertEqual(self.client.get('/api/build/999999/logs/').status_code, 404)
+        self.assertEqual(self.client.post('/api/build/999999/stop/').status_code, 404)
+
+    def test_page_query_uses_the_build_id_index(self):
+        query = BuildLog.objects.filter(build_id=self.build.id, id__gt=3).order_by('id')[:10]
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('buildlog_build_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,89 @@
+import json
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """迁移到 migrate_from 写入旧数据，再迁移到 migrate_to 检查结果"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self._migrate_to_latest)
+        self.old_apps = self._migrate(self.migrate_from)
+
+    def _migrate(self, name):
+        executor = MigrationExecutor(connection)
+        target = [('config_api', name)]
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def _migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class CopyConfigJsonTests(MigrationTestCase):
+    migrate_from = '0013_config_version'
+    migrate_to = '0019_config_content_hash'
+
+    def _old_config(self, env_ip_map, upgrade_type='["force", "cold"]'):
+        Config = self.old_apps.get_model('config_api', 'Config')
+        return Config.objects.create(upgrade_type=upgrade_type, work_type='["main"]',
+                                     env_ip_map=json.dumps(env_ip_map))
+
+    def test_json_fields_are_copied_to_tables(self):
+        config = self._old_config({'CES': ['10.0.0.1', '10.0.0.0/30'], 'LAB': '10.1.0.1, ne-01.lab'})
+        apps = self._migrate(self.migrate_to)
+        ConfigOption = apps.get_model('config_api', 'ConfigOption')
+        EnvironmentIP = apps.get_model('config_api', 'EnvironmentIP')
+        Config = apps.get_model('config_api', 'Config')
+        self.assertEqual(list(ConfigOption.objects.filter(config_id=config.id, kind='upgrade_type')
+                              .order_by('position').values_list('value', flat=True)), ['force', 'cold'])
+        rows = EnvironmentIP.objects.filter(environment__config_id=config.id).order_by(
+            'environment__position', 'position')
+        self.assertEqual(list(rows.values_list('environment__name', 'ne_ip', 'ip_version')), [
+            ('CES', '10.0.0.1', 4), ('CES', '10.0.0.0/30', 4), ('LAB', '10.1.0.1', 4), ('LAB', 'ne-01.lab', 0),
+        ])
+        cidr = rows.get(ne_ip='10.0.0.0/30')
+        self.assertEqual((cidr.range_start[-8:], cidr.range_end[-8:]), ('0a000000', '0a000003'))
+        self.assertEqual(len(Config.objects.get(id=config.id).content_hash), 64)
+
+    def test_too_long_entry_stops_the_migration(self):
+        config = self._old_config({'CES': ['10.0.0.1', 'ne-' + 'x' * 70]})
+        with self.assertRaisesMessage(ValueError, 'longer than 64 characters'):
+            self._migrate('0015_copy_config_json')
+        # 迁移整体回滚，旧数据保持原样；删掉这一行后才能迁移回最新状态
+        Config = self.old_apps.get_model('config_api', 'Config')
+        self.assertEqual(Config.objects.get(id=config.id).env_ip_map, config.env_ip_map)
+        Config.objects.filter(id=config.id).delete()
+
+
+class ContentHashMigrationTests(MigrationTestCase):
+    migrate_from = '0020_device_indexes'
+    migrate_to = '0021_content_hash_v2'
+
+    def test_hash_matches_the_application(self):
+        Config = self.old_apps.get_model('config_api', 'Config')
+        ConfigOption = self.old_apps.get_model('config_api', 'ConfigOption')
+        ConfigEnvironment = self.old_apps.get_model('config_api', 'ConfigEnvironment')
+        EnvironmentIP = self.old_apps.get_model('config_api', 'EnvironmentIP')
+        config = Config.objects.create(version=1, content_hash='old')
+        ConfigOption.objects.create(config=config, kind='upgrade_type', value='force')
+        environment = ConfigEnvironment.objects.create(config=config, name='CES')
+        EnvironmentIP.objects.create(environment=environment, ne_ip='10.0.0.0/31', ip_version=4,
+                                     range_start='%032x' % 0x0a000000, range_end='%032x' % 0x0a000001)
+        EnvironmentIP.objects.create(environment=environment, ne_ip='ne-01.lab', position=1)
+        ConfigEnvironment.objects.create(config=config, name='EMPTY', position=1)
+        self._migrate(self.migrate_to)
+
+        from config_api.config_history import content_hash
+        from config_api.models import Config as CurrentConfig
+        self.assertEqual(CurrentConfig.objects.get(id=config.id).content_hash, content_hash({
+            'upgrade_type': ['force'], 'work_type': [],
+            'environments': {'CES': ['10.0.0.0', '10.0.0.1', 'ne-01.lab'], 'EMPTY': []},
+        }))
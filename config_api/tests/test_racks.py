@@ -0,0 +1,40 @@
+from django.test import TestCase
+
+from config_api.models import Device, DeviceType, Rack
+
+
+class RackOccupancyTests(TestCase):
+
+    def setUp(self):
+        device_type = DeviceType.objects.create(type_id='S1', name='Switch')
+        self.rack = Rack.objects.create(number='R1', row=1, column=1, total_units=4)
+        Rack.objects.create(number='R2', row=1, column=2, total_units=10)
+        Rack.objects.create(number='R3', row=2, column=1, total_units=0)
+        for rack_number, position in (('R1', 1), ('R1', 2), ('R1', 2), ('R1', 9), ('R2', 5), ('OTHER', 1)):
+            Device.objects.create(name=f'{rack_number}-{position}', ip_address='10.0.0.1', device_type=device_type,
+                                  rack_number=rack_number, position=position, status='online')
+
+    def test_list_loads_all_devices_in_one_query(self):
+        with self.assertNumQueries(2):
+            racks = self.client.get('/api/racks/').json()
+        by_number = {rack['number']: rack for rack in racks}
+        self.assertEqual([rack['number'] for rack in racks], ['R1', 'R2', 'R3'])
+        self.assertEqual([device['name'] for device in by_number['R1']['devices']], ['R1-1', 'R1-2', 'R1-2', 'R1-9'])
+        self.assertEqual(by_number['R1']['devices'][0]['device_type_name'], 'Switch')
+        self.assertEqual(by_number['R3']['devices'], [])
+
+    def test_occupancy(self):
+        self.assertEqual(self.rack.occupancy(), {
+            'device_count': 4,
+            'used_units': 2,
+            'free_units': 2,
+            'utilization': 50.0,
+            'conflicts': [2],
+            'out_of_range': 1,
+        })
+        self.assertEqual(Rack.objects.get(number='R3').occupancy()['utilization'], 0.0)
+
+    def test_single_rack(self):
+        rack = self.client.get(f'/api/racks/{self.rack.id}/').json()
+        self.assertEqual(rack['occupancy']['device_count'], 4)
+        self.assertEqual(len(rack['devices']), 4)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from config_api import jobs
+from config_api.archive import archive_build_logs
+from config_api.models import Build, BuildLog, BuildLogSegment, BuildTarget, UpgradeJob
+from config_api.retention import apply_retention, expired_builds, get_rules
+from config_api.search import FTS_TABLE
+
+
+class RetentionTests(TestCase):
+
+    def _build(self, status='success', age_days=0, lines=5):
+        build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.1,10.0.0.2',
+                                     version_path='/x', status=status)
+        build.create_targets()
+        BuildLog.objects.bulk_create([BuildLog(build=build, message=f'retention line {i}') for i in range(lines)])
+        moment = timezone.now() - timedelta(days=age_days)
+        Build.objects.filter(id=build.id).update(created_at=moment, updated_at=moment)
+        return build
+
+    def _fts_rows(self, build):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                           [f'build_ref:"#{build.id}#"'])
+            return cursor.fetchone()[0]
+
+    def test_old_builds_and_all_their_rows_are_purged(self):
+        old = self._build(age_days=40)
+        archive_build_logs(old.id, chunk_size=2)
+        BuildLog.objects.create(build=old, message='late line')
+        jobs.enqueue_build(old, 10)
+        recent = self._build(age_days=1)
+        running = self._build(status='in_progress', age_days=90)
+
+        result = apply_retention({'success': {'max_age_days': 30}}, chunk_size=2, pause=0)
+
+        self.assertEqual(result['builds'], 1)
+        self.assertEqual(result['rows']['buildlogsegment'], 3)
+        self.assertEqual(result['rows']['buildtarget'], 2)
+        self.assertFalse(Build.objects.filter(id=old.id).exists())
+        for model in (BuildLog, BuildLogSegment, BuildTarget, UpgradeJob):
+            self.assertFalse(model.objects.filter(build_id=old.id).exists(), model.__name__)
+        self.assertEqual(self._fts_rows(old), 0)
+        self.assertEqual(self._fts_rows(recent), 5)
+        self.assertEqual(Build.objects.filter(id__in=[recent.id, running.id]).count(), 2)
+
+    def test_keep_latest(self):
+        builds = [self._build(status='failed', age_days=days, lines=0) for days in (5, 4, 3, 2, 1)]
+        self.assertEqual(list(expired_builds('failed', keep_latest=2).values_list('id', flat=True)),
+                         [build.id for build in builds[:3]])
+        apply_retention({'failed': {'keep_latest': 2}}, pause=0)
+        self.assertEqual(sorted(Build.objects.values_list('id', flat=True)), [builds[3].id, builds[4].id])
+
+    def test_dry_run_and_max_builds(self):
+        for _ in range(3):
+            self._build(status='stopped', age_days=10, lines=0)
+        rules = {'stopped': {'max_age_days': 1}}
+        self.assertEqual(apply_retention(rules, dry_run=True)['builds'], 3)
+        self.assertEqual(Build.objects.count(), 3)
+        self.assertEqual(apply_retention(rules, pause=0, max_builds=2)['builds'], 2)
+        self.assertEqual(Build.objects.count(), 1)
+
+    @override_settings(BUILD_RETENTION_RULES={'success': {'max_age_days': 30}, 'pending': {'max_age_days': 1},
+                                              'failed': {}})
+    def test_rules_never_cover_active_statuses(self):
+        self.assertEqual(get_rules(), {'success': {'max_age_days': 30}})
+
+    @override_settings(BUILD_RETENTION_RULES={})
+    def test_command(self):
+        old = self._build(age_days=10, lines=0)
+        self._build(age_days=1, lines=0)
+        out = StringIO()
+        call_command('purge_builds', status='success', max_age_days=7, pause=0, stdout=out)
+        self.assertIn('Purged 1 builds', out.getvalue())
+        self.assertFalse(Build.objects.filter(id=old.id).exists())
+        with self.assertRaises(CommandError):
+            call_command('purge_builds', max_age_days=7, stdout=StringIO())
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from config_api import jobs, scheduling
+from config_api.models import Build, UpgradeJob
+from django_backend import settings as project_settings
+
+from .utils import make_config
+
+
+@override_settings(UPGRADE_ENV_CONCURRENCY={'CES': 1}, UPGRADE_ENV_DEFAULT_CONCURRENCY=0,
+                   UPGRADE_PRIORITY_AGING_SECONDS=0, UPGRADE_DEFAULT_BUILD_SECONDS=600)
+class SchedulingTests(TestCase):
+
+    def setUp(self):
+        served = mock.patch.dict(scheduling._served, clear=True)
+        served.start()
+        self.addCleanup(served.stop)
+        # 配置缓存在事务提交后失效，TestCase 中需要手动执行提交回调
+        with self.captureOnCommitCallbacks(execute=True):
+            make_config(CES=['10.0.0.0/30'], LAB=['10.1.0.1', '10.1.0.2'])
+
+    def _enqueue(self, ne_ip, priority='normal'):
+        build = Build.objects.create(upgrade_type='force', work_type='main', ne_ip=ne_ip,
+                                     version_path='/x', status='pending')
+        return jobs.enqueue_build(build, 100, priority=scheduling.parse_priority(priority))
+
+    def test_parse_priority(self):
+        self.assertEqual(scheduling.parse_priority(None), scheduling.DEFAULT_PRIORITY)
+        self.assertEqual(scheduling.parse_priority('HIGH'), scheduling.PRIORITIES['high'])
+        self.assertEqual(scheduling.parse_priority('2'), 2)
+        for value in ('urgent', 7, [1]):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                scheduling.parse_priority(value)
+
+    def test_environment_is_where_most_nes_are(self):
+        self.assertEqual(scheduling.resolve_environment(['10.0.0.1', '10.0.0.2', '10.1.0.1']), 'CES')
+        self.assertEqual(scheduling.resolve_environment(['10.1.0.1', '10.1.0.2', '10.0.0.3']), 'LAB')
+        self.assertEqual(scheduling.resolve_environment(['192.168.0.1']), '')
+        self.assertEqual(self._enqueue('10.0.0.1,10.0.0.2').environment, 'CES')
+
+    def test_claims_follow_priority_and_environment_caps(self):
+        first = self._enqueue('10.0.0.1', 'high')
+        second = self._enqueue('10.0.0.2', 'high')
+        lab = self._enqueue('10.1.0.1', 'low')
+
+        self.assertEqual(jobs.claim_next_job('a:1:x', 60).id, first.id)
+        # CES 已达上限，低优先级的 LAB 任务先执行
+        self.assertEqual(jobs.claim_next_job('a:1:x', 60).id, lab.id)
+        self.assertIsNone(jobs.claim_next_job('a:1:x', 60))
+        jobs.complete_job(first.id, 'a:1:x')
+        self.assertEqual(jobs.claim_next_job('a:1:x', 60).id, second.id)
+
+    def test_unassigned_builds_ignore_the_default_cap(self):
+        unassigned = [self._enqueue(f'192.168.0.{n}') for n in range(1, 5)]
+        with self.settings(UPGRADE_ENV_DEFAULT_CONCURRENCY=1):
+            claimed = [jobs.claim_next_job('a:1:x', 60) for _ in range(4)]
+            self.assertEqual(scheduling.environment_cap('LAB'), 1)
+            self.assertEqual(scheduling.environment_cap(''), 0)
+        self.assertEqual([job.id for job in claimed], [job.id for job in unassigned])
+        self.assertEqual(UpgradeJob.objects.filter(state='leased', environment='').count(), 4)
+        with self.settings(UPGRADE_ENV_CONCURRENCY={'': 1}):
+            self.assertEqual(scheduling.environment_cap(''), 1)
+
+    def test_default_settings_do_not_cap_environments(self):
+        self.assertEqual(project_settings.UPGRADE_ENV_DEFAULT_CONCURRENCY, 0)
+
+    def test_environments_take_turns(self):
+        ces = [self._enqueue('10.0.0.1'), self._enqueue('10.0.0.2')]
+        lab = [self._enqueue('10.1.0.1'), self._enqueue('10.1.0.2')]
+        with self.settings(UPGRADE_ENV_CONCURRENCY={}):
+            claimed = [jobs.claim_next_job('a:1:x', 60).id for _ in range(4)]
+        self.assertEqual(claimed, [ces[0].id, lab[0].id, ces[1].id, lab[1].id])
+
+    def test_low_priority_jobs_age(self):
+        now = timezone.now()
+        with self.settings(UPGRADE_PRIORITY_AGING_SECONDS=600):
+            self.assertEqual(scheduling.effective_priority(2, now - timedelta(seconds=700), now), 1)
+            self.assertEqual(scheduling.effective_priority(2, now - timedelta(hours=1), now), 0)
+        self.assertEqual(scheduling.effective_priority(2, now - timedelta(hours=1), now), 2)
+
+    def test_queue_snapshot_estimates_start_times(self):
+        running = self._enqueue('10.1.0.1')
+        jobs.claim_next_job('a:1:x', 60)
+        UpgradeJob.objects.filter(id=running.id).update(updated_at=timezone.now() - timedelta(seconds=100))
+        low = self._enqueue('10.0.0.1', 'low')
+        high = self._enqueue('10.0.0.2', 'high')
+
+        snapshot = scheduling.queue_snapshot(max_workers=1)
+
+        self.assertEqual(snapshot[running.build_id]['position'], 0)
+        self.assertEqual([snapshot[high.build_id]['position'], snapshot[low.build_id]['position']], [1, 2])
+        self.assertAlmostEqual(snapshot[high.build_id]['expected_wait_seconds'], 500, delta=2)
+        self.assertAlmostEqual(snapshot[low.build_id]['expected_wait_seconds'], 1100, delta=2)
+        self.assertEqual(snapshot[low.build_id]['queue_length'], 2)
+        self.assertEqual(snapshot[high.build_id]['environment'], 'CES')
@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from config_api.archive import archive_build_logs
+from config_api.models import Build, BuildLog, BuildLogSegment
+from config_api.search import filter_logs
+
+
+class SearchTestCase(TestCase):
+
+    def _build(self, status='success'):
+        return Build.objects.create(upgrade_type='force', work_type='main', ne_ip='10.0.0.1',
+                                    version_path='/x', status=status)
+
+
+class SearchApiTests(SearchTestCase):
+
+    def setUp(self):
+        self.ok = self._build()
+        self.failed = self._build('failed')
+        BuildLog.objects.bulk_create([BuildLog(build=self.ok, message=f'line {i} ok') for i in range(30)])
+        BuildLog.objects.bulk_create([
+            BuildLog(build=self.failed, message=f'升级失败: Connection timed out <x> "q" {i}', log_type='error')
+            for i in range(7)
+        ])
+        BuildLog.objects.create(build=self.ok, message='Connection TIMED OUT once 50%')
+
+    def test_search_pages_newest_first_and_survives_archiving(self):
+        archive_build_logs(self.failed.id)
+        self.assertFalse(BuildLog.objects.filter(build=self.failed).exists())
+
+        first = self.client.get('/api/build/search/', {'q': 'timed out', 'page_size': 3}).json()
+        self.assertEqual([item['build'] for item in first['builds']], [self.ok.id, self.failed.id])
+        self.assertEqual(first['results'][0]['highlight'], 'Connection <mark>TIMED OUT</mark> once 50%')
+        ids = [item['id'] for item in first['results']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+        second = self.client.get('/api/build/search/',
+                                 {'q': 'timed out', 'page_size': 3, 'cursor': first['next_cursor']}).json()
+        self.assertLess(max(item['id'] for item in second['results']), min(ids))
+
+    def test_query_syntax_is_literal(self):
+        response = self.client.get('/api/build/search/', {'q': '"q"', 'build_id': self.failed.id}).json()
+        self.assertEqual(len(response['results']), 7)
+        self.assertIn('&lt;x&gt; <mark>&quot;q&quot;</mark>', response['results'][0]['highlight'])
+        self.assertEqual(self.client.get('/api/build/search/', {'q': 'AND OR NOT ('}).status_code, 200)
+        self.assertEqual(self.client.get('/api/build/search/').status_code, 400)
+
+    def test_short_query_falls_back_to_like(self):
+        response = self.client.get('/api/build/search/', {'q': 'ok', 'build_id': self.ok.id, 'page_size': 100})
+        self.assertEqual(len(response.json()['results']), 30)
+
+    def test_deleted_builds_leave_the_index(self):
+        self.failed.delete()
+        response = self.client.get('/api/build/search/', {'q': 'timed out'}).json()
+        self.assertEqual([item['build'] for item in response['builds']], [self.ok.id])
+
+    def _hits(self, query, build):
+        response = self.client.get('/api/build/search/', {'q': query, 'build_id': build.id, 'page_size': 100})
+        return len(response.json()['results'])
+
+    def test_deleted_log_rows_leave_the_index(self):
+        BuildLog.objects.filter(build=self.ok, message='line 3 ok').delete()
+        self.assertEqual(self._hits('line 3 ok', self.ok), 0)
+        self.assertEqual(self._hits('line 4 ok', self.ok), 1)
+
+    def test_search_after_archiving(self):
+        archive_build_logs(self.ok.id, chunk_size=10)
+        self.assertEqual(self._hits(' ok', self.ok), 30)
+        self.assertEqual(self._hits('once', self.ok), 1)
+
+        # 删除一个日志段，只有它覆盖的日志从索引中消失
+        segment = BuildLogSegment.objects.filter(build=self.ok).order_by('first_log_id').first()
+        segment.delete()
+        self.assertEqual(self._hits(' ok', self.ok), 20)
+        self.assertEqual(self._hits('timed out', self.failed), 7)
+
+
+class AdminSearchTests(SearchTestCase):
+
+    def test_filter_is_a_subquery_without_cap(self):
+        build = self._build()
+        BuildLog.objects.bulk_create([BuildLog(build=build, message=f'timeout {i}') for i in range(10050)])
+        BuildLog.objects.create(build=build, message='done')
+        logs = filter_logs(BuildLog.objects.all(), 'timeout')
+        self.assertIn('SELECT rowid FROM config_api_buildlog_fts', str(logs.query))
+        self.assertEqual(logs.count(), 10050)
+        self.assertEqual(filter_logs(BuildLog.objects.all(), 'do').count(), 1)
+
+    def test_changelist_search(self):
+        build = self._build()
+        BuildLog.objects.create(build=build, message='Connection TIMED OUT once')
+        BuildLog.objects.create(build=build, message='finished')
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/admin/config_api/buildlog/', {'q': 'timed'})
+        self.assertContains(response, 'TIMED OUT once')
+        self.assertNotContains(response, 'finished')
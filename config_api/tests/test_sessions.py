@@ -0,0 +1,120 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from config_api.drivers import UpgradeDriver
+from config_api.sessions import PoolExhausted, SessionPool
+
+
+class FakeSession:
+
+    def __init__(self, ne_ip):
+        self.ne_ip = ne_ip
+        self.alive = True
+        self.closed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+
+class SessionDriver(UpgradeDriver):
+    name = 'fake'
+    supports_sessions = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.opened = []
+
+    def open_session(self, ne_ip):
+        session = FakeSession(ne_ip)
+        self.opened.append(session)
+        return session
+
+
+class SessionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.driver = SessionDriver()
+
+    def _pool(self, **options):
+        pool = SessionPool(**dict({'max_per_host': 2, 'idle_timeout': 300, 'health_check_interval': 30,
+                                   'acquire_timeout': 5}, **options))
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_sessions_are_reused_per_host(self):
+        pool = self._pool()
+        for ne_ip in ('10.0.0.1', '10.0.0.1', '10.0.0.2', '10.0.0.1'):
+            with pool.session(self.driver, ne_ip) as session:
+                self.assertEqual(session.ne_ip, ne_ip)
+        self.assertEqual([session.ne_ip for session in self.driver.opened], ['10.0.0.1', '10.0.0.2'])
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['idle'], stats['hosts']), (2, 2, 2, 2))
+
+    def test_per_host_limit_waits_for_a_release(self):
+        pool = self._pool(max_per_host=1, acquire_timeout=0.1)
+        with pool.session(self.driver, '10.0.0.1') as first:
+            with self.assertRaises(PoolExhausted):
+                with pool.session(self.driver, '10.0.0.1'):
+                    pass
+            with pool.session(self.driver, '10.0.0.2'):
+                pass
+
+        pool.acquire_timeout = 5
+        acquired = []
+        release = threading.Event()
+        holder_ready = threading.Event()
+
+        def holder():
+            with pool.session(self.driver, '10.0.0.1'):
+                holder_ready.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        holder_ready.wait(5)
+        threading.Timer(0.1, release.set).start()
+        with pool.session(self.driver, '10.0.0.1') as session:
+            acquired.append(session)
+        thread.join(5)
+        self.assertIs(acquired[0], first)
+        self.assertGreaterEqual(pool.stats()['waits'], 2)
+
+    def test_failed_upgrade_closes_the_session(self):
+        pool = self._pool()
+        with self.assertRaises(RuntimeError):
+            with pool.session(self.driver, '10.0.0.1'):
+                raise RuntimeError('lost connection')
+        self.assertTrue(self.driver.opened[0].closed)
+        self.assertEqual((pool.stats()['open'], pool.stats()['idle']), (0, 0))
+        with pool.session(self.driver, '10.0.0.1') as session:
+            self.assertIsNot(session, self.driver.opened[0])
+
+    def test_dead_idle_session_is_replaced(self):
+        pool = self._pool(health_check_interval=0)
+        with pool.session(self.driver, '10.0.0.1') as session:
+            pass
+        session.alive = False
+        with pool.session(self.driver, '10.0.0.1') as replacement:
+            self.assertIsNot(replacement, session)
+        self.assertTrue(session.closed)
+        self.assertEqual((pool.stats()['health_failures'], pool.stats()['open']), (1, 1))
+
+    def test_prune_closes_idle_sessions(self):
+        pool = self._pool(idle_timeout=3600)
+        with pool.session(self.driver, '10.0.0.1') as session:
+            pass
+        self.assertEqual(pool.prune(), 0)
+        pool.idle_timeout = 0
+        self.assertEqual(pool.prune(), 1)
+        self.assertTrue(session.closed)
+        self.assertEqual(pool.stats()['open'], 0)
+
+    def test_drivers_without_sessions(self):
+        pool = self._pool()
+        with pool.session(UpgradeDriver(), '10.0.0.1') as session:
+            self.assertIsNone(session)
+        self.assertEqual(pool.stats()['misses'], 0)
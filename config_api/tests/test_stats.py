@@ -0,0 +1,99 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from config_api import stats
+from config_api.models import Build, BuildStat
+
+
+class HistogramTests(SimpleTestCase):
+
+    def test_bucket_index_uses_upper_bounds(self):
+        self.assertEqual(stats.bucket_index(0.5), 0)
+        self.assertEqual(stats.bucket_index(1), 0)
+        self.assertEqual(stats.bucket_index(1.5), 1)
+        self.assertEqual(stats.bucket_index(10 ** 6), len(stats.DURATION_BUCKETS))
+
+    def test_percentile(self):
+        buckets = [0] * (len(stats.DURATION_BUCKETS) + 1)
+        buckets[stats.bucket_index(3)] = 90
+        buckets[stats.bucket_index(100)] = 10
+        self.assertEqual(stats.percentile(buckets, 0.5), 5)
+        self.assertEqual(stats.percentile(buckets, 0.95), 120)
+        self.assertIsNone(stats.percentile([0] * len(buckets), 0.5))
+
+
+class RecordTests(TestCase):
+
+    def _finished_build(self, status, seconds, work_type='main'):
+        build = Build.objects.create(upgrade_type='force', work_type=work_type, ne_ip='10.0.0.1',
+                                     version_path='/x', status=status)
+        Build.objects.filter(id=build.id).update(updated_at=build.created_at + timedelta(seconds=seconds))
+        return build
+
+    def test_record_build_and_query(self):
+        for status, seconds in (('success', 3), ('success', 8), ('failed', 40), ('stopped', 1)):
+            stats.record_build(self._finished_build(status, seconds).id)
+        stats.record_build(self._finished_build('success', 2, work_type='backup').id)
+
+        result = stats.query_stats(days=1)
+        summary = result['summary']
+        self.assertEqual((summary['total'], summary['success'], summary['failed'], summary['stopped']), (5, 3, 1, 1))
+        self.assertEqual(summary['success_rate'], 0.6)
+        self.assertEqual(summary['max_duration'], 40)
+        self.assertEqual(summary['p50_duration'], 5)
+        self.assertEqual([row['work_type'] for row in result['by_type']], ['backup', 'main'])
+        self.assertEqual(result['daily'][0]['day'], timezone.localdate().isoformat())
+        self.assertEqual(stats.query_stats(days=1, work_type='backup')['summary']['total'], 1)
+
+    def test_unfinished_builds_are_not_counted(self):
+        stats.record_build(self._finished_build('in_progress', 5).id)
+        self.assertFalse(BuildStat.objects.exists())
+
+    def test_rebuild_matches_incremental_stats(self):
+        for status, seconds in (('success', 3), ('failed', 12)):
+            stats.record_build(self._finished_build(status, seconds).id)
+        before = list(BuildStat.objects.values('total', 'success', 'failed', 'duration_buckets'))
+        call_command('rebuild_build_stats', stdout=StringIO())
+        self.assertEqual(list(BuildStat.objects.values('total', 'success', 'failed', 'duration_buckets')), before)
+
+    def test_stats_api(self):
+        stats.record_build(self._finished_build('success', 3).id)
+        response = self.client.get('/api/build/stats/?days=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary']['total'], 1)
+        self.assertEqual(response.json()['days'], 3)
+
+
+class ConcurrentRecordTests(TransactionTestCase):
+
+    def test_parallel_updates_are_not_lost(self):
+        day = timezone.localdate()
+        errors = []
+        start = threading.Barrier(6)
+
+        def record(index):
+            try:
+                start.wait()
+                for step in range(5):
+                    stats._record(day, 'force', 'main', '', 'success', index + step)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=record, args=(index,)) for index in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stat = BuildStat.objects.get(day=day, upgrade_type='force', work_type='main', ne_ip='')
+        self.assertEqual((stat.total, stat.success, stat.duration_count), (30, 30, 30))
+        self.assertEqual(sum(stat.duration_buckets), 30)
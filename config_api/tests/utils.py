@@ -0,0 +1,117 @@
+"""测试共用的工具
+
+升级相关的测试使用 simulator 驱动并把每步耗时调到很小，构建在执行器的
+工作线程中真实运行。
+"""
+import threading
+import time
+
+from django.test import override_settings
+
+from config_api import executor
+from config_api.drivers import UpgradeDriver, reset_drivers
+from config_api.models import Build, Config, UpgradeJob
+
+FAST_SIMULATOR = {
+    'simulator': {
+        'step_latency': 0.01,
+        'connect_latency': 0,
+        'jitter': 0,
+        'transfer_steps': 2,
+    },
+}
+
+
+def make_config(**environments):
+    """创建一个包含给定环境的配置"""
+    config = Config()
+    config.set_upgrade_type(['force'])
+    config.set_work_type(['main'])
+    config.set_env_ip_map(environments)
+    config.save()
+    return config
+
+
+class SimulatorMixin:
+    """测试期间把升级驱动切换为快速的 simulator"""
+
+    driver_options = FAST_SIMULATOR
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(
+            UPGRADE_DRIVER='simulator',
+            UPGRADE_DRIVER_ROUTES={},
+            UPGRADE_DRIVER_OPTIONS=self.driver_options,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_drivers()
+        self.addCleanup(reset_drivers)
+
+
+class RecordingDriver(UpgradeDriver):
+    """记录调用与并发数的测试驱动，fail 中的 NE 返回失败，error 中的 NE 抛出异常"""
+
+    def __init__(self, delay=0.05, fail=(), error=(), **options):
+        super().__init__(**options)
+        self.delay = delay
+        self.fail = set(fail)
+        self.error = set(error)
+        self._lock = threading.Lock()
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    def upgrade(self, upgrade_type, work_type, ne_ip, version_path, callback, token=None, session=None):
+        with self._lock:
+            self.calls.append(ne_ip)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            callback(f"升级 {ne_ip}")
+            if token is not None:
+                token.sleep(self.delay)
+            else:
+                time.sleep(self.delay)
+            callback(f"完成 {ne_ip}")
+            if ne_ip in self.error:
+                raise RuntimeError(f"{ne_ip} unreachable")
+            return ne_ip not in self.fail
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def wait_for_build(build_id, timeout=10):
+    """等待构建离开 pending / in_progress，返回最新的构建记录
+
+    状态更新后工作线程还会写统计、归档日志，同时等待任务释放租约，
+    避免这些写入与测试结束时清空数据库冲突。
+    """
+    deadline = time.monotonic() + timeout
+    build = Build.objects.get(id=build_id)
+    while build.status in ('pending', 'in_progress') and time.monotonic() < deadline:
+        time.sleep(0.05)
+        build = Build.objects.get(id=build_id)
+    while UpgradeJob.objects.filter(build_id=build_id, state='leased').exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return build
+
+
+def stop_shared_executor():
+    """关闭其他测试启动的共享执行器，避免它领取本测试创建的任务；之后 get_executor 会重新创建"""
+    with executor._executor_lock:
+        shared, executor._executor = executor._executor, None
+    if shared is not None:
+        shared.shutdown(wait=True, timeout=10)
+
+
+def wait_until(condition, timeout=5):
+    """轮询直到 condition() 为真，返回最后一次的结果"""
+    deadline = time.monotonic() + timeout
+    result = condition()
+    while not result and time.monotonic() < deadline:
+        time.sleep(0.02)
+        result = condition()
+    return result
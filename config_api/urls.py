@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BuildViewSet, DeviceViewSet, RackViewSet, Build3DPreviewView
+from .views import ConfigViewSet, BuildViewSet, DeviceViewSet, RackViewSet, Build3DPreviewView
 from django.http import JsonResponse
 
 router = DefaultRouter()
+router.register(r'config', ConfigViewSet, basename='config')
 router.register(r'build', BuildViewSet, basename='build')
 router.register(r'devices', DeviceViewSet, basename='device')
 router.register(r'racks', RackViewSet, basename='rack')
@@ -2,25 +2,45 @@ import logging
 import traceback
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action, api_view
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer, TemplateHTMLRenderer
-from .models import Config, Build, BuildLog, Device, Rack, DeviceModel
-from .serializers import ConfigSerializer, BuildSerializer, BuildLogSerializer, DeviceSerializer, RackSerializer
-import sys
+from .models import Config, ConfigRevision, EnvironmentIP, Build, BuildLog, BuildTarget, UpgradeJob, Device, Rack, DeviceModel, split_ips
+from .serializers import ConfigSerializer, BuildSerializer, DeviceSerializer, RackSerializer
+from .executor import get_executor, ExecutorFull, ExecutorShutdown
+from .log_sink import flush_sink, sink_stats
+from .events import publish_build_logs, publish_build_status
+from .cancel import cancel_build, metrics as cancel_metrics
+from .drivers import driver_stats
+from .sessions import get_session_pool
+from .artifacts import get_artifact_cache
+from .stats import query_stats, record_build, record_targets
+from .config_history import RevisionNotFound, diff_states, restore_revision, state_at
+from .config_cache import get_snapshot as get_config_snapshot, config_etag, etag_matches, stats as config_cache_stats
+from .env_io import FORMATS as ENV_IO_FORMATS, EnvImportError, detect_format, export_env_ips, import_env_ips, rewindable
+from .scheduling import parse_fanout, parse_priority, queue_snapshot, running_by_environment, environment_cap
+from .search import search_logs, matching_builds
+from .pagination import (
+    InvalidCursor, parse_int_param, parse_page_size, log_page_size, fetch_log_page, fetch_build_page, fetch_device_page
+)
 import os
 from pathlib import Path
 import uuid
-import threading
 from datetime import datetime
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from django.db import connection
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from PIL import Image
 import numpy as np
 import cv2
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
 # 首先定义 logger
@@ -37,44 +57,36 @@ logger.error("Logger error test from views.py")
 with open('logger_test.log', 'a') as f:
     f.write("Direct file write test\n")
 
-# 然后导入本地升级库
-try:
-    sys.path.append(r'C:\NPTI_CLI\Lib')
-    import ssh_cli
-    logger.info("Successfully imported ssh_cli")
-except Exception as e:
-    logger.error(f"Failed to import ssh_cli: {str(e)}")
-
-# 存储升级任务的状态和日志
-upgrade_tasks = {}
+# 一次反查的 NE 地址上限
+ENV_LOOKUP_MAX_IPS = 1000
 
 class ConfigViewSet(viewsets.ModelViewSet):
-    queryset = Config.objects.all()
+    queryset = Config.objects.prefetch_related('options', 'environments__ips')
     serializer_class = ConfigSerializer
     permission_classes = [AllowAny]  # Allow all users to access, for testing only
     renderer_classes = [JSONRenderer, BrowsableAPIRenderer, TemplateHTMLRenderer]
 
     def list(self, request, *args, **kwargs):
-        logger.info(f"Processing GET request for {self.basename} list")
+        """获取当前配置
+
+        读取进程内配置缓存，通常不查询数据库。响应带 ETag，
+        If-None-Match 与之相同时返回 304。
+        """
         try:
-            configs = self.get_queryset()
-            logger.info(f"Found {configs.count()} configs")
-            if configs.exists():
-                config = configs.first()
-                logger.info(f"Raw config data: {config.__dict__}")
-                serializer = self.get_serializer(config)
-                logger.info(f"Serialized data: {serializer.data}")
-                
+            snapshot = get_config_snapshot()
+            if etag_matches(request.headers.get('If-None-Match'), snapshot.etag):
+                response = HttpResponseNotModified()
+            elif request.accepted_renderer.format == 'html':
                 # 根据请求的格式返回不同的响应
-                if request.accepted_renderer.format == 'html':
-                    return Response(
-                        {'config': serializer.data},
-                        template_name='config_form.html'
-                    )
-                return Response(serializer.data)
+                response = Response(
+                    {'config': snapshot.data},
+                    template_name='config_form.html'
+                )
             else:
-                logger.info("No config found")
-                return Response({})
+                response = Response(snapshot.data)
+            response['ETag'] = snapshot.etag
+            response['Cache-Control'] = 'no-cache'
+            return response
         except Exception as e:
             logger.error(f"Error in list method: {str(e)}")
             logger.error(traceback.format_exc())
@@ -86,9 +98,8 @@ class ConfigViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         logger.info(f"Processing POST request for {self.basename}, received data: {request.data}")
         try:
-            configs = Config.objects.all()
-            if configs.exists():
-                instance = configs.first()
+            instance = Config.objects.order_by('id').first()
+            if instance is not None:
                 serializer = self.get_serializer(instance, data=request.data, partial=True)
             else:
                 serializer = self.get_serializer(data=request.data)
@@ -98,17 +109,208 @@ class ConfigViewSet(viewsets.ModelViewSet):
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
             config = serializer.save()
-            logger.info(f"Saved config: {serializer.data}")
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            logger.info(f"Saved config: id={config.id}, version={config.version}")
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+            response['ETag'] = config_etag(config.id, config.version)
+            return response
         except Exception as e:
             logger.error(f"Error in create method: {str(e)}")
             logger.error(traceback.format_exc())
             return Response({"error": f"An error occurred while creating/updating the configuration: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        logger.info(f"Queryset count: {queryset.count()}")
-        return queryset
+    @action(detail=False, methods=['GET'])
+    def versions(self, request):
+        """获取当前配置的历史版本（新版本在前），before 为上一页最后一个版本号"""
+        try:
+            config = Config.objects.order_by('id').first()
+            if config is None:
+                return Response({'results': [], 'current_version': None, 'next_before': None})
+            limit = parse_page_size(
+                request,
+                getattr(settings, 'CONFIG_REVISION_PAGE_SIZE', 50),
+                getattr(settings, 'CONFIG_REVISION_MAX_PAGE_SIZE', 500)
+            )
+            revisions = ConfigRevision.objects.filter(config=config)
+            before = parse_int_param(request, 'before', 0)
+            if before:
+                revisions = revisions.filter(version__lt=before)
+            rows = list(revisions.order_by('-version').values(
+                'version', 'kind', 'summary', 'message', 'created_at'
+            )[:limit + 1])
+            return Response({
+                'current_version': config.version,
+                'results': rows[:limit],
+                'next_before': rows[limit - 1]['version'] if len(rows) > limit else None,
+            })
+        except Exception as e:
+            logger.error(f"获取配置历史失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['GET'])
+    def diff(self, request):
+        """比较两个配置版本：from 必填，to 默认为当前版本"""
+        try:
+            config = Config.objects.order_by('id').first()
+            if config is None:
+                return Response({'error': 'No config'}, status=status.HTTP_404_NOT_FOUND)
+            from_version = parse_int_param(request, 'from', -1)
+            to_version = parse_int_param(request, 'to', config.version)
+            if from_version < 0:
+                return Response({'error': 'from is required'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                old = state_at(config.id, from_version)
+                new = state_at(config.id, to_version)
+            except RevisionNotFound as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'from': from_version, 'to': to_version, 'changes': diff_states(old, new)})
+        except Exception as e:
+            logger.error(f"比较配置版本失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['POST'])
+    def restore(self, request):
+        """把当前配置恢复成指定版本的内容（保存为一个新版本）"""
+        try:
+            config = Config.objects.order_by('id').first()
+            if config is None:
+                return Response({'error': 'No config'}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                version = int(request.data.get('version'))
+            except (TypeError, ValueError):
+                return Response({'error': 'version must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                restore_revision(config, version)
+            except RevisionNotFound as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+            logger.info(f"配置已恢复到版本 {version}, 新版本 {config.version}")
+            response = Response(self.get_serializer(config).data)
+            response['ETag'] = config_etag(config.id, config.version)
+            return response
+        except Exception as e:
+            logger.error(f"恢复配置版本失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['GET'])
+    def lookup(self, request):
+        """按 NE 地址反查所属环境
+
+        ip 参数可重复或以逗号分隔，返回每个地址的默认归属环境（ne_env）和
+        包含它的全部环境。ip 也可以是 CIDR 或地址范围，此时返回与之重叠的环境。
+        """
+        try:
+            ips = split_ips(','.join(request.query_params.getlist('ip')))
+            if not ips:
+                return Response({'error': 'ip is required'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ips) > ENV_LOOKUP_MAX_IPS:
+                return Response(
+                    {'error': f"At most {ENV_LOOKUP_MAX_IPS} addresses per request"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            owners = EnvironmentIP.lookup(ips)
+            return Response({'results': [
+                {
+                    'ne_ip': ip,
+                    'ne_env': owners[ip][0][1] if ip in owners else None,
+                    'environments': [
+                        {'config_id': config_id, 'ne_env': name} for config_id, name in owners.get(ip, [])
+                    ],
+                }
+                for ip in ips
+            ]})
+        except Exception as e:
+            logger.error(f"反查 NE 所属环境失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_env_ips(self, request):
+        """上传 CSV / JSON Lines 文件批量导入环境 NE 列表
+
+        file 为上传的文件，file_format 默认按文件扩展名判断，mode 为 append（默认）
+        或 replace。有非法记录时返回 400 和出错的行，不写入任何数据；
+        skip_invalid=true 时跳过非法记录。
+        """
+        try:
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+            fmt = request.data.get('file_format') or detect_format(upload.name)
+            if fmt not in ENV_IO_FORMATS:
+                return Response(
+                    {'error': f"file_format must be one of {', '.join(ENV_IO_FORMATS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            mode = request.data.get('mode') or 'append'
+            skip_invalid = str(request.data.get('skip_invalid', '')).lower() in ('1', 'true', 'yes')
+            logger.info(f"开始导入环境 NE 列表: {upload.name}, {upload.size} 字节, format={fmt}, mode={mode}")
+            try:
+                result = import_env_ips(
+                    rewindable(upload), fmt, mode=mode, skip_invalid=skip_invalid,
+                    progress=lambda written, total: logger.info(f"环境 NE 列表导入进度: {written}/{total}")
+                )
+            except EnvImportError as e:
+                return Response(
+                    {'error': str(e), 'errors': [{'line': line_no, 'error': error} for line_no, error in e.errors]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            config = Config.objects.order_by('id').first()
+            response = Response(result)
+            response['ETag'] = config_etag(config.id, config.version)
+            return response
+        except Exception as e:
+            logger.error(f"导入环境 NE 列表失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['GET'], url_path='export')
+    def export_env_ips(self, request):
+        """流式导出环境 NE 列表，file_format 为 csv（默认）或 jsonl，env 可重复指定只导出部分环境
+
+        expand=true 时把 CIDR 和地址范围展开成单个地址。不使用 format 参数，
+        它被 DRF 用来选择响应格式。
+        """
+        try:
+            fmt = request.query_params.get('file_format') or 'csv'
+            if fmt not in ENV_IO_FORMATS:
+                return Response(
+                    {'error': f"file_format must be one of {', '.join(ENV_IO_FORMATS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            chunks = export_env_ips(
+                fmt,
+                environments=request.query_params.getlist('env') or None,
+                expand=request.query_params.get('expand', '').lower() in ('1', 'true', 'yes'),
+                chunk_size=getattr(settings, 'ENV_EXPORT_CHUNK_SIZE', 2000)
+            )
+            content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8'
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="env_ips.{fmt}"'
+            return response
+        except Exception as e:
+            logger.error(f"导出环境 NE 列表失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
     @action(detail=False, methods=['POST'], url_path='upgrade')
     def start_upgrade(self, request):
@@ -131,22 +333,43 @@ class ConfigViewSet(viewsets.ModelViewSet):
             work_type = request.data.get('work_type')
             ne_ip = request.data.get('ne_ip', [])
             version_path = request.data.get('version_path')
+            if isinstance(ne_ip, (list, tuple)):
+                ne_ip = ','.join(ne_ip)
+            try:
+                priority = parse_priority(request.data.get('priority'))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             logger.info(f"Starting upgrade with parameters: {request.data}")
             send_log(f"Starting upgrade with parameters: {request.data}")
-            
-            # 启动升级线程
-            thread = threading.Thread(
-                target=self._run_upgrade,
-                args=(task_id, upgrade_type, work_type, ne_ip, version_path, send_log)
-            )
-            thread.start()
+
+            # 与 BuildViewSet.create 一样记录为构建，由持久化队列执行
+            executor = get_executor()
+            with transaction.atomic():
+                build = Build.objects.create(
+                    upgrade_type=upgrade_type,
+                    work_type=work_type,
+                    ne_ip=ne_ip,
+                    version_path=version_path,
+                    status='pending'
+                )
+                build.create_targets()
+                job = executor.submit(build, task_id=task_id, priority=priority)
             
             return Response({
                 'task_id': task_id,
-                'message': 'Upgrade started'
+                'build_id': build.id,
+                'message': 'Upgrade started',
+                'queue': queue_snapshot(executor.max_workers).get(build.id),
+                'environment': job.environment or None
             })
             
+        except (ExecutorFull, ExecutorShutdown) as e:
+            logger.warning(f"Upgrade rejected: {str(e)}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             logger.error(f"Error starting upgrade: {str(e)}")
             logger.error(traceback.format_exc())
@@ -155,49 +378,24 @@ class ConfigViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def _run_upgrade(self, task_id, upgrade_type, work_type, ne_ip, version_path, send_log):
-        try:
-            send_log("Starting upgrade process...")
-            send_log(f"Upgrade type: {upgrade_type}")
-            send_log(f"Work type: {work_type}")
-            send_log(f"NE IP: {ne_ip}")
-            send_log(f"Version path: {version_path}")
-            
-            # 导入本地升级脚本
-            sys.path.append(r'C:\NPTI_CLI\Lib')
-            import ssh_cli
-            
-            # 执行升级
-            result = ssh_cli.upgrade(
-                upgrade_type=upgrade_type,
-                work_type=work_type,
-                ne_ip=ne_ip,
-                version_path=version_path,
-                callback=send_log
-            )
-            
-            send_log("Upgrade completed successfully" if result else "Upgrade failed")
-            
-        except Exception as e:
-            error_msg = f"Error in upgrade task: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            send_log(error_msg)
-
     @action(detail=True, methods=['GET'])
     def upgrade_status(self, request, pk=None):
         """获取升级任务状态"""
-        task_id = pk
-        if task_id not in upgrade_tasks:
+        job = UpgradeJob.objects.select_related('build').filter(task_id=pk).first()
+        if job is None:
             return Response(
                 {'error': 'Task not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
-            
-        task = upgrade_tasks[task_id]
+
+        build = job.build
+        logs, has_more = fetch_log_page(build.id, 0, log_page_size(request))
         return Response({
-            'status': task['status'],
-            'logs': '\n'.join(task['logs'])
+            'build_id': build.id,
+            'status': build.status,
+            'logs': '\n'.join(log['message'] for log in logs),
+            'has_more': has_more,
+            'queue': queue_snapshot(get_executor().max_workers).get(build.id) if build.status == 'pending' else None
         })
 
 def some_view(request):
@@ -211,6 +409,22 @@ def some_view(request):
         version = cursor.fetchone()[0]
         logger.info(f"SQLite数据库版本: {version}")
 
+def _parse_query_datetime(value, name):
+    """解析日期或日期时间查询参数，只有日期时取当天零点（当前时区）"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            parsed = datetime.combine(day, datetime.min.time())
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class BuildViewSet(viewsets.ModelViewSet):
     queryset = Build.objects.all()
     serializer_class = BuildSerializer
@@ -231,28 +445,48 @@ class BuildViewSet(viewsets.ModelViewSet):
         logger.info("="*50)
         
         try:
-            # 直接创建构建记录
-            build = Build.objects.create(
-                upgrade_type=request.data['upgrade_type'],
-                work_type=request.data['work_type'],
-                ne_ip=request.data['ne_ip'],
-                ne_ip_input=request.data.get('ne_ip_input', ''),
-                version_path=request.data['version_path'],
-                status='in_progress'
-            )
-            logger.info(f"构建记录创建成功: ID={build.id}")
+            try:
+                priority = parse_priority(request.data.get('priority'))
+                fanout = parse_fanout(request.data.get('fanout'))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            executor = get_executor()
+            try:
+                # 构建、NE 子记录和排队任务在同一事务中创建，
+                # 恢复线程不会看到没有任务记录的 pending 构建
+                with transaction.atomic():
+                    build = Build.objects.create(
+                        upgrade_type=request.data['upgrade_type'],
+                        work_type=request.data['work_type'],
+                        ne_ip=request.data['ne_ip'],
+                        ne_ip_input=request.data.get('ne_ip_input', ''),
+                        version_path=request.data['version_path'],
+                        fanout=fanout,
+                        status='pending'
+                    )
+                    logger.info(f"构建记录创建成功: ID={build.id}")
 
-            # 创建初始日志
-            initial_log = BuildLog.objects.create(
-                build=build,
-                message=f"开始升级任务\n"
-                        f"升级类型: {build.upgrade_type}\n"
-                        f"工作类型: {build.work_type}\n"
-                        f"NE IP: {build.ne_ip}\n"
-                        f"版本路径: {build.version_path}",
-                log_type='info'
-            )
-            logger.info(f"初始日志创建成功: ID={initial_log.id}")
+                    # 每个 NE 一条子记录，分别跟踪状态
+                    targets = build.create_targets()
+
+                    # 创建初始日志
+                    initial_log = BuildLog.objects.create(
+                        build=build,
+                        message=f"开始升级任务\n"
+                                f"升级类型: {build.upgrade_type}\n"
+                                f"工作类型: {build.work_type}\n"
+                                f"NE IP: {build.ne_ip}\n"
+                                f"版本路径: {build.version_path}",
+                        log_type='info'
+                    )
+                    logger.info(f"初始日志创建成功: ID={initial_log.id}")
+
+                    # 提交到持久化队列，工作线程全忙或所在环境已满时构建保持 pending 排队
+                    job = executor.submit(build, priority=priority)
+            except (ExecutorFull, ExecutorShutdown) as e:
+                logger.warning(f"升级任务被拒绝: {str(e)}")
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            logger.info(f"升级任务已入队: build_id={build.id}")
 
             # 返回响应
             response_data = {
@@ -263,19 +497,14 @@ class BuildViewSet(viewsets.ModelViewSet):
                 "work_type": build.work_type,
                 "ne_ip": build.ne_ip,
                 "version_path": build.version_path,
+                "targets": [target.ne_ip for target in targets],
+                "environment": job.environment or None,
+                "priority": job.get_priority_display(),
+                "queue": queue_snapshot(executor.max_workers).get(build.id),
                 "created_at": build.created_at.isoformat()
             }
             logger.info(f"准备返回响应: {response_data}")
 
-            # 启动升级线程
-            thread = threading.Thread(
-                target=self._run_upgrade,
-                args=(build.id, build.upgrade_type, build.work_type, 
-                      build.ne_ip, build.version_path)
-            )
-            thread.start()
-            logger.info(f"升级线程已启动: build_id={build.id}")
-
             return Response(response_data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -293,27 +522,58 @@ class BuildViewSet(viewsets.ModelViewSet):
         try:
             try:
                 build = self.get_object()
-            except Build.DoesNotExist:
+            except (Build.DoesNotExist, Http404):
                 logger.error(f"Build {pk} not found")
                 return Response(
                     {'error': f'Build {pk} not found'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # 记录停止日志
-            BuildLog.objects.create(
+            if build.status not in ('pending', 'in_progress'):
+                return Response(
+                    {'error': f'Build {pk} is already {build.status}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # 先写入缓冲中的升级日志，再记录停止日志
+            flush_sink(build.id)
+            stop_log = BuildLog.objects.create(
                 build=build,
                 message="升级任务已手动停止",
                 log_type='warning'
             )
-            
-            # 更新状态
-            build.status = 'stopped'
-            build.save()
-            
+            publish_build_logs(build.id, [stop_log])
+
+            # 更新状态；排队中的任务直接结束，执行中的任务通知工作线程尽快退出
+            with transaction.atomic():
+                stopped = Build.objects.filter(id=build.id, status__in=('pending', 'in_progress')).update(
+                    status='stopped', updated_at=timezone.now()
+                )
+                if stopped:
+                    transaction.on_commit(lambda: record_build(build.id))
+                UpgradeJob.objects.filter(build=build).update(cancel_requested=True)
+                UpgradeJob.objects.filter(build=build, state='queued').update(state='done')
+                # 尚未开始的 NE 在这里结束，由停止请求记入 NE 统计；执行中的 NE 由工作线程结束时统计
+                stopped_targets = list(
+                    BuildTarget.objects.filter(build=build, status='pending').values_list('id', flat=True)
+                )
+                BuildTarget.objects.filter(id__in=stopped_targets, status='pending').update(
+                    status='stopped', finished_at=timezone.now()
+                )
+                if stopped_targets:
+                    transaction.on_commit(lambda: record_targets(build, stopped_targets))
+            publish_build_status(build.id, 'stopped')
+
+            # 执行线程在本进程中时等待它退出，其他进程由心跳线程同步停止请求
+            token = cancel_build(build.id, "升级任务已手动停止")
+            cancel_latency_ms = None
+            if token is not None and token.wait_finished(getattr(settings, 'UPGRADE_STOP_WAIT_SECONDS', 5)):
+                cancel_latency_ms = round(token.latency * 1000, 3)
+
             return Response({
                 'status': 'stopped',
-                'message': '升级任务已停止'
+                'message': '升级任务已停止',
+                'cancel_latency_ms': cancel_latency_ms
             })
             
         except Exception as e:
@@ -330,26 +590,25 @@ class BuildViewSet(viewsets.ModelViewSet):
         try:
             try:
                 build = self.get_object()
-            except Build.DoesNotExist:
+            except (Build.DoesNotExist, Http404):
                 logger.error(f"Build {pk} not found")
                 return Response(
                     {'error': f'Build {pk} not found'}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            last_log_id = int(request.query_params.get('last_log_id', 0))
+            last_log_id = parse_int_param(request, 'last_log_id', 0)
+            limit = log_page_size(request, name='limit')
             
-            # 只获取新的日志
-            logs = build.logs.filter(id__gt=last_log_id).order_by('timestamp')
-            
-            # 序列化日志
-            serializer = BuildLogSerializer(logs, many=True)
+            # 只获取新的日志，按 id 游标分页（包含已压缩归档的部分）
+            logs, has_more = fetch_log_page(build.id, last_log_id, limit)
             
             # 返回日志和状态
             response_data = {
-                'logs': serializer.data,
+                'logs': logs,
                 'status': build.status,
-                'last_log_id': max([log.id for log in logs], default=last_log_id)
+                'last_log_id': logs[-1]['id'] if logs else last_log_id,
+                'has_more': has_more
             }
             
             logger.info(f"返回新日志数量: {len(logs)}")
@@ -361,94 +620,143 @@ class BuildViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def _run_upgrade(self, build_id, upgrade_type, work_type, ne_ip, version_path):
-        """执行升级任务"""
-        build = Build.objects.get(id=build_id)
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        """全文搜索构建日志（包括已归档的日志）
+
+        q 为要查找的文本，可用 build_id 限定构建；按日志倒序分页，cursor 为
+        上一页返回的 next_cursor。第一页同时返回命中的构建列表。
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            logger.info(f"开始执行升级任务 {build_id}")
-            
-            # 记录开始日志
-            BuildLog.objects.create(
-                build=build,
-                message=f"开始升级任务\n"
-                        f"升级类型: {upgrade_type}\n"
-                        f"工作类型: {work_type}\n"
-                        f"NE IP: {ne_ip}\n"
-                        f"版本路径: {version_path}",
-                log_type='info'
+            build_id = request.query_params.get('build_id')
+            build_id = int(build_id) if build_id else None
+        except ValueError:
+            return Response({'error': 'build_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            cursor = parse_int_param(request, 'cursor', 0)
+            results, has_more = search_logs(
+                query,
+                build_id=build_id,
+                before_id=cursor or None,
+                limit=parse_page_size(
+                    request,
+                    getattr(settings, 'BUILD_LOG_SEARCH_PAGE_SIZE', 50),
+                    getattr(settings, 'BUILD_LOG_SEARCH_MAX_PAGE_SIZE', 500)
+                )
+            )
+            data = {
+                'query': query,
+                'results': results,
+                'next_cursor': results[-1]['id'] if has_more else None
+            }
+            if not cursor and build_id is None:
+                data['builds'] = matching_builds(query, getattr(settings, 'BUILD_LOG_SEARCH_MAX_BUILDS', 100))
+            return Response(data)
+        except Exception as e:
+            logger.error(f"搜索构建日志失败: {str(e)}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-            def log_callback(message):
-                """接收升级脚本的日志"""
-                logger.info(f"升级日志 [{build_id}]: {message}")
-                try:
-                    BuildLog.objects.create(
-                        build=build,
-                        message=message,
-                        log_type='info'
-                    )
-                except Exception as e:
-                    logger.error(f"保存日志失败: {str(e)}")
-
-            # 测试日志回调是否工作
-            log_callback("测试日志回调函数")
-
-            # 检查 ssh_cli 模块
-            logger.info(f"ssh_cli module location: {ssh_cli.__file__}")
-            logger.info(f"ssh_cli.upgrade function: {getattr(ssh_cli, 'upgrade', None)}")
+    @action(detail=False, methods=['GET'])
+    def stats(self, request):
+        """构建统计：最近 days 天的成功率、耗时分位数和每日吞吐
 
-            # 执行升级脚本
-            logger.info(f"准备调用升级脚本 {build_id}")
-            logger.info(f"参数: upgrade_type={upgrade_type}, work_type={work_type}, ne_ip={ne_ip}, version_path={version_path}")
-            
-            try:
-                result = ssh_cli.upgrade(
-                    upgrade_type=upgrade_type,
-                    work_type=work_type,
-                    ne_ip=ne_ip,
-                    version_path=version_path,
-                    callback=log_callback
-                )
-                logger.info(f"升级脚本执行完成 {build_id}, result={result}")
-            except Exception as script_error:
-                logger.error(f"升级脚本执行误: {str(script_error)}")
-                logger.error(traceback.format_exc())
-                raise
-
-            # 更新最终状态
-            build.status = 'success' if result else 'failed'
-            build.save()
-            logger.info(f"更新构建状态为: {build.status}")
-
-            BuildLog.objects.create(
-                build=build,
-                message="升级任务完成" if result else "升级任务失败",
-                log_type='success' if result else 'error'
+        可按 upgrade_type、work_type 过滤；指定 ne_ip 时返回该 NE 的统计。
+        """
+        try:
+            days = max(1, min(parse_int_param(request, 'days', 7), getattr(settings, 'BUILD_STATS_MAX_DAYS', 366)))
+            return Response(query_stats(
+                days=days,
+                upgrade_type=request.query_params.get('upgrade_type'),
+                work_type=request.query_params.get('work_type'),
+                ne_ip=request.query_params.get('ne_ip', '')
+            ))
+        except Exception as e:
+            logger.error(f"获取构建统计失败: {str(e)}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['GET'])
+    def queue(self, request):
+        """获取升级队列：按预计执行顺序排列的排队构建及各环境的执行数和上限"""
+        try:
+            executor = get_executor()
+            snapshot = queue_snapshot(executor.max_workers)
+            running = running_by_environment()
+            environments = sorted(set(running) | {entry['environment'] or '' for entry in snapshot.values()})
+            entries = sorted(
+                ({'build_id': build_id, **entry} for build_id, entry in snapshot.items()),
+                key=lambda entry: (entry['position'], entry['expected_start'])
+            )
+            return Response({
+                'running': [entry for entry in entries if entry['position'] == 0],
+                'queued': [entry for entry in entries if entry['position'] > 0],
+                'environments': [
+                    {'environment': env or None, 'running': running.get(env, 0), 'limit': environment_cap(env) or None}
+                    for env in environments
+                ],
+            })
         except Exception as e:
-            logger.error(f"升级任务异常 {build_id}: {str(e)}")
+            logger.error(f"获取升级队列失败: {str(e)}")
             logger.error(traceback.format_exc())
-            BuildLog.objects.create(
-                build=build,
-                message=f"升级失败: {str(e)}",
-                log_type='error'
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            build.status = 'failed'
-            build.save()
+
+    @action(detail=False, methods=['GET'])
+    def runtime(self, request):
+        """获取升级执行器运行状态"""
+        cache = get_artifact_cache()
+        return Response({
+            'executor': get_executor().stats(),
+            'log_sink': sink_stats(),
+            'cancellation': cancel_metrics.snapshot(),
+            'drivers': driver_stats(),
+            'sessions': get_session_pool().stats(),
+            'artifacts': cache.stats() if cache else None,
+            'config_cache': config_cache_stats()
+        })
 
     def list(self, request, *args, **kwargs):
-        """获取构建历史"""
+        """获取构建历史
+
+        按创建时间倒序游标翻页，响应体仍为构建列表，下一页游标放在
+        X-Next-Cursor 和 Link 响应头中。支持的查询参数：status（可逗号分隔）、
+        upgrade_type、work_type、ne_ip、created_after、created_before、
+        page_size、cursor。
+        """
         try:
-            logger.info("正在获取构建历史...")
-            # 获取最近6次构建记录
-            builds = Build.objects.all().order_by('-created_at')[:6]
-            logger.info(f"找到 {builds.count()} 条构建记录")
-            
+            try:
+                queryset = self._filter_builds(request, Build.objects.all())
+                builds, next_cursor = fetch_build_page(
+                    queryset,
+                    request.query_params.get('cursor'),
+                    parse_page_size(
+                        request,
+                        getattr(settings, 'BUILD_HISTORY_PAGE_SIZE', 6),
+                        getattr(settings, 'BUILD_HISTORY_MAX_PAGE_SIZE', 200)
+                    )
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            prefetch_related_objects(builds, 'targets')
+            logger.info(f"获取构建历史: {len(builds)} 条, 还有下一页: {next_cursor is not None}")
+
             serializer = self.get_serializer(builds, many=True)
-            logger.info(f"序列化数据: {serializer.data}")
-            
-            return Response(serializer.data)
+            response = Response(serializer.data)
+            if next_cursor:
+                next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+                response['X-Next-Cursor'] = next_cursor
+                response['Link'] = f'<{next_url}>; rel="next"'
+            return response
         except Exception as e:
             logger.error(f"获取构建历史失败: {str(e)}")
             logger.error(traceback.format_exc())
@@ -457,16 +765,41 @@ class BuildViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _filter_builds(self, request, queryset):
+        """按查询参数过滤构建历史，参数非法时抛出 ValueError"""
+        params = request.query_params
+        statuses = [value for value in params.get('status', '').split(',') if value]
+        if statuses:
+            valid = dict(Build.STATUS_CHOICES)
+            unknown = [value for value in statuses if value not in valid]
+            if unknown:
+                raise ValueError(f"Unknown status: {', '.join(unknown)}")
+            queryset = queryset.filter(status__in=statuses)
+        for field in ('upgrade_type', 'work_type'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        ne_ip = params.get('ne_ip')
+        if ne_ip:
+            # 多 NE 构建按 BuildTarget 匹配，早于 BuildTarget 的单 NE 构建按 ne_ip 匹配
+            queryset = queryset.filter(
+                Q(id__in=BuildTarget.objects.filter(ne_ip=ne_ip).values('build_id')) | Q(ne_ip=ne_ip)
+            )
+        for name, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if params.get(name):
+                queryset = queryset.filter(**{lookup: _parse_query_datetime(params[name], name)})
+        return queryset
+
     @action(detail=True, methods=['GET'])
     def build_logs(self, request, pk=None):
-        """获取指定构建的所有日志"""
+        """分页获取指定构建的日志，cursor 为上一页返回的 next_cursor"""
         try:
             build = self.get_object()
-            logs = build.logs.all().order_by('timestamp')
-            serializer = BuildLogSerializer(logs, many=True)
+            cursor = parse_int_param(request, 'cursor', 0)
+            logs, has_more = fetch_log_page(build.id, cursor, log_page_size(request))
             return Response({
-                'logs': serializer.data,
-                'status': build.status
+                'logs': logs,
+                'status': build.status,
+                'next_cursor': logs[-1]['id'] if has_more else None
             })
         except Exception as e:
             logger.error(f"Error fetching build logs: {str(e)}")
@@ -507,11 +840,37 @@ def check_database(request):
             "error": str(e)
         }, status=500)
 
+# 设备类型没有 3D 模型数据时使用的默认尺寸
+DEFAULT_DEVICE_MODEL = {
+    'width': 1,
+    'height': 2,
+    'depth': 0.5
+}
+
+def device_page_size(request):
+    return parse_page_size(
+        request,
+        getattr(settings, 'DEVICE_PAGE_SIZE', 100),
+        getattr(settings, 'DEVICE_MAX_PAGE_SIZE', 1000)
+    )
+
+def filter_devices(request, queryset):
+    """按 rack（机架编号）、status、type（设备类型名称）过滤设备，参数可重复"""
+    params = request.query_params
+    for param, lookup in (('rack', 'rack_number__in'), ('status', 'status__in'), ('type', 'device_type__name__in')):
+        values = [value for value in params.getlist(param) if value]
+        if values:
+            queryset = queryset.filter(**{lookup: values})
+    return queryset
+
+def device_model_data(device):
+    return device.device_type.model_data or DEFAULT_DEVICE_MODEL
+
 class DeviceViewSet(viewsets.ModelViewSet):
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
     filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'ip_address', 'device_type', 'rack_number']
+    search_fields = ['name', 'ip_address', 'device_type__name', 'rack_number']
 
     @action(detail=False, methods=['POST'])
     def generate_3d_model(self, request):
@@ -547,29 +906,52 @@ class DeviceViewSet(viewsets.ModelViewSet):
             logger.error(f'创建失败: {str(e)}')
             return Response({'error': str(e)}, status=500)
 
+    def get_queryset(self):
+        return Device.objects.select_related('device_type')
+
     def list(self, request, *args, **kwargs):
-        """获取设备列表"""
-        logger.info('获取设备列表')
-        devices = [
-            {
-                'id': 1,
-                'name': 'NPT1800设备',
-                'device_type': 'NPT1800'
-            }
-        ]
-        return Response({'data': devices})
+        """获取设备列表
+
+        按 (机架编号, 机架位置) 排序，游标分页（page_size、cursor），每页一次查询。
+        可按 rack、status、type（设备类型名称）过滤，search 在名称、IP、类型名称和
+        机架编号中搜索。
+        """
+        try:
+            try:
+                devices, next_cursor = fetch_device_page(
+                    self.filter_queryset(filter_devices(request, self.get_queryset())),
+                    request.query_params.get('cursor'),
+                    device_page_size(request)
+                )
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            logger.info(f"获取设备列表: {len(devices)} 台, 还有下一页: {next_cursor is not None}")
+            response = Response({
+                'data': self.get_serializer(devices, many=True).data,
+                'next_cursor': next_cursor,
+            })
+            if next_cursor:
+                next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+                response['X-Next-Cursor'] = next_cursor
+                response['Link'] = f'<{next_url}>; rel="next"'
+            return response
+        except Exception as e:
+            logger.error(f"获取设备列表失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
     @action(detail=True, methods=['GET'])
     def model(self, request, pk=None):
-        """获取设备的3D模型数据"""
+        """获取设备的3D模型数据（来自设备类型）"""
         logger.info(f'获取设备模型: {pk}')
         try:
-            model_data = {
-                'width': 1,
-                'height': 2,
-                'depth': 0.5
-            }
-            return Response({'model_data': model_data})
+            device = self.get_queryset().filter(pk=pk).first()
+            if device is None:
+                return Response({'error': 'Device not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'model_data': device_model_data(device)})
         except Exception as e:
             logger.error(f'获取设备模型失败: {str(e)}')
             return Response({'error': str(e)}, status=500)
@@ -579,9 +961,26 @@ class RackViewSet(viewsets.ModelViewSet):
     serializer_class = RackSerializer
 
     def get_queryset(self):
-        queryset = Rack.objects.all()
-        logger.info(f"查询机架列表，总数：{queryset.count()}")
-        return queryset
+        return Rack.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        """机架列表，每个机架附带设备和占用情况；所有机架的设备只额外查询一次"""
+        try:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            racks = Rack.attach_devices(page if page is not None else queryset)
+            logger.info(f"查询机架列表: {len(racks)} 个")
+            data = self.get_serializer(racks, many=True).data
+            if page is not None:
+                return self.get_paginated_response(data)
+            return Response(data)
+        except Exception as e:
+            logger.error(f"查询机架列表失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
 class Build3DPreviewView(APIView):
     def post(self, request):
@@ -739,27 +1138,30 @@ class Build3DPreviewView(APIView):
 def devices_list(request):
     logger.info('获取设备列表')
     if request.method == 'GET':
-        # 示例数据
-        devices = [
-            {
-                'id': 1,
-                'name': 'NPT1800设备',
-                'device_type': 'NPT1800'
-            }
-        ]
-        return JsonResponse({'data': devices})
+        # 与 DeviceViewSet.list 相同的查询和分页
+        drf_request = Request(request)
+        try:
+            devices, next_cursor = fetch_device_page(
+                filter_devices(drf_request, Device.objects.select_related('device_type')),
+                drf_request.query_params.get('cursor'),
+                device_page_size(drf_request)
+            )
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({
+            'data': DeviceSerializer(devices, many=True).data,
+            'next_cursor': next_cursor,
+        })
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 @csrf_exempt
 def device_model(request, device_id):
     logger.info(f'获取设备模型: {device_id}')
     if request.method == 'GET':
-        model_data = {
-            'width': 1,
-            'height': 2,
-            'depth': 0.5
-        }
-        return JsonResponse({'model_data': model_data})
+        device = Device.objects.select_related('device_type').filter(pk=device_id).first()
+        if device is None:
+            return JsonResponse({'error': 'Device not found'}, status=404)
+        return JsonResponse({'model_data': device_model_data(device)})
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 @csrf_exempt
@@ -9,14 +9,22 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+
+# 先初始化 Django，再导入依赖模型的 websocket 路由
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from config_api.routing import websocket_urlpatterns
+from config_api.executor import get_executor
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
+# 启动升级执行器：恢复上次中断的任务并开始处理持久化队列
+get_executor()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
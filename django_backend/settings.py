@@ -133,6 +133,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',  # 直接指定sqlite3引擎
         'NAME': BASE_DIR / 'db.sqlite3',  # 直接指定数据库文件名
+        # 执行器的工作线程与请求线程并发写库，等待写锁而不是立即报 database is locked
+        'OPTIONS': {'timeout': int(os.getenv('SQLITE_TIMEOUT', 20))},
+        # 测试库使用文件而不是内存库，工作线程才能看到测试中写入的数据
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -292,6 +296,104 @@ CHANNEL_LAYERS = {
     }
 }
 
+# 升级执行器配置：工作线程数、最大排队数、关闭时等待排空的秒数
+UPGRADE_MAX_WORKERS = int(os.getenv('UPGRADE_MAX_WORKERS', 4))
+UPGRADE_MAX_QUEUE = int(os.getenv('UPGRADE_MAX_QUEUE', 100))
+UPGRADE_SHUTDOWN_TIMEOUT = int(os.getenv('UPGRADE_SHUTDOWN_TIMEOUT', 30))
+# 持久化任务队列：租约时长（心跳每 1/3 租约续约一次）、中断后最多重试次数
+UPGRADE_JOB_LEASE_SECONDS = int(os.getenv('UPGRADE_JOB_LEASE_SECONDS', 60))
+UPGRADE_JOB_MAX_ATTEMPTS = int(os.getenv('UPGRADE_JOB_MAX_ATTEMPTS', 2))
+# 心跳线程同步跨进程停止请求的间隔（秒），停止接口等待执行线程退出的最长时间（秒）
+UPGRADE_CANCEL_POLL_SECONDS = float(os.getenv('UPGRADE_CANCEL_POLL_SECONDS', 2))
+UPGRADE_STOP_WAIT_SECONDS = float(os.getenv('UPGRADE_STOP_WAIT_SECONDS', 5))
+# 升级驱动：默认驱动名、按 "upgrade_type/work_type" 的路由（两段都可写 *）、
+# 额外注册的驱动类（驱动名 -> 导入路径）以及传给驱动构造函数的参数
+UPGRADE_DRIVER = os.getenv('UPGRADE_DRIVER', 'ssh_cli')
+UPGRADE_DRIVER_ROUTES = {}
+UPGRADE_DRIVERS = {}
+UPGRADE_SSH_CLI_PATH = os.getenv('UPGRADE_SSH_CLI_PATH', r'C:\NPTI_CLI\Lib')
+UPGRADE_DRIVER_OPTIONS = {
+    'simulator': {
+        'step_latency': float(os.getenv('UPGRADE_SIMULATOR_STEP_LATENCY', 0.2)),
+        'failure_rate': float(os.getenv('UPGRADE_SIMULATOR_FAILURE_RATE', 0.0)),
+        'connect_latency': float(os.getenv('UPGRADE_SIMULATOR_CONNECT_LATENCY', 1.0)),
+    },
+}
+# NE 会话池：每个 NE 最多会话数、空闲关闭秒数、空闲多久后取用前做健康检查、等待空闲会话的最长秒数
+UPGRADE_SESSION_MAX_PER_HOST = int(os.getenv('UPGRADE_SESSION_MAX_PER_HOST', 2))
+UPGRADE_SESSION_IDLE_TIMEOUT = float(os.getenv('UPGRADE_SESSION_IDLE_TIMEOUT', 300))
+UPGRADE_SESSION_HEALTH_INTERVAL = float(os.getenv('UPGRADE_SESSION_HEALTH_INTERVAL', 30))
+UPGRADE_SESSION_ACQUIRE_TIMEOUT = float(os.getenv('UPGRADE_SESSION_ACQUIRE_TIMEOUT', 60))
+# 版本文件本地缓存：是否启用、缓存目录、磁盘预算（字节）
+UPGRADE_ARTIFACT_CACHE_ENABLED = os.getenv('UPGRADE_ARTIFACT_CACHE_ENABLED', 'true').lower() == 'true'
+UPGRADE_ARTIFACT_CACHE_DIR = os.getenv('UPGRADE_ARTIFACT_CACHE_DIR', str(BASE_DIR / 'artifact_cache'))
+UPGRADE_ARTIFACT_CACHE_MAX_BYTES = int(os.getenv('UPGRADE_ARTIFACT_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+# 配置缓存：各进程间同步配置版本的文件、快照最长使用秒数（兜底绕过 ORM 的修改，0 表示不限制）
+CONFIG_CACHE_VERSION_FILE = os.getenv('CONFIG_CACHE_VERSION_FILE', str(BASE_DIR / '.config_version'))
+CONFIG_CACHE_MAX_AGE = float(os.getenv('CONFIG_CACHE_MAX_AGE', 300))
+# 配置历史：每隔多少个版本保存一次完整快照（其余版本只保存增量），版本列表每页条数及上限
+CONFIG_REVISION_SNAPSHOT_EVERY = int(os.getenv('CONFIG_REVISION_SNAPSHOT_EVERY', 20))
+CONFIG_REVISION_PAGE_SIZE = int(os.getenv('CONFIG_REVISION_PAGE_SIZE', 50))
+CONFIG_REVISION_MAX_PAGE_SIZE = int(os.getenv('CONFIG_REVISION_MAX_PAGE_SIZE', 500))
+# 环境 NE 列表导入时每批写入的行数，导出时每次从数据库读取的行数
+ENV_IMPORT_BATCH_SIZE = int(os.getenv('ENV_IMPORT_BATCH_SIZE', 2000))
+ENV_EXPORT_CHUNK_SIZE = int(os.getenv('ENV_EXPORT_CHUNK_SIZE', 2000))
+# 导出时展开 CIDR / 地址范围，超过这么多个地址的地址段（例如 IPv6 /64）按原样导出
+ENV_EXPORT_EXPAND_MAX = int(os.getenv('ENV_EXPORT_EXPAND_MAX', 65536))
+# 按环境（Config.env_ip_map 中的 ne_env）限制同时执行的构建数，例如 {"CES": 1}；
+# 未列出的环境使用默认值，0 表示不限制；NE 不属于任何环境的构建只受 "" 项限制
+UPGRADE_ENV_CONCURRENCY = json.loads(os.getenv('UPGRADE_ENV_CONCURRENCY', '{}'))
+UPGRADE_ENV_DEFAULT_CONCURRENCY = int(os.getenv('UPGRADE_ENV_DEFAULT_CONCURRENCY', 0))
+# 低优先级构建每排队多少秒提升一级，避免被持续提交的高优先级构建饿死（0 表示不提升）
+UPGRADE_PRIORITY_AGING_SECONDS = float(os.getenv('UPGRADE_PRIORITY_AGING_SECONDS', 600))
+# 没有历史统计时估算预计开始时间使用的构建耗时（秒）
+UPGRADE_DEFAULT_BUILD_SECONDS = float(os.getenv('UPGRADE_DEFAULT_BUILD_SECONDS', 600))
+# 单个构建内同时升级的 NE 数（构建可通过 fanout 字段覆盖）
+UPGRADE_FANOUT_WIDTH = int(os.getenv('UPGRADE_FANOUT_WIDTH', 8))
+# 构建 fanout 字段允许的最大值
+UPGRADE_MAX_FANOUT = int(os.getenv('UPGRADE_MAX_FANOUT', 64))
+
+# 构建历史每页条数（默认与前端展示的最近 6 条一致）及上限
+BUILD_HISTORY_PAGE_SIZE = int(os.getenv('BUILD_HISTORY_PAGE_SIZE', 6))
+BUILD_HISTORY_MAX_PAGE_SIZE = int(os.getenv('BUILD_HISTORY_MAX_PAGE_SIZE', 200))
+
+# 设备列表每页条数及上限
+DEVICE_PAGE_SIZE = int(os.getenv('DEVICE_PAGE_SIZE', 100))
+DEVICE_MAX_PAGE_SIZE = int(os.getenv('DEVICE_MAX_PAGE_SIZE', 1000))
+
+# 构建日志全文搜索：每页条数、上限、第一页返回的命中构建数
+BUILD_LOG_SEARCH_PAGE_SIZE = int(os.getenv('BUILD_LOG_SEARCH_PAGE_SIZE', 50))
+BUILD_LOG_SEARCH_MAX_PAGE_SIZE = int(os.getenv('BUILD_LOG_SEARCH_MAX_PAGE_SIZE', 500))
+BUILD_LOG_SEARCH_MAX_BUILDS = int(os.getenv('BUILD_LOG_SEARCH_MAX_BUILDS', 100))
+
+# 构建保留策略：按状态清理超过天数或超出最新条数的构建（不配置的状态不清理），
+# 每个短事务删除的行数、块之间的暂停秒数、进程内定期执行的间隔小时数（0 为不定期执行）
+BUILD_RETENTION_RULES = {
+    'success': {'max_age_days': int(os.getenv('BUILD_RETENTION_SUCCESS_DAYS', 180))},
+    'failed': {'max_age_days': int(os.getenv('BUILD_RETENTION_FAILED_DAYS', 365))},
+    'stopped': {'max_age_days': int(os.getenv('BUILD_RETENTION_STOPPED_DAYS', 90))},
+}
+BUILD_RETENTION_CHUNK_SIZE = int(os.getenv('BUILD_RETENTION_CHUNK_SIZE', 1000))
+BUILD_RETENTION_PAUSE = float(os.getenv('BUILD_RETENTION_PAUSE', 0.05))
+BUILD_RETENTION_INTERVAL_HOURS = float(os.getenv('BUILD_RETENTION_INTERVAL_HOURS', 0))
+
+# 构建统计接口最多查询的天数
+BUILD_STATS_MAX_DAYS = int(os.getenv('BUILD_STATS_MAX_DAYS', 366))
+
+# 升级日志批量写入：每批条数、最长缓冲秒数、单个构建最多积压条数
+BUILD_LOG_BATCH_SIZE = int(os.getenv('BUILD_LOG_BATCH_SIZE', 200))
+BUILD_LOG_FLUSH_INTERVAL = float(os.getenv('BUILD_LOG_FLUSH_INTERVAL', 1.0))
+BUILD_LOG_MAX_BACKLOG = int(os.getenv('BUILD_LOG_MAX_BACKLOG', 10000))
+
+# 构建日志接口分页：默认每页条数与上限
+BUILD_LOG_PAGE_SIZE = int(os.getenv('BUILD_LOG_PAGE_SIZE', 1000))
+BUILD_LOG_MAX_PAGE_SIZE = int(os.getenv('BUILD_LOG_MAX_PAGE_SIZE', 5000))
+
+# 已完成构建的日志压缩归档：构建结束时自动归档、每段行数、zlib 压缩级别
+BUILD_LOG_ARCHIVE_ON_COMPLETE = os.getenv('BUILD_LOG_ARCHIVE_ON_COMPLETE', 'true').lower() == 'true'
+BUILD_LOG_ARCHIVE_CHUNK_SIZE = int(os.getenv('BUILD_LOG_ARCHIVE_CHUNK_SIZE', 1000))
+BUILD_LOG_ARCHIVE_LEVEL = int(os.getenv('BUILD_LOG_ARCHIVE_LEVEL', 6))
+
 # 允许的HTTP方法
 CORS_ALLOW_METHODS = [
     'DELETE',
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_backend.settings')
 
 application = get_wsgi_application()
+
+# 启动升级执行器：恢复上次中断的任务并开始处理持久化队列
+from config_api.executor import get_executor
+get_executor()